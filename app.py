@@ -1,19 +1,228 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, session, make_response, get_flashed_messages, g, has_app_context, has_request_context, before_render_template, template_rendered, send_file, current_app
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timedelta
+from flask_sqlalchemy.session import Session
+import click
+from sqlalchemy import column, event, literal_column, table, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.dml import UpdateBase
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime, time as dt_time, timedelta
+import base64
+import csv
+import heapq
+import io
+import itertools
+import json
+import math
 import os
+import random
+import re
+import sqlite3
+import sys
 import logging
+import threading
+import time
+import zlib
 from werkzeug.exceptions import BadRequest, InternalServerError
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'sua-chave-secreta-aqui'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///biblioteca.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+from werkzeug.local import LocalProxy
+from autocompletar import MAX_ENTRADAS_PADRAO, IndicePrefixos
+from cache import AUSENTE, criar_cache
+from metricas import MetricasRequisicoes
+from tarefas import AgendadorTarefas, FilaTrabalhos
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-db = SQLAlchemy(app)
+# Perfis de ajuste do SQLite, aplicados a cada nova conexão. 'padrao' mantém
+# os valores de fábrica; 'producao' usa WAL para que leitores não esperem
+# pelos escritores e espera até 5s por um lock antes de falhar.
+PERFIS_BANCO = {
+    'padrao': {},
+    'producao': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,       # 64 MiB
+        'mmap_size': 268435456,     # 256 MiB
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def create_app(config=None):
+    """
+    Monta uma aplicação: configuração lida do ambiente (e sobrescrita por
+    `config`), banco, estado do processo, rotas e comandos. `app`, no fim do
+    módulo, é a instância usada pelo gunicorn e pelo `flask --app app`; os
+    testes criam a sua, com outro banco.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'sua-chave-secreta-aqui'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///biblioteca.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['PERFIL_BANCO'] = os.environ.get('PERFIL_BANCO', 'producao')
+
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 60))
+    app.config['CACHE_MAX_ITENS'] = int(os.environ.get('CACHE_MAX_ITENS', 1024))
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+    app.config['INTERVALO_MARCAR_ATRASADOS'] = int(os.environ.get('INTERVALO_MARCAR_ATRASADOS', 300))
+    app.config['AGENDADOR_ATIVO'] = os.environ.get('AGENDADOR_ATIVO', '1') == '1'
+    app.config['LIMITE_REQUISICAO_LENTA_MS'] = float(os.environ.get('LIMITE_REQUISICAO_LENTA_MS', 500))
+    app.config['AUTOCOMPLETAR_MAX_ENTRADAS'] = int(os.environ.get('AUTOCOMPLETAR_MAX_ENTRADAS', MAX_ENTRADAS_PADRAO))
+    app.config['RELATORIOS_WORKERS'] = int(os.environ.get('RELATORIOS_WORKERS', 2))
+    app.config['DIRETORIO_RELATORIOS'] = os.environ.get(
+        'DIRETORIO_RELATORIOS', os.path.join(app.instance_path, 'relatorios'))
+    app.config['INTERVALO_ATUALIZAR_RELATORIOS'] = int(os.environ.get('INTERVALO_ATUALIZAR_RELATORIOS', 300))
+    app.config['RETENCAO_RELATORIOS_DIAS'] = int(os.environ.get('RETENCAO_RELATORIOS_DIAS', 7))
+    app.config['PRAZO_EXECUCAO_RELATORIO'] = int(os.environ.get('PRAZO_EXECUCAO_RELATORIO', 1800))
+    app.config['PRAZO_RETIRADA_RESERVA_DIAS'] = int(os.environ.get('PRAZO_RETIRADA_RESERVA_DIAS', 3))
+    app.config['INTERVALO_EXPIRAR_RESERVAS'] = int(os.environ.get('INTERVALO_EXPIRAR_RESERVAS', 600))
+
+    # Réplica de leitura opcional: outro arquivo SQLite, copiado do primário pela
+    # tarefa 'sincronizar-replica', ou a URI de uma réplica do próprio banco
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    app.config['ATRASO_MAXIMO_REPLICA'] = int(os.environ.get('ATRASO_MAXIMO_REPLICA', 30))
+    app.config['INTERVALO_SINCRONIZAR_REPLICA'] = int(os.environ.get('INTERVALO_SINCRONIZAR_REPLICA', 10))
+
+    app.config.update(config or {})
+    if app.config['PERFIL_BANCO'] not in PERFIS_BANCO:
+        raise ValueError(f"PERFIL_BANCO desconhecido: {app.config['PERFIL_BANCO']!r} "
+                         f"(válidos: {', '.join(PERFIS_BANCO)})")
+
+    # Opções derivadas do banco escolhido (depois de aplicar `config`)
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_pre_ping': True}
+        if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'].update({
+                'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+                'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+                'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+                'pool_recycle': 1800,
+            })
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {'replica': app.config['DATABASE_REPLICA_URL']})
+
+    db.init_app(app)
+    app.extensions['biblioteca'] = {
+        'cache': criar_cache(app.config),
+        'sugestoes': IndicePrefixos(max_entradas=app.config['AUTOCOMPLETAR_MAX_ENTRADAS']),
+        'agendador': AgendadorTarefas(),
+        'fila_relatorios': FilaTrabalhos(app.config['RELATORIOS_WORKERS'], 'relatorio'),
+        'marcador_replica': {'valor': None, 'lido_em': float('-inf')},
+        'leituras_roteadas': defaultdict(int),
+        'preparada': False,
+    }
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', aplicar_pragmas)
+        if 'replica' in db.engines and db.engines['replica'].dialect.name == 'sqlite':
+            event.listen(db.engines['replica'], 'connect', aplicar_pragmas_replica)
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', iniciar_consulta)
+            event.listen(engine, 'after_cursor_execute', concluir_consulta)
+    before_render_template.connect(iniciar_template, app)
+    template_rendered.connect(concluir_template, app)
+
+    biblioteca.aplicar(app)
+    return app
+
+
+def aplicacao_atual():
+    """A aplicação do contexto atual ou, fora de um contexto, a `app` do módulo"""
+    return current_app._get_current_object() if has_app_context() else app
+
+
+def estado_da_aplicacao(nome):
+    """Objeto do estado de processo `nome` (ver create_app) da aplicação atual"""
+    return LocalProxy(lambda: aplicacao_atual().extensions['biblioteca'][nome])
+
+
+class RegistroAdiado:
+    """
+    Guarda as rotas, hooks, tratadores de erro e comandos declarados no
+    módulo e os aplica a cada aplicação criada por create_app. Diferente de
+    um Blueprint, os endpoints mantêm o nome da função (url_for('listar_livros')).
+    """
+
+    def __init__(self):
+        self._registros = []
+        self.cli = AppGroup()
+
+    def _adiar(self, metodo, *args, **kwargs):
+        def decorador(funcao):
+            self._registros.append((metodo, args, kwargs, funcao))
+            return funcao
+        return decorador
+
+    def route(self, regra, **opcoes):
+        return self._adiar('route', regra, **opcoes)
+
+    def errorhandler(self, codigo_ou_excecao):
+        return self._adiar('errorhandler', codigo_ou_excecao)
+
+    def before_request(self, funcao):
+        return self._adiar('before_request')(funcao)
+
+    def after_request(self, funcao):
+        return self._adiar('after_request')(funcao)
+
+    def aplicar(self, app):
+        for metodo, args, kwargs, funcao in self._registros:
+            if args:
+                getattr(app, metodo)(*args, **kwargs)(funcao)
+            else:
+                getattr(app, metodo)(funcao)
+        for comando in self.cli.commands.values():
+            app.cli.add_command(comando)
+
+
+class SessaoRoteada(Session):
+    """
+    Sessão que envia as leituras à réplica quando o contexto marca
+    `g.ler_da_replica` (ver "Réplica de leitura"); flushes e
+    INSERT/UPDATE/DELETE vão sempre ao primário
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and has_app_context() and g.get('ler_da_replica')
+                and not self._flushing and not isinstance(clause, UpdateBase)):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
+biblioteca = RegistroAdiado()
+cache = estado_da_aplicacao('cache')
+sugestoes = estado_da_aplicacao('sugestoes')
+agendador = estado_da_aplicacao('agendador')
+fila_relatorios = estado_da_aplicacao('fila_relatorios')
+metricas = MetricasRequisicoes()
+
+
+def aplicar_pragmas(conexao_dbapi, registro_conexao):
+    """Executa os PRAGMAs do perfil configurado numa conexão SQLite nova"""
+    pragmas = PERFIS_BANCO[current_app.config['PERFIL_BANCO']]
+    cursor = conexao_dbapi.cursor()
+    try:
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
+    finally:
+        cursor.close()
+
+
+def aplicar_pragmas_replica(conexao_dbapi, registro_conexao):
+    """Pragmas do perfil e `query_only`: nada é gravado na réplica por engano"""
+    aplicar_pragmas(conexao_dbapi, registro_conexao)
+    cursor = conexao_dbapi.cursor()
+    try:
+        cursor.execute("PRAGMA query_only = 1")
+    finally:
+        cursor.close()
+
 
 class Livro(db.Model):
     """Modelo para representar um livro na biblioteca"""
@@ -29,6 +238,14 @@ class Livro(db.Model):
     
     emprestimos = db.relationship('Emprestimo', backref='livro', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_livro_categoria_id', 'categoria', 'id'),
+        db.Index('ix_livro_ano_publicacao', 'ano_publicacao'),
+        db.Index('ix_livro_data_cadastro', 'data_cadastro'),
+        db.Index('ix_livro_disponivel', 'id', sqlite_where=db.text('quantidade_disponivel > 0'),
+                 postgresql_where=db.text('quantidade_disponivel > 0')),
+    )
+    
     def __repr__(self):
         return f'<Livro {self.titulo}>'
 
@@ -53,11 +270,899 @@ class Emprestimo(db.Model):
     data_emprestimo = db.Column(db.DateTime, default=datetime.utcnow)
     data_devolucao_prevista = db.Column(db.DateTime, nullable=False)
     data_devolucao_real = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='ativo')  # ativo, devolvido, atrasado
+    status = db.Column(db.String(20), default='ativo')  # ativo, devolvido, atrasado (marcado por marcar_atrasados)
+    
+    __table_args__ = (
+        db.Index('ix_emprestimo_status_prevista', 'status', 'data_devolucao_prevista'),
+        db.Index('ix_emprestimo_status_data', 'status', 'data_emprestimo', 'id'),
+        db.Index('ix_emprestimo_data_id', 'data_emprestimo', 'id'),
+        db.Index('ix_emprestimo_livro_data', 'livro_id', 'data_emprestimo'),
+        db.Index('ix_emprestimo_usuario_status', 'usuario_id', 'status'),
+    )
     
     def __repr__(self):
         return f'<Emprestimo {self.id}>'
 
+class EmprestimosPorLivro(db.Model):
+    """Total acumulado de empréstimos de cada livro (agregado de relatórios)"""
+    __tablename__ = 'emprestimos_por_livro'
+    livro_id = db.Column(db.Integer, db.ForeignKey('livro.id'), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    def __repr__(self):
+        return f'<EmprestimosPorLivro {self.livro_id}={self.total}>'
+
+class EmprestimosPorDia(db.Model):
+    """Total de empréstimos realizados em cada dia (agregado de relatórios)"""
+    __tablename__ = 'emprestimos_por_dia'
+    dia = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<EmprestimosPorDia {self.dia}={self.total}>'
+
+class VersaoSchema(db.Model):
+    """Registro das migrações de schema já aplicadas ao banco"""
+    __tablename__ = 'versao_schema'
+    versao = db.Column(db.Integer, primary_key=True)
+    descricao = db.Column(db.String(200), nullable=False)
+    aplicada_em = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<VersaoSchema {self.versao}>'
+
+class Contador(db.Model):
+    """Contador materializado usado nas estatísticas do painel"""
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Contador {self.nome}={self.valor}>'
+
+class ExecucaoTarefa(db.Model):
+    """Histórico de execuções das tarefas de fundo (agendador ou CLI)"""
+    __tablename__ = 'execucao_tarefa'
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(50), nullable=False)
+    iniciada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    duracao_ms = db.Column(db.Float, nullable=False)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    erro = db.Column(db.String(500))
+    
+    __table_args__ = (
+        db.Index('ix_execucao_tarefa_nome_inicio', 'nome', 'iniciada_em'),
+    )
+    
+    def __repr__(self):
+        return f'<ExecucaoTarefa {self.nome} {self.iniciada_em}>'
+
+class PedidoRelatorio(db.Model):
+    """Relatório gerado em segundo plano; o resultado fica em arquivos CSV/JSON"""
+    __tablename__ = 'pedido_relatorio'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    parametros = db.Column(db.String(500), nullable=False)  # JSON com chaves ordenadas
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime)
+    concluido_em = db.Column(db.DateTime)
+    linhas = db.Column(db.Integer)
+    erro = db.Column(db.String(500))
+    
+    __table_args__ = (
+        db.Index('ix_pedido_relatorio_tipo_parametros', 'tipo', 'parametros', 'status'),
+        # Um único pedido em andamento por relatório, mesmo com vários processos
+        db.Index('uq_pedido_relatorio_em_andamento', 'tipo', 'parametros', unique=True,
+                 sqlite_where=db.text("status IN ('pendente', 'executando')"),
+                 postgresql_where=db.text("status IN ('pendente', 'executando')")),
+    )
+    
+    def __repr__(self):
+        return f'<PedidoRelatorio {self.id} {self.tipo} {self.status}>'
+
+class Reserva(db.Model):
+    """Reserva de um livro sem exemplar, atendida por ordem de senha"""
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    livro_id = db.Column(db.Integer, db.ForeignKey('livro.id'), nullable=False)
+    senha = db.Column(db.Integer, nullable=False)  # sequencial por livro, na ordem de criação
+    status = db.Column(db.String(20), nullable=False, default='aguardando')  # aguardando, disponivel, atendida, expirada, cancelada
+    criada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    disponivel_em = db.Column(db.DateTime)
+    expira_em = db.Column(db.DateTime)
+    encerrada_em = db.Column(db.DateTime)
+    
+    usuario = db.relationship('Usuario')
+    livro = db.relationship('Livro')
+    
+    __table_args__ = (
+        db.UniqueConstraint('livro_id', 'senha', name='uq_reserva_livro_senha'),
+        db.Index('ix_reserva_livro_status_senha', 'livro_id', 'status', 'senha'),
+        db.Index('ix_reserva_usuario_status', 'usuario_id', 'status'),
+        db.Index('ix_reserva_status_expira', 'status', 'expira_em'),
+        # Uma única reserva em aberto por usuário e livro
+        db.Index('uq_reserva_usuario_livro_aberta', 'usuario_id', 'livro_id', unique=True,
+                 sqlite_where=db.text("status IN ('aguardando', 'disponivel')"),
+                 postgresql_where=db.text("status IN ('aguardando', 'disponivel')")),
+    )
+    
+    def __repr__(self):
+        return f'<Reserva {self.id} livro={self.livro_id} senha={self.senha} {self.status}>'
+
+class FilaReserva(db.Model):
+    """Estado da fila de reservas de um livro: senhas emitidas e atendidas"""
+    __tablename__ = 'fila_reserva'
+    livro_id = db.Column(db.Integer, db.ForeignKey('livro.id'), primary_key=True)
+    ultima_senha = db.Column(db.Integer, nullable=False, default=0)
+    senha_atendida = db.Column(db.Integer, nullable=False, default=0)  # última que saiu da frente da fila
+    aguardando = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<FilaReserva {self.livro_id} aguardando={self.aguardando}>'
+
+# Empréstimos ainda não devolvidos ('atrasado' = ativo com prazo vencido)
+STATUS_EM_ABERTO = ('ativo', 'atrasado')
+
+# Índice de busca textual (SQLite FTS5) ---
+# As tabelas virtuais usam o próprio 'livro'/'usuario' como conteúdo externo e
+# são mantidas em sincronia por triggers, então qualquer INSERT/UPDATE/DELETE
+# (ORM ou SQL direto) atualiza o índice na mesma transação.
+INDICES_BUSCA = {
+    'livro_fts': ('livro', ('titulo', 'autor', 'isbn')),
+    'usuario_fts': ('usuario', ('nome', 'email')),
+}
+
+_busca_fts_disponivel = None
+
+
+def ddl_indice_busca(nome_indice):
+    """Gera os comandos DDL da tabela FTS5 e dos triggers de sincronização"""
+    tabela, colunas = INDICES_BUSCA[nome_indice]
+    lista = ', '.join(colunas)
+    novos = ', '.join(f'new.{c}' for c in colunas)
+    antigos = ', '.join(f'old.{c}' for c in colunas)
+    remover = (f"INSERT INTO {nome_indice}({nome_indice}, rowid, {lista}) "
+               f"VALUES ('delete', old.id, {antigos});")
+    inserir = f"INSERT INTO {nome_indice}(rowid, {lista}) VALUES (new.id, {novos});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {nome_indice} USING fts5("
+        f"{lista}, content='{tabela}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {nome_indice}_ai AFTER INSERT ON {tabela} "
+        f"BEGIN {inserir} END",
+        f"CREATE TRIGGER IF NOT EXISTS {nome_indice}_ad AFTER DELETE ON {tabela} "
+        f"BEGIN {remover} END",
+        f"CREATE TRIGGER IF NOT EXISTS {nome_indice}_au AFTER UPDATE OF {lista} ON {tabela} "
+        f"BEGIN {remover} {inserir} END",
+    ]
+
+
+def criar_indice_busca(reconstruir=False):
+    """Cria (e popula, se necessário) os índices FTS5 de livros e usuários"""
+    global _busca_fts_disponivel
+    _busca_fts_disponivel = None
+
+    if db.engine.dialect.name != 'sqlite':
+        logger.info("Banco não é SQLite: busca textual usará LIKE")
+        return False
+
+    try:
+        with db.engine.begin() as conexao:
+            for nome_indice in INDICES_BUSCA:
+                existia = conexao.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :nome"),
+                    {'nome': nome_indice}
+                ).first() is not None
+                for comando in ddl_indice_busca(nome_indice):
+                    conexao.execute(text(comando))
+                if reconstruir or not existia:
+                    conexao.execute(text(
+                        f"INSERT INTO {nome_indice}({nome_indice}) VALUES ('rebuild')"
+                    ))
+                    logger.info(f"Índice de busca {nome_indice} reconstruído")
+        return True
+    except OperationalError as e:
+        logger.error(f"FTS5 indisponível, busca textual usará LIKE: {e}")
+        return False
+
+
+def busca_fts_disponivel():
+    """Indica se os índices FTS5 existem no banco atual (resultado em cache)"""
+    global _busca_fts_disponivel
+    if _busca_fts_disponivel is None:
+        if db.engine.dialect.name != 'sqlite':
+            _busca_fts_disponivel = False
+        else:
+            encontrados = db.session.execute(
+                text("SELECT count(*) FROM sqlite_master "
+                     "WHERE type = 'table' AND name IN ('livro_fts', 'usuario_fts')")
+            ).scalar()
+            _busca_fts_disponivel = encontrados == len(INDICES_BUSCA)
+    return _busca_fts_disponivel
+
+
+def expressao_fts(termo):
+    """
+    Converte o texto digitado numa consulta FTS5: cada palavra vira um prefixo
+    entre aspas (sem operadores do usuário), todas obrigatórias.
+    """
+    palavras = re.findall(r'\w+', termo or '')
+    if not palavras:
+        return None
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def filtrar_por_termo(query, modelo, nome_indice, termo, colunas_like):
+    """
+    Aplica a busca textual à query, ordenando por relevância (bm25) quando o
+    índice FTS5 existe; caso contrário recai no filtro LIKE original.
+    """
+    expressao = expressao_fts(termo)
+    if expressao is None or not busca_fts_disponivel():
+        return query.filter(db.or_(*[coluna.contains(termo) for coluna in colunas_like]))
+
+    indice = table(nome_indice, column('rowid'), column('rank'))
+    return query.join(indice, indice.c.rowid == modelo.id).filter(
+        literal_column(nome_indice).op('MATCH')(expressao)
+    ).order_by(indice.c.rank)
+
+
+def filtrar_livros_por_termo(query, termo):
+    """Busca textual em título, autor e ISBN"""
+    return filtrar_por_termo(query, Livro, 'livro_fts', termo,
+                             [Livro.titulo, Livro.autor, Livro.isbn])
+
+
+def filtrar_usuarios_por_termo(query, termo):
+    """Busca textual em nome e email"""
+    return filtrar_por_termo(query, Usuario, 'usuario_fts', termo,
+                             [Usuario.nome, Usuario.email])
+
+def contar_emprestimos_ativos(usuario_ids):
+    """
+    Conta empréstimos ativos por usuário numa única consulta agrupada,
+    evitando carregar `usuario.emprestimos` linha a linha no template.
+    """
+    usuario_ids = list(usuario_ids)
+    if not usuario_ids:
+        return {}
+    linhas = db.session.query(
+        Emprestimo.usuario_id,
+        db.func.count(Emprestimo.id)
+    ).filter(
+        Emprestimo.status.in_(STATUS_EM_ABERTO),
+        Emprestimo.usuario_id.in_(usuario_ids)
+    ).group_by(Emprestimo.usuario_id).all()
+    return dict(linhas)
+
+
+# Instrumentação de desempenho ---
+# Os hooks de requisição e os eventos de cursor do SQLAlchemy acumulam, em `g`,
+# o número de consultas, o tempo em SQL, o tempo de templates e as consultas
+# mais lentas da requisição; ao final tudo vai para `metricas` (exposto em
+# /metrics) e requisições acima de LIMITE_REQUISICAO_LENTA_MS são registradas
+# no log. Em respostas em streaming, a latência não inclui o envio do corpo.
+CONSULTAS_LENTAS_POR_REQUISICAO = 3
+
+
+def instrumentando():
+    return has_request_context() and 'inicio_requisicao' in g
+
+
+def iniciar_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('inicios_consulta', []).append(time.perf_counter())
+
+
+def concluir_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get('inicios_consulta')
+    if not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    if not instrumentando():
+        return
+    g.consultas += 1
+    g.tempo_sql += duracao
+    item = (duracao, statement)
+    if len(g.consultas_lentas) < CONSULTAS_LENTAS_POR_REQUISICAO:
+        heapq.heappush(g.consultas_lentas, item)
+    elif item > g.consultas_lentas[0]:
+        heapq.heapreplace(g.consultas_lentas, item)
+
+
+def iniciar_template(remetente, template, context, **extra):
+    if instrumentando():
+        g.inicio_template = time.perf_counter()
+
+
+def concluir_template(remetente, template, context, **extra):
+    if instrumentando() and 'inicio_template' in g:
+        g.tempo_template += time.perf_counter() - g.pop('inicio_template')
+
+
+@biblioteca.before_request
+def iniciar_instrumentacao():
+    g.inicio_requisicao = time.perf_counter()
+    g.consultas = 0
+    g.tempo_sql = 0.0
+    g.tempo_template = 0.0
+    g.consultas_lentas = []
+
+
+@biblioteca.after_request
+def registrar_instrumentacao(resposta):
+    if 'inicio_requisicao' not in g:
+        return resposta
+    duracao = time.perf_counter() - g.pop('inicio_requisicao')
+    endpoint = request.endpoint or 'nao_encontrado'
+    metricas.registrar(
+        endpoint, request.method, resposta.status_code, duracao,
+        consultas=g.consultas, sql_total=g.tempo_sql,
+        template_total=g.tempo_template, consultas_lentas=g.consultas_lentas
+    )
+    
+    if duracao * 1000 >= current_app.config['LIMITE_REQUISICAO_LENTA_MS']:
+        mais_lenta = ''
+        if g.consultas_lentas:
+            tempo, sql = max(g.consultas_lentas)
+            mais_lenta = f"; consulta mais lenta {tempo * 1000:.1f} ms: {' '.join(sql.split())[:200]}"
+        logger.warning(
+            f"Requisição lenta: {request.method} {request.full_path.rstrip('?')} "
+            f"({endpoint}) {duracao * 1000:.1f} ms, {g.consultas} consulta(s), "
+            f"SQL {g.tempo_sql * 1000:.1f} ms, template {g.tempo_template * 1000:.1f} ms{mais_lenta}"
+        )
+    return resposta
+
+
+# Cache de páginas, listas e contagens ---
+# As páginas de leitura mais acessadas ficam em cache por conjunto de
+# parâmetros, com tags das tabelas de que dependem; cada rota de escrita
+# invalida só as tags que alterou. O TTL limita a defasagem dos dados que
+# mudam com o relógio (empréstimos atrasados).
+TAG_LIVROS = 'livros'
+TAG_USUARIOS = 'usuarios'
+TAG_EMPRESTIMOS = 'emprestimos'
+TAG_RELATORIOS = 'relatorios'
+TAG_RESERVAS = 'reservas'
+
+
+def invalidar_cache(*tags):
+    """Descarta as entradas de cache associadas às tags informadas"""
+    cache.invalidar(*tags)
+
+
+def pagina_em_cache(*tags):
+    """
+    Guarda a resposta 200 de uma rota GET, por caminho e query string. Não usa
+    o cache quando há mensagens flash pendentes, já que elas são renderizadas
+    dentro da página, nem quando a rota marca `g.pagina_provisoria` (conteúdo
+    que será substituído em instantes). As respostas levam ETag e
+    Last-Modified, e requisições condicionais (If-None-Match/If-Modified-Since)
+    recebem 304.
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return funcao(*args, **kwargs)
+            
+            chave = ('pagina', request.path, tuple(sorted(request.args.items(multi=True)))) \
+                + origem_da_leitura()
+            guardada = cache.obter(chave)
+            if guardada is not AUSENTE:
+                corpo, tipo_conteudo, gerada_em = guardada
+                resposta = Response(corpo, mimetype=tipo_conteudo)
+                return responder_condicional(resposta, gerada_em)
+            
+            resposta = make_response(funcao(*args, **kwargs))
+            if resposta.status_code == 200 and not resposta.is_streamed \
+                    and not get_flashed_messages() and not g.get('pagina_provisoria'):
+                gerada_em = datetime.utcnow().replace(microsecond=0)
+                cache.guardar(chave, (resposta.get_data(), resposta.mimetype, gerada_em),
+                              ttl=ttl_da_leitura(), tags=tags)
+                return responder_condicional(resposta, gerada_em)
+            return resposta
+        return envoltorio
+    return decorador
+
+
+def responder_condicional(resposta, gerada_em):
+    """Adiciona ETag/Last-Modified e converte em 304 se o cliente já tem a versão"""
+    resposta.add_etag()
+    resposta.last_modified = gerada_em
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta.make_conditional(request)
+
+
+def listar_categorias():
+    """Categorias distintas do acervo (em cache até um livro ser alterado)"""
+    return cache.obter_ou_calcular(
+        ('categorias',),
+        lambda: [cat[0] for cat in db.session.query(Livro.categoria).distinct().order_by(Livro.categoria)],
+        tags=(TAG_LIVROS,)
+    )
+
+
+# Réplica de leitura ---
+# Com DATABASE_REPLICA_URL, as rotas de leitura pesadas (@leitura_na_replica)
+# e a geração de relatórios consultam a réplica; as escritas e as demais rotas
+# usam o primário. A tarefa 'sincronizar-replica' grava no primário o instante
+# da sincronização (contador 'replica_sincronizada_em', em segundos) e, com
+# dois arquivos SQLite, copia o primário para a réplica pela API de backup;
+# numa réplica do próprio banco, o contador chega pela replicação. A réplica só
+# é usada se esse instante tiver menos de ATRASO_MAXIMO_REPLICA segundos e não
+# for anterior à última escrita do usuário (guardada na sessão após cada POST),
+# que assim sempre lê o que acabou de gravar. Páginas e contagens lidas da
+# réplica ficam em cache em chaves próprias, pelo que resta do atraso máximo.
+CONTADOR_REPLICA = 'replica_sincronizada_em'
+INTERVALO_LER_MARCADOR_REPLICA = 1.0
+# Por aplicação: último marcador lido da réplica e decisões de roteamento
+marcador_replica = estado_da_aplicacao('marcador_replica')
+leituras_roteadas = estado_da_aplicacao('leituras_roteadas')
+
+
+def sincronizacao_replica():
+    """Instante (epoch, s) até o qual a réplica tem os dados do primário; None se desconhecido"""
+    agora = time.monotonic()
+    if agora - marcador_replica['lido_em'] >= INTERVALO_LER_MARCADOR_REPLICA:
+        try:
+            with db.engines['replica'].connect() as conexao:
+                valor = conexao.execute(
+                    db.select(Contador.valor).where(Contador.nome == CONTADOR_REPLICA)
+                ).scalar()
+        except OperationalError as e:
+            if marcador_replica['valor'] is not None:
+                logger.warning(f"Réplica indisponível, leituras voltam ao primário: {e}")
+            valor = None
+        marcador_replica.update(valor=valor, lido_em=agora)
+    return marcador_replica['valor']
+
+
+def escolher_replica(escrita_em=None):
+    """
+    Indica se as leituras podem ir à réplica: ela está configurada, atrasada
+    menos de ATRASO_MAXIMO_REPLICA segundos e já contém a escrita feita em
+    `escrita_em` (epoch, ms)
+    """
+    if not current_app.config['DATABASE_REPLICA_URL']:
+        return False
+    sincronizada = sincronizacao_replica()
+    if sincronizada is None:
+        motivo = 'indisponivel'
+    elif time.time() - sincronizada > current_app.config['ATRASO_MAXIMO_REPLICA']:
+        motivo = 'atrasada'
+    elif escrita_em is not None and sincronizada * 1000 < escrita_em:
+        motivo = 'escrita_recente'
+    else:
+        motivo = 'replica'
+    leituras_roteadas[motivo] += 1
+    return motivo == 'replica'
+
+
+def origem_da_leitura():
+    """Sufixo das chaves de cache: dados da réplica não servem a quem lê do primário"""
+    return ('replica',) if g.get('ler_da_replica') else ()
+
+
+def ttl_da_leitura():
+    """TTL de cache dos dados lidos agora: o padrão, ou o que resta do atraso máximo da réplica"""
+    if not g.get('ler_da_replica'):
+        return None
+    sincronizada = marcador_replica['valor'] or 0
+    restante = current_app.config['ATRASO_MAXIMO_REPLICA'] - (time.time() - sincronizada)
+    return max(1, min(current_app.config['CACHE_TTL'], int(restante)))
+
+
+def leitura_na_replica(funcao):
+    """
+    Marca uma rota GET somente leitura para consultar a réplica quando
+    escolher_replica permitir. A marca vale até o fim da requisição, inclusive
+    para respostas em streaming.
+    """
+    @wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.ler_da_replica = escolher_replica(session.get('escrita_em'))
+        return funcao(*args, **kwargs)
+    return envoltorio
+
+
+@contextmanager
+def lendo_da_replica():
+    """Direciona à réplica, se utilizável, as leituras do bloco (fora das rotas)"""
+    anterior = g.get('ler_da_replica', False)
+    g.ler_da_replica = escolher_replica()
+    try:
+        yield g.ler_da_replica
+    finally:
+        g.ler_da_replica = anterior
+
+
+@biblioteca.after_request
+def registrar_escrita_na_sessao(resposta):
+    """Após um POST, as leituras do usuário ficam no primário até a réplica alcançá-lo"""
+    if current_app.config['DATABASE_REPLICA_URL'] and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        session['escrita_em'] = int(time.time() * 1000)
+    return resposta
+
+
+def arquivo_sqlite(engine):
+    """Caminho do arquivo de um engine SQLite, ou None (outro banco ou em memória)"""
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return None
+    return engine.url.database
+
+
+def sincronizar_replica():
+    """
+    Grava o instante da sincronização no primário e, se primário e réplica são
+    arquivos SQLite, copia o primário inteiro para a réplica (a cópia parte de
+    um estado posterior ao instante gravado). Devolve as páginas copiadas.
+    """
+    gravar_contador(CONTADOR_REPLICA, int(time.time()))
+    db.session.commit()
+    
+    origem, destino = arquivo_sqlite(db.engine), arquivo_sqlite(db.engines['replica'])
+    if origem is None or destino is None:
+        return 0
+    paginas = []
+    conexao_origem = db.engine.raw_connection()
+    try:
+        conexao_destino = sqlite3.connect(destino, timeout=30)
+        try:
+            conexao_origem.driver_connection.backup(
+                conexao_destino, progress=lambda status, restantes, total: paginas.append(total))
+        finally:
+            conexao_destino.close()
+    finally:
+        conexao_origem.close()
+    marcador_replica['lido_em'] = float('-inf')
+    return paginas[-1] if paginas else 0
+# O índice de prefixos (autocompletar.py) é carregado do banco em segundo
+# plano quando o processo atende a primeira requisição (ver "Inicialização do
+# processo") e recebe os livros/usuários novos pelas rotas de cadastro e pela
+# importação; /api/v1/autocompletar não consulta o banco.
+TIPOS_AUTOCOMPLETAR = {
+    'livros': ('titulo', 'autor', 'isbn'),
+    'usuarios': ('usuario', 'email'),
+    'todos': ('titulo', 'autor', 'isbn', 'usuario', 'email'),
+}
+TAMANHO_BLOCO_AUTOCOMPLETAR = 10000
+# Acima disso uma importação recarrega o índice inteiro em vez de intercalar
+LIMITE_INDEXACAO_INCREMENTAL = 5000
+
+
+def entradas_livro(id_, titulo, autor, isbn):
+    return [('titulo', titulo, id_), ('autor', autor, None), ('isbn', isbn, id_)]
+
+
+def entradas_usuario(id_, nome, email):
+    return [('usuario', nome, id_), ('email', email, id_)]
+
+
+def carregar_autocompletar():
+    """
+    Reconstrói o índice de sugestões a partir de usuario e livro. Os usuários
+    entram primeiro: se o acervo estourar AUTOCOMPLETAR_MAX_ENTRADAS, o que
+    fica de fora são livros, não as pessoas buscadas nos formulários
+    """
+    def entradas():
+        usuarios = db.session.query(Usuario.id, Usuario.nome, Usuario.email)
+        for linha in usuarios.yield_per(TAMANHO_BLOCO_AUTOCOMPLETAR):
+            yield from entradas_usuario(*linha)
+        livros = db.session.query(Livro.id, Livro.titulo, Livro.autor, Livro.isbn)
+        for linha in livros.yield_per(TAMANHO_BLOCO_AUTOCOMPLETAR):
+            yield from entradas_livro(*linha)
+
+    inicio = time.perf_counter()
+    novo = IndicePrefixos(max_entradas=sugestoes.max_entradas, max_varredura=sugestoes.max_varredura)
+    novo.adicionar_varios(entradas())
+    sugestoes.absorver(novo)
+    logger.info(f"Índice de autocompletar carregado: {len(sugestoes)} entrada(s) "
+                f"em {time.perf_counter() - inicio:.2f}s")
+    if sugestoes.descartadas:
+        logger.warning(f"Autocompletar cheio: {sugestoes.descartadas} entrada(s) descartada(s); "
+                       f"aumente AUTOCOMPLETAR_MAX_ENTRADAS ({sugestoes.max_entradas})")
+
+
+# Opções do formulário de empréstimo ---
+# /emprestimos/novo não lista todos os usuários e livros: os campos consultam
+# /api/v1/emprestimos/opcoes, que busca no índice de autocompletar e devolve
+# no máximo LIMITE_OPCOES_EMPRESTIMO opções. O estoque dos livros sugeridos é
+# sempre conferido no banco (pelo índice parcial ix_livro_disponivel), nunca
+# num estado do processo; quando as sugestões do índice não trazem livros com
+# exemplar suficientes, a busca FTS completa as opções entre os disponíveis.
+LIMITE_OPCOES_EMPRESTIMO = 20
+# Sugestões do índice conferidas no banco antes de recorrer à busca FTS
+CANDIDATOS_OPCOES_LIVROS = 200
+
+
+def ids_com_exemplar(ids):
+    """Dos `ids`, os de livros com exemplar disponível"""
+    if not ids:
+        return set()
+    return set(db.session.execute(
+        db.select(Livro.id).where(Livro.id.in_(ids), Livro.quantidade_disponivel > 0)
+    ).scalars())
+
+
+def ids_com_exemplar_por_termo(termo, excluir, limite):
+    """
+    Ids de livros com exemplar cujo título ou ISBN casa com `termo`, fora de
+    `excluir`. A consulta FTS conduz a busca e cada livro casado é conferido
+    pela chave primária, então o custo acompanha o número de títulos casados.
+    """
+    query = db.session.query(Livro.id).filter(Livro.quantidade_disponivel > 0)
+    if excluir:
+        query = query.filter(Livro.id.notin_(excluir))
+    expressao = expressao_fts(termo)
+    if expressao is not None and busca_fts_disponivel():
+        indice = table('livro_fts', column('rowid'))
+        query = query.join(indice, indice.c.rowid == Livro.id).filter(
+            literal_column('livro_fts').op('MATCH')(f'{{titulo isbn}} : ({expressao})')
+        )
+    else:
+        query = query.filter(db.or_(Livro.titulo.contains(termo), Livro.isbn.contains(termo)))
+    return [id_ for id_, in query.limit(limite)]
+
+
+def ids_sugeridos(termo, tipos, limite, aceitar=None):
+    """Ids distintos das sugestões do autocompletar, na ordem do índice"""
+    vistos = set()
+    
+    def aceitar_novo(id_):
+        if id_ in vistos or (aceitar is not None and not aceitar(id_)):
+            return False
+        vistos.add(id_)
+        return True
+    
+    return [sugestao['id'] for sugestao in sugestoes.buscar(termo, tipos, limite, aceitar_novo)]
+
+
+def opcoes_usuarios_por_id(ids):
+    """Opções {id, rotulo} dos usuários, na ordem de `ids`"""
+    usuarios = {id_: (nome, email) for id_, nome, email in
+                db.session.query(Usuario.id, Usuario.nome, Usuario.email).filter(Usuario.id.in_(ids))}
+    return [{'id': id_, 'rotulo': f'{usuarios[id_][0]} ({usuarios[id_][1]})'}
+            for id_ in ids if id_ in usuarios]
+
+
+def opcoes_livros_por_id(ids, somente_disponiveis=True):
+    """
+    Opções {id, rotulo, disponiveis} dos livros (por padrão só os com
+    exemplar), na ordem de `ids`
+    """
+    livros = {linha[0]: linha for linha in db.session.query(
+        Livro.id, Livro.titulo, Livro.autor, Livro.quantidade_disponivel
+    ).filter(Livro.id.in_(ids))}
+    opcoes = []
+    for id_ in ids:
+        if id_ not in livros or (somente_disponiveis and livros[id_][3] <= 0):
+            continue
+        _, titulo, autor, disponiveis = livros[id_]
+        if disponiveis > 0:
+            estoque = f"{disponiveis} {'disponíveis' if disponiveis > 1 else 'disponível'}"
+        else:
+            estoque = 'sem exemplar'
+        opcoes.append({'id': id_, 'rotulo': f'{titulo} - {autor} ({estoque})',
+                       'disponiveis': disponiveis})
+    return opcoes
+
+
+def opcoes_usuarios(termo, limite=LIMITE_OPCOES_EMPRESTIMO):
+    """Usuários cujo nome ou e-mail começa com `termo` (ou com esse id)"""
+    ids = ids_sugeridos(termo, TIPOS_AUTOCOMPLETAR['usuarios'], limite)
+    if termo.isdigit() and len(termo) < 10 and int(termo) not in ids:
+        ids = [int(termo)] + ids[:limite - 1]
+    return opcoes_usuarios_por_id(ids)
+
+
+def opcoes_livros(termo, limite=LIMITE_OPCOES_EMPRESTIMO):
+    """Livros disponíveis cujo título ou ISBN começa com `termo` (ou com esse id)"""
+    candidatos = ids_sugeridos(termo, ('titulo', 'isbn'), CANDIDATOS_OPCOES_LIVROS)
+    if eh_id_livro(termo) and int(termo) not in candidatos:
+        candidatos = [int(termo)] + candidatos
+    com_exemplar = ids_com_exemplar(candidatos)
+    ids = [id_ for id_ in candidatos if id_ in com_exemplar][:limite]
+    if len(ids) < limite:
+        ids += ids_com_exemplar_por_termo(termo, ids, limite - len(ids))
+    return opcoes_livros_por_id(ids)
+
+
+def opcoes_acervo(termo, limite=LIMITE_OPCOES_EMPRESTIMO):
+    """Livros (com ou sem exemplar) cujo título ou ISBN começa com `termo`, para reservas"""
+    ids = ids_sugeridos(termo, ('titulo', 'isbn'), limite)
+    if eh_id_livro(termo) and int(termo) not in ids:
+        ids = [int(termo)] + ids[:limite - 1]
+    return opcoes_livros_por_id(ids, somente_disponiveis=False)
+
+
+# Paginação por cursor (keyset) e contagens em cache ---
+ITENS_POR_PAGINA = 10
+
+
+def contar_em_cache(chave, consulta):
+    """
+    Devolve uma contagem em cache; `chave[0]` é a tag da tabela contada.
+    `consulta` é chamada apenas quando a chave não existe ou expirou.
+    """
+    return cache.obter_ou_calcular(('contagem',) + chave + origem_da_leitura(), consulta,
+                                   ttl=ttl_da_leitura(), tags=(chave[0],))
+
+
+def codificar_cursor(valores):
+    """Serializa os valores da chave de ordenação num token opaco para URL"""
+    serializaveis = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    bruto = json.dumps(serializaveis, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(token, colunas):
+    """Converte o token de volta nos valores da chave (None se inválido)"""
+    if not token:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        valores = json.loads(bruto)
+        if len(valores) != len(colunas):
+            return None
+        return [
+            datetime.fromisoformat(valor) if coluna.type.python_type is datetime else int(valor)
+            for coluna, valor in zip(colunas, valores)
+        ]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+class PaginaCursor:
+    """Página de resultados com links de navegação por cursor"""
+
+    def __init__(self, itens, numero, total, por_pagina,
+                 args_anterior=None, args_proxima=None):
+        self.itens = itens
+        self.numero = numero
+        self.total = total
+        self.por_pagina = por_pagina
+        self.args_anterior = args_anterior
+        self.args_proxima = args_proxima
+
+    @property
+    def paginas(self):
+        return max(1, math.ceil(self.total / self.por_pagina))
+
+    @property
+    def tem_anterior(self):
+        return self.args_anterior is not None
+
+    @property
+    def tem_proxima(self):
+        return self.args_proxima is not None
+
+
+def paginar_por_cursor(query, colunas, total, por_pagina=ITENS_POR_PAGINA,
+                       descendente=False):
+    """
+    Pagina `query` buscando a partir da última chave vista (`apos`) ou antes
+    da primeira (`antes`), lidos de request.args. A consulta sempre usa
+    `WHERE chave > cursor ORDER BY chave LIMIT n+1`, que segue o índice sem
+    OFFSET nem COUNT; `total` vem de uma contagem em cache.
+    """
+    numero = max(request.args.get('pagina', 1, type=int), 1)
+    apos = decodificar_cursor(request.args.get('apos'), colunas)
+    antes = None if apos else decodificar_cursor(request.args.get('antes'), colunas)
+
+    chave = db.tuple_(*colunas) if len(colunas) > 1 else colunas[0]
+    voltando = antes is not None
+    crescente = descendente == voltando
+
+    if apos is not None:
+        cursor = apos if len(colunas) > 1 else apos[0]
+        query = query.filter(chave < cursor if descendente else chave > cursor)
+    elif voltando:
+        cursor = antes if len(colunas) > 1 else antes[0]
+        query = query.filter(chave > cursor if descendente else chave < cursor)
+    else:
+        numero = 1
+
+    ordem = [coluna.asc() if crescente else coluna.desc() for coluna in colunas]
+    itens = query.order_by(*ordem).limit(por_pagina + 1).all()
+    ha_mais = len(itens) > por_pagina
+    itens = itens[:por_pagina]
+    if voltando:
+        itens.reverse()
+
+    def chave_de(item):
+        return codificar_cursor([getattr(item, coluna.key) for coluna in colunas])
+
+    args_anterior = args_proxima = None
+    if itens:
+        if (voltando and ha_mais) or (apos is not None):
+            args_anterior = {'antes': chave_de(itens[0]), 'pagina': max(numero - 1, 1)}
+        if voltando or ha_mais:
+            args_proxima = {'apos': chave_de(itens[-1]), 'pagina': numero + 1}
+    return PaginaCursor(itens, numero, total, por_pagina, args_anterior, args_proxima)
+
+
+def paginar_por_deslocamento(query, total, por_pagina=ITENS_POR_PAGINA):
+    """
+    Paginação para resultados ordenados por relevância, onde não há chave
+    estável: usa LIMIT n+1 para saber se existe próxima página, sem COUNT.
+    """
+    numero = max(request.args.get('pagina', 1, type=int), 1)
+    itens = query.offset((numero - 1) * por_pagina).limit(por_pagina + 1).all()
+    ha_mais = len(itens) > por_pagina
+    return PaginaCursor(
+        itens[:por_pagina], numero, total, por_pagina,
+        args_anterior={'pagina': numero - 1} if numero > 1 else None,
+        args_proxima={'pagina': numero + 1} if ha_mais else None
+    )
+
+
+def estatisticas_emprestimos(status):
+    """Totais exibidos em /emprestimos, a partir de contagens em cache"""
+    def contar_por_status():
+        return dict(db.session.query(
+            Emprestimo.status, db.func.count(Emprestimo.id)
+        ).group_by(Emprestimo.status).all())
+
+    por_status = contar_em_cache(('emprestimos', 'por_status'), contar_por_status)
+    if status != 'todos':
+        por_status = {status: por_status.get(status, 0)}
+
+    return {
+        'ativos': sum(por_status.get(situacao, 0) for situacao in STATUS_EM_ABERTO),
+        'devolvidos': por_status.get('devolvido', 0),
+        'atrasados': por_status.get('atrasado', 0),
+        'total': sum(por_status.values())
+    }
+
+# Consultas compartilhadas entre as páginas HTML e a API JSON ---
+def consulta_livros(termo='', categoria='', ano_min=None, ano_max=None):
+    """Livros filtrados como na busca avançada (ordem por relevância se houver termo)"""
+    query = Livro.query
+    if categoria:
+        query = query.filter(Livro.categoria == categoria)
+    if ano_min is not None:
+        query = query.filter(Livro.ano_publicacao >= ano_min)
+    if ano_max is not None:
+        query = query.filter(Livro.ano_publicacao <= ano_max)
+    if termo:
+        query = filtrar_livros_por_termo(query, termo)
+    return query
+
+
+def consulta_usuarios(termo=''):
+    """Usuários, opcionalmente filtrados por nome/email"""
+    query = Usuario.query
+    if termo:
+        query = filtrar_usuarios_por_termo(query, termo)
+    return query
+
+
+def consulta_emprestimos(status='todos', usuario_id=None, livro_id=None):
+    """Empréstimos com usuário e livro carregados na mesma consulta"""
+    query = Emprestimo.query.options(
+        joinedload(Emprestimo.usuario),
+        joinedload(Emprestimo.livro)
+    )
+    if status != 'todos':
+        query = query.filter_by(status=status)
+    if usuario_id is not None:
+        query = query.filter(Emprestimo.usuario_id == usuario_id)
+    if livro_id is not None:
+        query = query.filter(Emprestimo.livro_id == livro_id)
+    return query
+
+
+def paginar_livros(termo='', categoria='', ano_min=None, ano_max=None,
+                   por_pagina=ITENS_POR_PAGINA):
+    """Página de livros: por relevância com termo, por cursor (id) sem termo"""
+    query = consulta_livros(termo, categoria, ano_min, ano_max)
+    total = contar_em_cache(('livros', termo, categoria, ano_min, ano_max), query.count)
+    if termo:
+        return paginar_por_deslocamento(query, total, por_pagina)
+    return paginar_por_cursor(query, [Livro.id], total, por_pagina)
+
 def validar_dados_livro(titulo, autor, isbn, ano, categoria):
     """
     Validação de dados para demonstrar CONFIABILIDADE
@@ -67,48 +1172,1723 @@ def validar_dados_livro(titulo, autor, isbn, ano, categoria):
     if not titulo or len(titulo.strip()) < 2:
         erros.append("Título deve ter pelo menos 2 caracteres")
     
-    if not autor or len(autor.strip()) < 2:
-        erros.append("Autor deve ter pelo menos 2 caracteres")
+    if not autor or len(autor.strip()) < 2:
+        erros.append("Autor deve ter pelo menos 2 caracteres")
+    
+    if not isbn or len(isbn.strip()) < 10:
+        erros.append("ISBN deve ter pelo menos 10 caracteres")
+    
+    try:
+        ano_int = int(ano)
+        if ano_int < 1000 or ano_int > datetime.now().year:
+            erros.append("Ano de publicação inválido")
+    except (ValueError, TypeError):
+        erros.append("Ano deve ser um número válido")
+    
+    if not categoria or len(categoria.strip()) < 2:
+        erros.append("Categoria deve ter pelo menos 2 caracteres")
+    
+    return erros
+
+# Estatísticas materializadas ---
+# Os totais do painel ficam na tabela 'contador' e são ajustados pelas rotas de
+# escrita na mesma transação. 'emprestimos_ativos' conta todos os empréstimos
+# em aberto; 'emprestimos_atrasados' é ajustado pela tarefa marcar_atrasados e
+# pelas devoluções de empréstimos já marcados como atrasados.
+CONTADORES = ('total_livros', 'total_usuarios', 'emprestimos_ativos', 'emprestimos_atrasados')
+
+
+def contar_atrasados():
+    """COUNT dos empréstimos com status 'atrasado'"""
+    return Emprestimo.query.filter_by(status='atrasado').count()
+
+
+def incrementar_contador(nome, delta=1):
+    """Soma `delta` ao contador dentro da transação corrente (sem commit)"""
+    db.session.execute(
+        db.update(Contador)
+        .where(Contador.nome == nome)
+        .values(valor=Contador.valor + delta)
+    )
+
+
+def gravar_contador(nome, valor):
+    """Grava o valor absoluto do contador na sessão corrente (sem commit)"""
+    db.session.merge(Contador(nome=nome, valor=valor, atualizado_em=datetime.utcnow()))
+
+
+def reconstruir_contadores():
+    """Recalcula todos os contadores a partir das tabelas (sem commit)"""
+    valores = {
+        'total_livros': Livro.query.count(),
+        'total_usuarios': Usuario.query.count(),
+        'emprestimos_ativos': Emprestimo.query.filter(Emprestimo.status.in_(STATUS_EM_ABERTO)).count(),
+        'emprestimos_atrasados': contar_atrasados()
+    }
+    for nome, valor in valores.items():
+        gravar_contador(nome, valor)
+    return valores
+
+
+def calcular_estatisticas():
+    """
+    Cálculo de estatísticas para demonstrar EFICIÊNCIA
+    """
+    try:
+        contadores = {c.nome: c for c in Contador.query.all()}
+        
+        if any(nome not in contadores for nome in CONTADORES):
+            valores = reconstruir_contadores()
+            db.session.commit()
+            return valores
+        
+        return {nome: contadores[nome].valor for nome in CONTADORES}
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao calcular estatísticas: {e}")
+        return None
+    
+# Agregados de relatórios ---
+# 'emprestimos_por_livro' e 'emprestimos_por_dia' são incrementados a cada
+# empréstimo criado; /relatorios lê essas tabelas em vez de agrupar todo o
+# histórico. As funções *_ao_vivo guardam as consultas originais e servem de
+# referência para `flask verificar-relatorios`.
+JANELA_RELATORIO_MENSAL = 180
+
+
+def somar_agregado(modelo, coluna_chave, valor_chave, delta=1):
+    """UPDATE do total do agregado, com INSERT se a linha ainda não existe"""
+    resultado = db.session.execute(
+        db.update(modelo)
+        .where(coluna_chave == valor_chave)
+        .values(total=modelo.total + delta)
+    )
+    if resultado.rowcount == 0:
+        db.session.add(modelo(**{coluna_chave.key: valor_chave, 'total': delta}))
+
+
+def registrar_emprestimo_nos_agregados(livro_id, data_emprestimo):
+    """Atualiza os agregados na transação corrente (sem commit)"""
+    somar_agregado(EmprestimosPorLivro, EmprestimosPorLivro.livro_id, livro_id)
+    somar_agregado(EmprestimosPorDia, EmprestimosPorDia.dia, data_emprestimo.date())
+
+
+def reconstruir_agregados():
+    """Refaz os agregados a partir de todo o histórico (sem commit)"""
+    EmprestimosPorLivro.query.delete()
+    EmprestimosPorDia.query.delete()
+    
+    db.session.execute(
+        db.insert(EmprestimosPorLivro).from_select(
+            ['livro_id', 'total'],
+            db.select(Emprestimo.livro_id, db.func.count(Emprestimo.id))
+            .group_by(Emprestimo.livro_id)
+        )
+    )
+    
+    por_dia = defaultdict(int)
+    for (data_emprestimo,) in db.session.query(Emprestimo.data_emprestimo).yield_per(10000):
+        if data_emprestimo is not None:
+            por_dia[data_emprestimo.date()] += 1
+    db.session.add_all(EmprestimosPorDia(dia=dia, total=total) for dia, total in por_dia.items())
+    
+    return {'livros': EmprestimosPorLivro.query.count(), 'dias': len(por_dia)}
+
+
+def formatar_livros_populares(linhas):
+    return [
+        {
+            'titulo': row.titulo,
+            'autor': row.autor,
+            'total_emprestimos': row.total_emprestimos,
+            'disponivel': (row.quantidade_disponivel or 0) > 0,
+        }
+        for row in linhas
+    ]
+
+
+def livros_populares_ao_vivo(limite=10):
+    """Ranking calculado sobre toda a tabela de empréstimos"""
+    total = db.func.count(Emprestimo.id)
+    linhas = db.session.query(
+        Livro.titulo,
+        Livro.autor,
+        Livro.quantidade_disponivel,
+        total.label('total_emprestimos')
+    ).join(Emprestimo).group_by(Livro.id).order_by(
+        total.desc(), Livro.id
+    ).limit(limite).all()
+    return formatar_livros_populares(linhas)
+
+
+def livros_populares_agregados(limite=10):
+    """Ranking lido do agregado por livro (índice em total)"""
+    linhas = db.session.query(
+        Livro.titulo,
+        Livro.autor,
+        Livro.quantidade_disponivel,
+        EmprestimosPorLivro.total.label('total_emprestimos')
+    ).join(EmprestimosPorLivro, EmprestimosPorLivro.livro_id == Livro.id).filter(
+        EmprestimosPorLivro.total > 0
+    ).order_by(
+        EmprestimosPorLivro.total.desc(), Livro.id
+    ).limit(limite).all()
+    return formatar_livros_populares(linhas)
+
+
+def emprestimos_mensais_ao_vivo(desde):
+    """Empréstimos por mês desde `desde`, agrupando a tabela de empréstimos"""
+    linhas = db.session.query(
+        db.func.strftime('%Y-%m', Emprestimo.data_emprestimo).label('mes'),
+        db.func.count(Emprestimo.id).label('total')
+    ).filter(
+        Emprestimo.data_emprestimo >= desde
+    ).group_by('mes').order_by('mes').all()
+    return [{'mes': row.mes, 'total': row.total} for row in linhas]
+
+
+def emprestimos_mensais_agregados(desde):
+    """
+    Empréstimos por mês desde `desde` a partir do agregado diário. Só o dia
+    de corte é contado na tabela de empréstimos (faixa de no máximo 24h),
+    para que o resultado seja idêntico à consulta ao vivo.
+    """
+    totais = defaultdict(int)
+    
+    dia_seguinte = datetime.combine(desde.date() + timedelta(days=1), dt_time.min)
+    parcial = Emprestimo.query.filter(
+        Emprestimo.data_emprestimo >= desde,
+        Emprestimo.data_emprestimo < dia_seguinte
+    ).count()
+    if parcial:
+        totais[desde.strftime('%Y-%m')] += parcial
+    
+    for agregado in EmprestimosPorDia.query.filter(EmprestimosPorDia.dia > desde.date()):
+        totais[agregado.dia.strftime('%Y-%m')] += agregado.total
+    
+    return [{'mes': mes, 'total': total} for mes, total in sorted(totais.items()) if total]
+
+# Escritas concorrentes de empréstimos ---
+# Retirada e devolução alteram o estoque com um único UPDATE condicional
+# (a condição faz o papel da verificação em Python), dentro de uma transação
+# curta que é repetida se o SQLite responder 'database is locked'.
+TENTATIVAS_ESCRITA = 5
+ESPERA_INICIAL_ESCRITA = 0.02
+
+
+def banco_ocupado(erro):
+    """Indica se o OperationalError é de bloqueio (SQLITE_BUSY/LOCKED)"""
+    mensagem = str(getattr(erro, 'orig', erro)).lower()
+    return 'locked' in mensagem or 'busy' in mensagem
+
+
+def executar_com_retentativa(operacao, tentativas=TENTATIVAS_ESCRITA):
+    """
+    Executa `operacao` (que termina com commit), desfazendo e repetindo com
+    espera exponencial quando o banco está ocupado por outro escritor.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return operacao()
+        except OperationalError as e:
+            db.session.rollback()
+            if not banco_ocupado(e) or tentativa == tentativas:
+                raise
+            espera = ESPERA_INICIAL_ESCRITA * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"Banco ocupado, nova tentativa {tentativa + 1} em {espera:.3f}s")
+            time.sleep(espera)
+
+
+def reservar_exemplar(livro_id):
+    """Decrementa o estoque se houver exemplar; retorna False caso contrário"""
+    resultado = db.session.execute(
+        db.update(Livro)
+        .where(Livro.id == livro_id, Livro.quantidade_disponivel > 0)
+        .values(quantidade_disponivel=Livro.quantidade_disponivel - 1)
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount == 1
+
+
+def liberar_exemplar(livro_id, quantidade=1):
+    """Incrementa o estoque do livro na transação corrente"""
+    db.session.execute(
+        db.update(Livro)
+        .where(Livro.id == livro_id)
+        .values(quantidade_disponivel=Livro.quantidade_disponivel + quantidade)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def registrar_emprestimo(usuario_id, livro_id, dias_emprestimo):
+    """
+    Cria o empréstimo numa transação curta: reserva atômica do exemplar (ou
+    o exemplar separado para a reserva do usuário), INSERT, contadores e
+    agregados. Retorna None se não havia exemplar.
+    """
+    data_emprestimo = datetime.utcnow()
+    if not retirar_reservas(usuario_id, [livro_id]) and not reservar_exemplar(livro_id):
+        db.session.rollback()
+        return None
+    
+    emprestimo = Emprestimo(
+        usuario_id=usuario_id,
+        livro_id=livro_id,
+        data_emprestimo=data_emprestimo,
+        data_devolucao_prevista=data_emprestimo + timedelta(days=dias_emprestimo)
+    )
+    db.session.add(emprestimo)
+    incrementar_contador('emprestimos_ativos')
+    registrar_emprestimo_nos_agregados(livro_id, data_emprestimo)
+    db.session.commit()
+    return emprestimo
+
+
+def registrar_devolucao(emprestimo):
+    """
+    Marca o empréstimo como devolvido só se ainda estiver em aberto (UPDATE
+    condicional) e passa o exemplar à fila de reservas ou ao estoque. Retorna
+    False se outra requisição já o devolveu.
+    
+    O status gravado decide se o total de atrasados diminui: o primeiro
+    UPDATE só casa com 'atrasado', o segundo com 'ativo', então uma marcação
+    concorrente de marcar_atrasados não é contada duas vezes.
+    """
+    for status_anterior in ('atrasado', 'ativo'):
+        resultado = db.session.execute(
+            db.update(Emprestimo)
+            .where(Emprestimo.id == emprestimo.id, Emprestimo.status == status_anterior)
+            .values(status='devolvido', data_devolucao_real=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount == 1:
+            break
+    else:
+        db.session.rollback()
+        return False
+    
+    devolver_exemplares(emprestimo.livro_id)
+    incrementar_contador('emprestimos_ativos', -1)
+    if status_anterior == 'atrasado':
+        incrementar_contador('emprestimos_atrasados', -1)
+    
+    db.session.commit()
+    return True
+
+
+# Empréstimos e devoluções em lote ---
+# No balcão, vários livros de um mesmo usuário são emprestados ou devolvidos
+# numa única transação (um commit): os livros e os empréstimos em aberto são
+# carregados numa consulta e o estoque é alterado por UPDATEs condicionais
+# sobre o lote inteiro (com RETURNING, quando o banco suporta). Itens sem
+# exemplar, inexistentes ou já devolvidos falham individualmente, sem
+# desfazer os demais.
+MAXIMO_ITENS_LOTE = 50
+MAXIMO_DIAS_EMPRESTIMO = 90
+
+
+def atualizar_condicionalmente(modelo, ids, condicao, valores):
+    """
+    UPDATE de `valores` nas linhas de `ids` que satisfazem `condicao`;
+    retorna o conjunto de ids alterados.
+    """
+    if db.engine.dialect.update_returning:
+        resultado = db.session.execute(
+            db.update(modelo)
+            .where(modelo.id.in_(ids), condicao)
+            .values(valores)
+            .returning(modelo.id)
+            .execution_options(synchronize_session=False)
+        )
+        return {id_ for (id_,) in resultado}
+    
+    alterados = set()
+    for id_ in ids:
+        resultado = db.session.execute(
+            db.update(modelo)
+            .where(modelo.id == id_, condicao)
+            .values(valores)
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount == 1:
+            alterados.add(id_)
+    return alterados
+
+
+def registrar_emprestimos_em_lote(usuario_id, livro_ids, dias_emprestimo):
+    """
+    Versão em lote de registrar_emprestimo para livros distintos. Retorna
+    {livro_id: emprestimo_id} dos empréstimos criados.
+    """
+    data_emprestimo = datetime.utcnow()
+    reservados = retirar_reservas(usuario_id, livro_ids)
+    livres = [livro_id for livro_id in livro_ids if livro_id not in reservados]
+    if livres:
+        reservados |= atualizar_condicionalmente(
+            Livro, livres, Livro.quantidade_disponivel > 0,
+            {'quantidade_disponivel': Livro.quantidade_disponivel - 1}
+        )
+    if not reservados:
+        db.session.rollback()
+        return {}
+    
+    emprestimos = [
+        Emprestimo(
+            usuario_id=usuario_id,
+            livro_id=livro_id,
+            data_emprestimo=data_emprestimo,
+            data_devolucao_prevista=data_emprestimo + timedelta(days=dias_emprestimo)
+        )
+        for livro_id in livro_ids if livro_id in reservados
+    ]
+    db.session.add_all(emprestimos)
+    incrementar_contador('emprestimos_ativos', len(emprestimos))
+    for emprestimo in emprestimos:
+        somar_agregado(EmprestimosPorLivro, EmprestimosPorLivro.livro_id, emprestimo.livro_id)
+    somar_agregado(EmprestimosPorDia, EmprestimosPorDia.dia, data_emprestimo.date(), len(emprestimos))
+    db.session.flush()
+    criados = {emprestimo.livro_id: emprestimo.id for emprestimo in emprestimos}
+    db.session.commit()
+    return criados
+
+
+def registrar_devolucoes_em_lote(pares):
+    """
+    Versão em lote de registrar_devolucao. `pares` são (emprestimo_id,
+    livro_id); retorna os ids devolvidos, sem os que outra requisição
+    devolveu antes.
+    """
+    agora = datetime.utcnow()
+    status_anteriores = {}
+    for status_anterior in ('atrasado', 'ativo'):
+        pendentes = [id_ for id_, _ in pares if id_ not in status_anteriores]
+        if not pendentes:
+            break
+        alterados = atualizar_condicionalmente(
+            Emprestimo, pendentes, Emprestimo.status == status_anterior,
+            {'status': 'devolvido', 'data_devolucao_real': agora}
+        )
+        status_anteriores.update(dict.fromkeys(alterados, status_anterior))
+    if not status_anteriores:
+        db.session.rollback()
+        return set()
+    
+    por_livro = defaultdict(int)
+    for emprestimo_id, livro_id in pares:
+        if emprestimo_id in status_anteriores:
+            por_livro[livro_id] += 1
+    for livro_id, quantidade in por_livro.items():
+        devolver_exemplares(livro_id, quantidade)
+    incrementar_contador('emprestimos_ativos', -len(status_anteriores))
+    atrasados = sum(1 for status in status_anteriores.values() if status == 'atrasado')
+    if atrasados:
+        incrementar_contador('emprestimos_atrasados', -atrasados)
+    
+    db.session.commit()
+    return set(status_anteriores)
+
+
+def ler_itens_lote(valores):
+    """Identificadores de livro não vazios; BadRequest se o lote é vazio ou grande demais"""
+    itens = [str(valor).strip() for valor in valores if str(valor).strip()]
+    if not itens:
+        raise BadRequest('Informe ao menos um livro')
+    if len(itens) > MAXIMO_ITENS_LOTE:
+        raise BadRequest(f'No máximo {MAXIMO_ITENS_LOTE} livros por lote')
+    return itens
+
+
+def ler_dias_emprestimo(valor):
+    """Prazo em dias (14 se não informado); BadRequest fora de 1..MAXIMO_DIAS_EMPRESTIMO"""
+    try:
+        dias_emprestimo = int(14 if valor in (None, '') else valor)
+    except (TypeError, ValueError):
+        dias_emprestimo = 0
+    if not 1 <= dias_emprestimo <= MAXIMO_DIAS_EMPRESTIMO:
+        raise BadRequest(f"'dias_emprestimo' deve estar entre 1 e {MAXIMO_DIAS_EMPRESTIMO}")
+    return dias_emprestimo
+
+
+def eh_id_livro(identificador):
+    """Números curtos são ids; os demais identificadores são ISBNs"""
+    return identificador.isdigit() and len(identificador) < 10
+
+
+def resolver_livros(identificadores):
+    """Carrega numa consulta os livros pedidos por id ou ISBN: {identificador: Livro}"""
+    ids = {int(item) for item in identificadores if eh_id_livro(item)}
+    isbns = {item for item in identificadores if not eh_id_livro(item)}
+    condicoes = []
+    if ids:
+        condicoes.append(Livro.id.in_(ids))
+    if isbns:
+        condicoes.append(Livro.isbn.in_(isbns))
+    livros = Livro.query.filter(db.or_(*condicoes)).all()
+    por_id = {livro.id: livro for livro in livros}
+    por_isbn = {livro.isbn: livro for livro in livros}
+    return {
+        item: por_id.get(int(item)) if eh_id_livro(item) else por_isbn.get(item)
+        for item in identificadores
+    }
+
+
+def iniciar_resultados_lote(usuario_id, identificadores):
+    """
+    Valida o usuário e monta um resultado por item pedido, já marcando os
+    livros inexistentes; retorna (resultados, {identificador: Livro}).
+    """
+    if db.session.get(Usuario, usuario_id) is None:
+        raise BadRequest('Usuário não encontrado')
+    livros = resolver_livros(identificadores)
+    resultados = []
+    for item in identificadores:
+        livro = livros[item]
+        resultado = {'livro': item, 'livro_id': livro and livro.id,
+                     'titulo': livro and livro.titulo, 'ok': False}
+        if livro is None:
+            resultado['erro'] = 'Livro não encontrado'
+        resultados.append(resultado)
+    return resultados, livros
+
+
+def emprestar_em_lote(usuario_id, identificadores, dias_emprestimo=14):
+    """
+    Empresta os livros (ids ou ISBNs) ao usuário numa transação e retorna um
+    resultado por item, na ordem pedida
+    """
+    resultados, _ = iniciar_resultados_lote(usuario_id, identificadores)
+    livro_ids = []
+    for resultado in resultados:
+        if 'erro' in resultado:
+            continue
+        if resultado['livro_id'] in livro_ids:
+            resultado['erro'] = 'Livro repetido no lote'
+        else:
+            livro_ids.append(resultado['livro_id'])
+    
+    criados = executar_com_retentativa(
+        lambda: registrar_emprestimos_em_lote(usuario_id, livro_ids, dias_emprestimo)
+    ) if livro_ids else {}
+    for resultado in resultados:
+        if 'erro' in resultado:
+            continue
+        if resultado['livro_id'] in criados:
+            resultado.update(ok=True, emprestimo_id=criados[resultado['livro_id']])
+        else:
+            resultado['erro'] = 'Livro não disponível para empréstimo'
+    
+    if criados:
+        invalidar_cache(TAG_EMPRESTIMOS, TAG_LIVROS, TAG_RESERVAS)
+    logger.info(f"Empréstimo em lote: {len(criados)} de {len(resultados)} livro(s) "
+                f"para o usuário {usuario_id}")
+    return resultados
+
+
+def devolver_em_lote(usuario_id, identificadores):
+    """
+    Devolve os livros (ids ou ISBNs) emprestados ao usuário numa transação;
+    cada item devolve o empréstimo em aberto mais antigo daquele livro
+    """
+    resultados, livros = iniciar_resultados_lote(usuario_id, identificadores)
+    livro_ids = {livro.id for livro in livros.values() if livro}
+    em_aberto = defaultdict(list)
+    for emprestimo_id, livro_id in db.session.query(Emprestimo.id, Emprestimo.livro_id).filter(
+        Emprestimo.usuario_id == usuario_id,
+        Emprestimo.livro_id.in_(livro_ids),
+        Emprestimo.status.in_(STATUS_EM_ABERTO)
+    ).order_by(Emprestimo.data_emprestimo, Emprestimo.id):
+        em_aberto[livro_id].append(emprestimo_id)
+    
+    pares = []
+    for resultado in resultados:
+        if 'erro' in resultado:
+            continue
+        if not em_aberto[resultado['livro_id']]:
+            resultado['erro'] = 'Nenhum empréstimo em aberto deste livro para o usuário'
+            continue
+        resultado['emprestimo_id'] = em_aberto[resultado['livro_id']].pop(0)
+        pares.append((resultado['emprestimo_id'], resultado['livro_id']))
+    
+    devolvidos = executar_com_retentativa(lambda: registrar_devolucoes_em_lote(pares)) if pares else set()
+    for resultado in resultados:
+        if 'emprestimo_id' not in resultado:
+            continue
+        if resultado['emprestimo_id'] in devolvidos:
+            resultado['ok'] = True
+        else:
+            resultado['erro'] = 'Empréstimo já foi devolvido'
+    
+    if devolvidos:
+        invalidar_cache(TAG_EMPRESTIMOS, TAG_LIVROS, TAG_RESERVAS)
+    logger.info(f"Devolução em lote: {len(devolvidos)} de {len(resultados)} livro(s) "
+                f"do usuário {usuario_id}")
+    return resultados
+
+
+# Fila de reservas ---
+# Um livro sem exemplar pode ser reservado. A reserva recebe a próxima senha
+# da fila do livro ('fila_reserva' guarda, por livro, a última senha emitida,
+# a da última reserva que saiu da frente da fila e quantas aguardam). Na
+# devolução, o exemplar vai para a reserva mais antiga na mesma transação
+# (uma busca no índice (livro_id, status, senha)) e fica separado por
+# PRAZO_RETIRADA_RESERVA_DIAS; sem fila, volta ao estoque. O empréstimo ao
+# dono da reserva usa o exemplar separado. A reserva só é aceita sem exemplar
+# livre, conferido na mesma transação de escrita do INSERT; o índice único
+# parcial uq_reserva_usuario_livro_aberta impede duas reservas em aberto do
+# mesmo usuário para o mesmo livro. A tarefa 'expirar-reservas' encerra as
+# reservas não retiradas no prazo e repassa o exemplar. A posição na fila é a
+# diferença entre senhas, menos as desistências no meio da fila (contadas no
+# mesmo índice, numa consulta para a página toda), sem percorrer quem está à
+# frente.
+STATUS_RESERVA_ABERTA = ('aguardando', 'disponivel')
+TAMANHO_LOTE_RESERVAS = 200
+
+
+def validar_reserva(usuario_id, livro_id):
+    """
+    Mensagem de erro se o usuário não pode reservar o livro, ou None. Lê o
+    estoque do banco (não de um Livro já carregado na sessão).
+    """
+    if db.session.query(Usuario.id).filter_by(id=usuario_id).first() is None:
+        return 'Usuário não encontrado'
+    estoque = db.session.query(Livro.quantidade_disponivel).filter_by(id=livro_id).first()
+    if estoque is None:
+        return 'Livro não encontrado'
+    if estoque[0] > 0:
+        return 'Livro disponível: faça o empréstimo diretamente'
+    if db.session.query(Reserva.id).filter(
+        Reserva.usuario_id == usuario_id,
+        Reserva.livro_id == livro_id,
+        Reserva.status.in_(STATUS_RESERVA_ABERTA)
+    ).first():
+        return 'Usuário já tem uma reserva deste livro'
+    return None
+
+
+def registrar_reserva(usuario_id, livro_id):
+    """
+    Coloca o usuário no fim da fila do livro, com a próxima senha. O UPDATE
+    da fila vem antes de validar_reserva, então a conferência do estoque e o
+    INSERT ficam na mesma transação de escrita, sem uma devolução no meio; se
+    ainda assim houver exemplar livre (bancos que não serializam as
+    escritas), ele é separado para a fila como numa devolução.
+    Retorna (reserva, None) ou (None, mensagem de erro).
+    """
+    resultado = db.session.execute(
+        db.update(FilaReserva)
+        .where(FilaReserva.livro_id == livro_id)
+        .values(ultima_senha=FilaReserva.ultima_senha + 1, aguardando=FilaReserva.aguardando + 1)
+        .execution_options(synchronize_session=False)
+    )
+    erro = validar_reserva(usuario_id, livro_id)
+    if erro:
+        db.session.rollback()
+        return None, erro
+    if resultado.rowcount == 0:
+        db.session.add(FilaReserva(livro_id=livro_id, ultima_senha=1, aguardando=1))
+        senha = 1
+    else:
+        senha = db.session.query(FilaReserva.ultima_senha).filter_by(livro_id=livro_id).scalar()
+    
+    reserva = Reserva(usuario_id=usuario_id, livro_id=livro_id, senha=senha)
+    db.session.add(reserva)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Reserva (ou fila) criada por outra requisição ao mesmo tempo
+        db.session.rollback()
+        return None, validar_reserva(usuario_id, livro_id) or 'Reserva simultânea; tente novamente'
+    if reservar_exemplar(livro_id) and not alocar_reservas(livro_id):
+        liberar_exemplar(livro_id)
+    db.session.commit()
+    return reserva, None
+
+
+def alocar_reservas(livro_id, quantidade=1):
+    """
+    Separa até `quantidade` exemplares para as reservas mais antigas do livro
+    (sem commit); retorna quantos foram separados
+    """
+    aguardando = db.session.query(FilaReserva.aguardando).filter_by(livro_id=livro_id).scalar()
+    if not aguardando:
+        return 0
+    
+    primeiras = db.session.query(Reserva.id, Reserva.senha).filter(
+        Reserva.livro_id == livro_id,
+        Reserva.status == 'aguardando'
+    ).order_by(Reserva.senha).limit(quantidade).all()
+    agora = datetime.utcnow()
+    separadas = atualizar_condicionalmente(
+        Reserva, [id_ for id_, _ in primeiras], Reserva.status == 'aguardando',
+        {'status': 'disponivel', 'disponivel_em': agora,
+         'expira_em': agora + timedelta(days=current_app.config['PRAZO_RETIRADA_RESERVA_DIAS'])}
+    ) if primeiras else set()
+    if not separadas:
+        return 0
+    
+    db.session.execute(
+        db.update(FilaReserva)
+        .where(FilaReserva.livro_id == livro_id)
+        .values(aguardando=FilaReserva.aguardando - len(separadas),
+                senha_atendida=max(senha for id_, senha in primeiras if id_ in separadas))
+        .execution_options(synchronize_session=False)
+    )
+    return len(separadas)
+
+
+def devolver_exemplares(livro_id, quantidade=1):
+    """Exemplares que voltam vão primeiro para a fila de reservas e o resto ao estoque"""
+    separados = alocar_reservas(livro_id, quantidade)
+    if separados < quantidade:
+        liberar_exemplar(livro_id, quantidade - separados)
+    return separados
+
+
+def retirar_reservas(usuario_id, livro_ids):
+    """
+    Encerra como atendidas as reservas com exemplar separado do usuário para
+    esses livros (sem commit); retorna os livro_ids atendidos
+    """
+    reservas = dict(db.session.query(Reserva.id, Reserva.livro_id).filter(
+        Reserva.usuario_id == usuario_id,
+        Reserva.status == 'disponivel',
+        Reserva.livro_id.in_(livro_ids)
+    ))
+    if not reservas:
+        return set()
+    atendidas = atualizar_condicionalmente(
+        Reserva, list(reservas), Reserva.status == 'disponivel',
+        {'status': 'atendida', 'encerrada_em': datetime.utcnow()}
+    )
+    return {reservas[id_] for id_ in atendidas}
+
+
+def reserva_disponivel(usuario_id, livro_id):
+    """Reserva do usuário com exemplar separado deste livro, ou None"""
+    return Reserva.query.filter_by(usuario_id=usuario_id, livro_id=livro_id, status='disponivel').first()
+
+
+def cancelar_reserva(reserva):
+    """
+    Cancela a reserva se ainda estiver aberta; um exemplar já separado passa
+    ao próximo da fila. Retorna False se ela já estava encerrada.
+    """
+    for status_anterior in STATUS_RESERVA_ABERTA:
+        resultado = db.session.execute(
+            db.update(Reserva)
+            .where(Reserva.id == reserva.id, Reserva.status == status_anterior)
+            .values(status='cancelada', encerrada_em=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount == 1:
+            break
+    else:
+        db.session.rollback()
+        return False
+    
+    if status_anterior == 'aguardando':
+        db.session.execute(
+            db.update(FilaReserva)
+            .where(FilaReserva.livro_id == reserva.livro_id)
+            .values(aguardando=FilaReserva.aguardando - 1)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        devolver_exemplares(reserva.livro_id)
+    db.session.commit()
+    return True
+
+
+def posicoes_na_fila(reservas):
+    """
+    {reserva_id: (posição, tamanho da fila)} das reservas 'aguardando', numa
+    única consulta agrupada. A posição vem das senhas; só as desistências
+    entre a última senha atendida e a da reserva são contadas, no índice
+    (livro_id, status, senha).
+    """
+    ids = [reserva.id for reserva in reservas if reserva.status == 'aguardando']
+    if not ids:
+        return {}
+    canceladas = db.aliased(Reserva)
+    linhas = db.session.query(
+        Reserva.id, Reserva.senha, FilaReserva.senha_atendida, FilaReserva.aguardando,
+        db.func.count(canceladas.id)
+    ).join(FilaReserva, FilaReserva.livro_id == Reserva.livro_id).outerjoin(canceladas, db.and_(
+        canceladas.livro_id == Reserva.livro_id,
+        canceladas.status == 'cancelada',
+        canceladas.senha > FilaReserva.senha_atendida,
+        canceladas.senha < Reserva.senha
+    )).filter(Reserva.id.in_(ids)).group_by(
+        Reserva.id, Reserva.senha, FilaReserva.senha_atendida, FilaReserva.aguardando
+    )
+    return {id_: (senha - senha_atendida - desistencias, aguardando)
+            for id_, senha, senha_atendida, aguardando, desistencias in linhas}
+
+
+FILTROS_RESERVA = {
+    'abertas': STATUS_RESERVA_ABERTA,
+    'aguardando': ('aguardando',),
+    'disponivel': ('disponivel',),
+    'encerradas': ('atendida', 'expirada', 'cancelada'),
+    'todas': None,
+}
+
+
+def consulta_reservas(status='abertas', usuario_id=None, livro_id=None):
+    """Reservas com usuário e livro carregados na mesma consulta"""
+    query = Reserva.query.options(joinedload(Reserva.usuario), joinedload(Reserva.livro))
+    filtro = FILTROS_RESERVA.get(status, STATUS_RESERVA_ABERTA)
+    if filtro:
+        query = query.filter(Reserva.status.in_(filtro))
+    if usuario_id is not None:
+        query = query.filter(Reserva.usuario_id == usuario_id)
+    if livro_id is not None:
+        query = query.filter(Reserva.livro_id == livro_id)
+    return query
+
+
+def situacao_reserva(reserva):
+    """Representação JSON de uma reserva, com a posição na fila se aguardando"""
+    posicao, tamanho = posicoes_na_fila([reserva]).get(reserva.id, (None, None))
+    return {
+        'id': reserva.id,
+        'usuario_id': reserva.usuario_id,
+        'livro_id': reserva.livro_id,
+        'senha': reserva.senha,
+        'status': reserva.status,
+        'posicao': posicao,
+        'fila': tamanho,
+        'criada_em': serializar_valor(reserva.criada_em),
+        'disponivel_em': serializar_valor(reserva.disponivel_em),
+        'expira_em': serializar_valor(reserva.expira_em),
+        'encerrada_em': serializar_valor(reserva.encerrada_em),
+    }
+
+
+def expirar_reservas(tamanho_lote=TAMANHO_LOTE_RESERVAS, agora=None):
+    """
+    Encerra as reservas com exemplar separado e prazo vencido, repassando o
+    exemplar ao próximo da fila (ou ao estoque); retorna quantas expiraram
+    """
+    agora = agora or datetime.utcnow()
+    livros = set()
+    
+    def expirar_lote():
+        vencidas = db.session.query(Reserva.id, Reserva.livro_id).filter(
+            Reserva.status == 'disponivel',
+            Reserva.expira_em < agora
+        ).order_by(Reserva.expira_em).limit(tamanho_lote).all()
+        if not vencidas:
+            db.session.rollback()
+            return 0, 0
+        expiradas = atualizar_condicionalmente(
+            Reserva, [id_ for id_, _ in vencidas], Reserva.status == 'disponivel',
+            {'status': 'expirada', 'encerrada_em': agora}
+        )
+        por_livro = defaultdict(int)
+        for id_, livro_id in vencidas:
+            if id_ in expiradas:
+                por_livro[livro_id] += 1
+        for livro_id, quantidade in por_livro.items():
+            devolver_exemplares(livro_id, quantidade)
+        db.session.commit()
+        livros.update(por_livro)
+        return len(vencidas), len(expiradas)
+    
+    total = 0
+    while True:
+        encontradas, expiradas = executar_com_retentativa(expirar_lote)
+        total += expiradas
+        if encontradas < tamanho_lote:
+            break
+    
+    if total:
+        invalidar_cache(TAG_LIVROS, TAG_RESERVAS)
+        logger.info(f"{total} reserva(s) expirada(s) sem retirada")
+    return total
+
+
+# Tarefas de fundo ---
+# marcar_atrasados muda para 'atrasado' os empréstimos ativos com prazo vencido,
+# em lotes de UPDATE curtos, e ajusta o contador de atrasados na mesma
+# transação. Roda no agendador em processo (AGENDADOR_ATIVO) ou pelo comando
+# `flask marcar-atrasados` num cron; cada execução fica em 'execucao_tarefa'.
+TAMANHO_LOTE_ATRASADOS = 500
+
+
+def marcar_atrasados(tamanho_lote=TAMANHO_LOTE_ATRASADOS, agora=None):
+    """Marca os empréstimos vencidos como atrasados; retorna quantos mudaram"""
+    agora = agora or datetime.utcnow()
+    
+    def marcar_lote():
+        ids = [id_ for (id_,) in db.session.query(Emprestimo.id).filter(
+            Emprestimo.status == 'ativo',
+            Emprestimo.data_devolucao_prevista < agora
+        ).order_by(Emprestimo.data_devolucao_prevista).limit(tamanho_lote)]
+        if not ids:
+            db.session.rollback()
+            return 0, 0
+        resultado = db.session.execute(
+            db.update(Emprestimo)
+            .where(Emprestimo.id.in_(ids), Emprestimo.status == 'ativo')
+            .values(status='atrasado')
+            .execution_options(synchronize_session=False)
+        )
+        incrementar_contador('emprestimos_atrasados', resultado.rowcount)
+        db.session.commit()
+        return len(ids), resultado.rowcount
+    
+    total = 0
+    while True:
+        encontrados, marcados = executar_com_retentativa(marcar_lote)
+        total += marcados
+        if encontrados < tamanho_lote:
+            break
+    
+    if total:
+        invalidar_cache(TAG_EMPRESTIMOS)
+        logger.info(f"{total} empréstimo(s) marcado(s) como atrasado(s)")
+    return total
+
+
+def executar_tarefa(nome, funcao, aplicacao=None):
+    """
+    Executa `funcao` no contexto da aplicação (por padrão, a atual) e grava
+    duração e resultado
+    """
+    with (aplicacao or aplicacao_atual()).app_context():
+        iniciada_em = datetime.utcnow()
+        inicio = time.perf_counter()
+        processados, erro = 0, None
+        try:
+            processados = funcao()
+        except Exception as e:
+            db.session.rollback()
+            erro = str(e)[:500]
+            raise
+        finally:
+            db.session.add(ExecucaoTarefa(
+                nome=nome,
+                iniciada_em=iniciada_em,
+                duracao_ms=(time.perf_counter() - inicio) * 1000,
+                processados=processados or 0,
+                erro=erro
+            ))
+            db.session.commit()
+        return processados
+
+
+def iniciar_agendador():
+    """Registra as tarefas periódicas da aplicação atual e inicia as threads do agendador"""
+    aplicacao = aplicacao_atual()
+    config = aplicacao.config
+    
+    def tarefa(nome, funcao):
+        return lambda: executar_tarefa(nome, funcao, aplicacao)
+    
+    agendador.registrar(
+        'marcar-atrasados', config['INTERVALO_MARCAR_ATRASADOS'],
+        tarefa('marcar-atrasados', marcar_atrasados)
+    )
+    agendador.registrar(
+        'atualizar-relatorios', config['INTERVALO_ATUALIZAR_RELATORIOS'],
+        tarefa('atualizar-relatorios', atualizar_relatorios_padrao)
+    )
+    agendador.registrar(
+        'expirar-reservas', config['INTERVALO_EXPIRAR_RESERVAS'],
+        tarefa('expirar-reservas', expirar_reservas)
+    )
+    if config['DATABASE_REPLICA_URL']:
+        agendador.registrar(
+            'sincronizar-replica', config['INTERVALO_SINCRONIZAR_REPLICA'],
+            tarefa('sincronizar-replica', sincronizar_replica)
+        )
+    agendador.iniciar()
+
+# Importação em lote do catálogo ---
+# Os registros são lidos de forma incremental (CSV ou JSON/JSON Lines), validados
+# com validar_dados_livro e gravados em lotes: uma consulta IN para os ISBNs do
+# lote, um INSERT executemany e um commit por lote.
+TAMANHO_LOTE_IMPORTACAO = 1000
+MAXIMO_ERROS_GUARDADOS = 1000
+MAXIMO_CARACTERES_REGISTRO_JSON = 1024 * 1024
+
+
+def ler_registros_csv(arquivo_texto):
+    """Gera (número da linha, dicionário) para cada linha do CSV com cabeçalho"""
+    leitor = csv.DictReader(arquivo_texto)
+    for registro in leitor:
+        yield leitor.line_num, registro
+
+
+class RegistroInvalido:
+    """Registro que não pôde ser decodificado; normalizar_registro_livro o rejeita com `mensagem`"""
+
+    def __init__(self, mensagem):
+        self.mensagem = mensagem
+
+
+def ler_registros_json(arquivo_texto, tamanho_bloco=65536):
+    """
+    Gera (posição, objeto) para um array JSON ou arquivo JSON Lines sem carregar
+    o arquivo inteiro. O primeiro caractere não branco decide o formato: '['
+    é um array, qualquer outro é JSON Lines.
+    """
+    numero_linha = 1
+    primeiro = arquivo_texto.read(1)
+    while primeiro.isspace():
+        numero_linha += primeiro == '\n'
+        primeiro = arquivo_texto.read(1)
+    if not primeiro:
+        return
+    if primeiro == '[':
+        yield from ler_array_json(arquivo_texto, tamanho_bloco)
+    else:
+        yield from ler_linhas_json(arquivo_texto, primeiro, numero_linha, tamanho_bloco)
+
+
+def ler_linhas_json(arquivo_texto, inicio, numero_linha, tamanho_bloco):
+    """
+    JSON Lines, uma linha por vez (posição = número da linha). Uma linha
+    inválida ou maior que MAXIMO_CARACTERES_REGISTRO_JSON vira um
+    RegistroInvalido e a leitura segue na linha seguinte.
+    """
+    linha = inicio + arquivo_texto.readline(MAXIMO_CARACTERES_REGISTRO_JSON)
+    while linha:
+        if len(linha) >= MAXIMO_CARACTERES_REGISTRO_JSON and not linha.endswith(('\n', '\r')):
+            resto = arquivo_texto.readline(tamanho_bloco)
+            if resto:
+                while resto and not resto.endswith(('\n', '\r')):
+                    resto = arquivo_texto.readline(tamanho_bloco)
+                yield numero_linha, RegistroInvalido(
+                    f'Linha com mais de {MAXIMO_CARACTERES_REGISTRO_JSON} caracteres')
+                linha = ''
+        if linha.strip():
+            try:
+                objeto = json.loads(linha)
+            except json.JSONDecodeError as e:
+                objeto = RegistroInvalido(f'JSON inválido na coluna {e.colno}: {e.msg}')
+            yield numero_linha, objeto
+        numero_linha += 1
+        linha = arquivo_texto.readline(MAXIMO_CARACTERES_REGISTRO_JSON)
+
+
+def ler_array_json(arquivo_texto, tamanho_bloco):
+    """
+    Elementos de um array JSON (posição = ordem do registro), decodificados
+    um por vez a partir de um buffer. Num array não há como achar o início do
+    registro seguinte a um inválido, então um registro que não decodifica até
+    o fim do arquivo ou em MAXIMO_CARACTERES_REGISTRO_JSON caracteres vira um
+    RegistroInvalido e encerra a leitura.
+    """
+    decodificador = json.JSONDecoder()
+    posicao_registro = 0
+    buffer = ''
+    fim_arquivo = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,[]')
+        if not buffer:
+            if fim_arquivo:
+                return
+            bloco = arquivo_texto.read(tamanho_bloco)
+            fim_arquivo = not bloco
+            buffer += bloco
+            continue
+        try:
+            objeto, posicao = decodificador.raw_decode(buffer)
+        except json.JSONDecodeError as e:
+            if fim_arquivo or len(buffer) > MAXIMO_CARACTERES_REGISTRO_JSON:
+                yield posicao_registro + 1, RegistroInvalido(
+                    f'JSON inválido: {e.msg}; registros seguintes não foram lidos')
+                return
+            bloco = arquivo_texto.read(tamanho_bloco)
+            fim_arquivo = not bloco
+            buffer += bloco
+            continue
+        buffer = buffer[posicao:]
+        posicao_registro += 1
+        yield posicao_registro, objeto
+
+
+def normalizar_registro_livro(registro):
+    """Extrai e valida os campos de um registro importado; retorna (dados, erros)"""
+    if isinstance(registro, RegistroInvalido):
+        return None, [registro.mensagem]
+    if not isinstance(registro, dict):
+        return None, ['Registro deve ser um objeto com os campos do livro']
+    
+    def campo(*nomes):
+        for nome in nomes:
+            valor = registro.get(nome)
+            if valor is not None:
+                return str(valor).strip()
+        return ''
+    
+    titulo = campo('titulo')
+    autor = campo('autor')
+    isbn = campo('isbn')
+    ano = campo('ano', 'ano_publicacao')
+    categoria = campo('categoria')
+    
+    erros = validar_dados_livro(titulo, autor, isbn, ano, categoria)
+    try:
+        quantidade = int(campo('quantidade', 'quantidade_total') or 1)
+        if quantidade < 1:
+            erros.append("Quantidade deve ser pelo menos 1")
+    except ValueError:
+        erros.append("Quantidade deve ser um número válido")
+    
+    if erros:
+        return None, erros
+    return {
+        'titulo': titulo,
+        'autor': autor,
+        'isbn': isbn,
+        'ano_publicacao': int(ano),
+        'categoria': categoria,
+        'quantidade_total': quantidade,
+        'quantidade_disponivel': quantidade,
+        'data_cadastro': datetime.utcnow(),
+    }, []
+
+
+def gravar_lote_livros(lote):
+    """
+    Descarta ISBNs já cadastrados (uma consulta IN) e insere o restante com
+    executemany numa única transação. Retorna (registros inseridos, linhas
+    duplicadas).
+    """
+    isbns = [dados['isbn'] for _, dados in lote]
+    existentes = {
+        isbn for (isbn,) in db.session.query(Livro.isbn).filter(Livro.isbn.in_(isbns))
+    }
+    
+    novos = []
+    vistos = set()
+    duplicados = []
+    for linha, dados in lote:
+        if dados['isbn'] in existentes or dados['isbn'] in vistos:
+            duplicados.append(linha)
+        else:
+            vistos.add(dados['isbn'])
+            novos.append(dados)
+    
+    if novos:
+        db.session.execute(db.insert(Livro), novos)
+        incrementar_contador('total_livros', len(novos))
+    db.session.commit()
+    return novos, duplicados
+
+
+def indexar_livros_importados(isbns):
+    """Inclui no autocompletar os livros de um lote (ids lidos pelo ISBN)"""
+    if not isbns:
+        return
+    livros = db.session.query(Livro.id, Livro.titulo, Livro.autor, Livro.isbn) \
+        .filter(Livro.isbn.in_(isbns))
+    sugestoes.adicionar_varios(
+        entrada for linha in livros for entrada in entradas_livro(*linha)
+    )
+
+
+def importar_livros(registros, tamanho_lote=TAMANHO_LOTE_IMPORTACAO,
+                    ao_progredir=None, ao_errar=None):
+    """
+    Importa livros a partir de um iterável de (linha, dicionário). `ao_progredir`
+    recebe o resumo após cada lote e `ao_errar` recebe (linha, mensagem) de
+    cada registro rejeitado; só os primeiros MAXIMO_ERROS_GUARDADOS erros
+    ficam no resumo retornado.
+    """
+    resumo = {'processados': 0, 'importados': 0, 'rejeitados': 0, 'erros': []}
+    # Livros novos para o autocompletar; acima do limite o índice é recarregado
+    isbns_novos = []
+    indexacao = 'incremental' if sugestoes.carregado else None
+    
+    def registrar_erro(linha, mensagem):
+        resumo['rejeitados'] += 1
+        if len(resumo['erros']) < MAXIMO_ERROS_GUARDADOS:
+            resumo['erros'].append((linha, mensagem))
+        if ao_errar:
+            ao_errar(linha, mensagem)
+    
+    def gravar(lote):
+        nonlocal indexacao
+        inseridos, duplicados = executar_com_retentativa(lambda: gravar_lote_livros(lote))
+        resumo['importados'] += len(inseridos)
+        if indexacao == 'incremental':
+            isbns_novos.extend(dados['isbn'] for dados in inseridos)
+            if len(isbns_novos) > LIMITE_INDEXACAO_INCREMENTAL:
+                indexacao = 'recarregar'
+                isbns_novos.clear()
+        for linha in duplicados:
+            registrar_erro(linha, 'ISBN já cadastrado no sistema')
+        if ao_progredir:
+            ao_progredir(resumo)
+    
+    lote = []
+    for linha, registro in registros:
+        resumo['processados'] += 1
+        dados, erros = normalizar_registro_livro(registro)
+        if erros:
+            registrar_erro(linha, '; '.join(erros))
+            continue
+        lote.append((linha, dados))
+        if len(lote) >= tamanho_lote:
+            gravar(lote)
+            lote = []
+    if lote:
+        gravar(lote)
+    
+    invalidar_cache(TAG_LIVROS)
+    if indexacao == 'recarregar':
+        carregar_autocompletar()
+    elif indexacao == 'incremental':
+        indexar_livros_importados(isbns_novos)
+    logger.info(f"Importação concluída: {resumo['importados']} livro(s) importado(s), "
+                f"{resumo['rejeitados']} rejeitado(s)")
+    return resumo
+
+
+def abrir_registros(arquivo_binario, formato):
+    """Envolve o arquivo binário num leitor de texto e escolhe o parser"""
+    texto = io.TextIOWrapper(arquivo_binario, encoding='utf-8-sig', newline='')
+    if formato == 'json':
+        return ler_registros_json(texto)
+    return ler_registros_csv(texto)
+
+
+def formato_do_arquivo(nome):
+    """Deduz o formato pela extensão (.json/.jsonl → json, senão csv)"""
+    return 'json' if nome.lower().endswith(('.json', '.jsonl')) else 'csv'
+
+# Exportação em streaming ---
+# As exportações usam um SELECT de colunas (sem objetos ORM) lido em blocos com
+# yield_per/stream_results e convertido em pedaços de texto conforme são
+# lidos, de modo que a memória não cresce com o tamanho da tabela.
+TAMANHO_BLOCO_EXPORTACAO = 1000
+
+
+def colunas_exportacao(tipo):
+    """Colunas (rótulo, expressão) e coluna de data usada no filtro de período"""
+    if tipo == 'livros':
+        colunas = [Livro.id, Livro.titulo, Livro.autor, Livro.isbn, Livro.ano_publicacao,
+                   Livro.categoria, Livro.quantidade_total, Livro.quantidade_disponivel,
+                   Livro.data_cadastro]
+        return [(c.key, c) for c in colunas], Livro.data_cadastro
+    if tipo == 'usuarios':
+        colunas = [Usuario.id, Usuario.nome, Usuario.email, Usuario.telefone,
+                   Usuario.data_cadastro]
+        return [(c.key, c) for c in colunas], Usuario.data_cadastro
+    if tipo == 'emprestimos':
+        return [
+            ('id', Emprestimo.id),
+            ('data_emprestimo', Emprestimo.data_emprestimo),
+            ('data_devolucao_prevista', Emprestimo.data_devolucao_prevista),
+            ('data_devolucao_real', Emprestimo.data_devolucao_real),
+            ('status', Emprestimo.status),
+            ('usuario_id', Emprestimo.usuario_id),
+            ('usuario_nome', Usuario.nome),
+            ('usuario_email', Usuario.email),
+            ('livro_id', Emprestimo.livro_id),
+            ('livro_titulo', Livro.titulo),
+            ('livro_isbn', Livro.isbn),
+        ], Emprestimo.data_emprestimo
+    raise ValueError(f"Tipo de exportação desconhecido: {tipo}")
+
+
+TIPOS_EXPORTACAO = ('livros', 'usuarios', 'emprestimos')
+
+
+def consulta_exportacao(tipo, desde=None, ate=None):
+    """SELECT da exportação, ordenado pela chave primária"""
+    colunas, coluna_data = colunas_exportacao(tipo)
+    consulta = db.select(*[expressao.label(rotulo) for rotulo, expressao in colunas])
+    if tipo == 'emprestimos':
+        consulta = consulta.select_from(Emprestimo).join(
+            Usuario, Usuario.id == Emprestimo.usuario_id
+        ).join(Livro, Livro.id == Emprestimo.livro_id)
+        chave = Emprestimo.id
+    else:
+        chave = colunas[0][1]
+    if desde:
+        consulta = consulta.where(coluna_data >= desde)
+    if ate:
+        consulta = consulta.where(coluna_data < ate + timedelta(days=1))
+    return consulta.order_by(chave), [rotulo for rotulo, _ in colunas]
+
+
+def serializar_valor(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+def gerar_exportacao(tipo, formato='csv', desde=None, ate=None):
+    """
+    Gera o conteúdo da exportação em pedaços de texto (CSV com cabeçalho ou
+    array JSON), um pedaço a cada TAMANHO_BLOCO_EXPORTACAO linhas.
+    """
+    consulta, rotulos = consulta_exportacao(tipo, desde, ate)
+    with db.engine.connect() as conexao:
+        resultado = conexao.execution_options(
+            stream_results=True, yield_per=TAMANHO_BLOCO_EXPORTACAO
+        ).execute(consulta)
+        
+        primeiro = True
+        if formato == 'csv':
+            saida = io.StringIO()
+            escritor = csv.writer(saida)
+            escritor.writerow(rotulos)
+            yield saida.getvalue()
+        else:
+            yield '['
+        
+        for bloco in resultado.partitions():
+            saida = io.StringIO()
+            if formato == 'csv':
+                escritor = csv.writer(saida)
+                escritor.writerows([serializar_valor(v) for v in linha] for linha in bloco)
+            else:
+                for linha in bloco:
+                    saida.write('\n' if primeiro else ',\n')
+                    primeiro = False
+                    json.dump({r: serializar_valor(v) for r, v in zip(rotulos, linha)},
+                              saida, ensure_ascii=False)
+            yield saida.getvalue()
+        
+        if formato != 'csv':
+            yield '\n]\n'
+
+
+def compactar_gzip(pedacos):
+    """Compacta incrementalmente um gerador de texto em gzip"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for pedaco in pedacos:
+        dados = compressor.compress(pedaco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def ler_data_parametro(valor, nome):
+    """Converte 'AAAA-MM-DD' em datetime; BadRequest se inválido"""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d')
+    except ValueError:
+        raise BadRequest(f"Parâmetro '{nome}' deve estar no formato AAAA-MM-DD")
+
+# Relatórios em segundo plano ---
+# Relatórios por período, categoria ou usuário são registrados em
+# 'pedido_relatorio' e gerados pelas threads de fila_relatorios, fora da
+# requisição. Cada pedido concluído deixa um snapshot em CSV e JSON em
+# DIRETORIO_RELATORIOS. /relatorios mostra o snapshot mais recente dos
+# relatórios padrão e pede outro quando ele passa de
+# INTERVALO_ATUALIZAR_RELATORIOS (a tarefa 'atualizar-relatorios' faz o mesmo
+# periodicamente). Sem filtros, os relatórios leem os agregados; com filtros,
+# agrupam a tabela de empréstimos na faixa de datas pedida. O índice único
+# parcial uq_pedido_relatorio_em_andamento garante um só pedido em andamento
+# por relatório; um pedido que passa de PRAZO_EXECUCAO_RELATORIO pendente ou
+# em execução (processo encerrado, fila perdida) é dado como erro e um pedido
+# igual pode ser criado.
+TIPOS_RELATORIO = {
+    'populares': 'Livros mais emprestados',
+    'mensal': 'Empréstimos por mês',
+    'usuario': 'Histórico de um usuário',
+}
+FORMATOS_RELATORIO = ('csv', 'json')
+STATUS_RELATORIO_EM_ANDAMENTO = ('pendente', 'executando')
+LIMITE_RELATORIO_POPULARES = 1000
+LINHAS_PREVIA_RELATORIO = 50
+RELATORIOS_PADRAO = {
+    'populares': {'desde': None, 'ate': None, 'categoria': None, 'limite': 10},
+    'mensal': {'desde': None, 'ate': None, 'categoria': None},
+}
+
+
+def normalizar_parametros_relatorio(tipo, dados):
+    """
+    Valida os parâmetros de um pedido (formulário ou JSON) e devolve o
+    dicionário gravado no pedido; BadRequest se inválidos.
+    """
+    if tipo not in TIPOS_RELATORIO:
+        raise BadRequest(f"Tipo deve ser um de: {', '.join(TIPOS_RELATORIO)}")
+    desde = ler_data_parametro(str(dados.get('desde') or ''), 'desde')
+    ate = ler_data_parametro(str(dados.get('ate') or ''), 'ate')
+    if desde and ate and desde > ate:
+        raise BadRequest("'desde' deve ser anterior ou igual a 'ate'")
+    parametros = {
+        'desde': desde.strftime('%Y-%m-%d') if desde else None,
+        'ate': ate.strftime('%Y-%m-%d') if ate else None,
+    }
+    
+    if tipo == 'usuario':
+        try:
+            usuario_id = int(dados.get('usuario_id') or 0)
+        except (TypeError, ValueError):
+            usuario_id = 0
+        if not usuario_id or db.session.get(Usuario, usuario_id) is None:
+            raise BadRequest('Usuário não encontrado')
+        parametros['usuario_id'] = usuario_id
+    else:
+        parametros['categoria'] = str(dados.get('categoria') or '').strip() or None
+    
+    if tipo == 'populares':
+        try:
+            limite = int(dados.get('limite') or 10)
+        except (TypeError, ValueError):
+            limite = 0
+        if not 1 <= limite <= LIMITE_RELATORIO_POPULARES:
+            raise BadRequest(f"'limite' deve estar entre 1 e {LIMITE_RELATORIO_POPULARES}")
+        parametros['limite'] = limite
+    return parametros
+
+
+def filtrar_periodo(consulta, desde, ate):
+    if desde:
+        consulta = consulta.where(Emprestimo.data_emprestimo >= desde)
+    if ate:
+        consulta = consulta.where(Emprestimo.data_emprestimo < ate + timedelta(days=1))
+    return consulta
+
+
+def relatorio_populares(desde, ate, categoria, limite):
+    """Ranking de livros por empréstimos no período"""
+    if desde is None and ate is None and not categoria:
+        total = EmprestimosPorLivro.total
+        consulta = db.select(
+            Livro.id, Livro.titulo, Livro.autor, Livro.categoria, total,
+            Livro.quantidade_disponivel
+        ).join(EmprestimosPorLivro, EmprestimosPorLivro.livro_id == Livro.id).where(total > 0)
+    else:
+        total = db.func.count(Emprestimo.id)
+        consulta = db.select(
+            Livro.id, Livro.titulo, Livro.autor, Livro.categoria, total,
+            Livro.quantidade_disponivel
+        ).join(Emprestimo, Emprestimo.livro_id == Livro.id).group_by(Livro.id)
+        consulta = filtrar_periodo(consulta, desde, ate)
+        if categoria:
+            consulta = consulta.where(Livro.categoria == categoria)
+    consulta = consulta.order_by(total.desc(), Livro.id).limit(limite)
+    
+    colunas = ['posicao', 'livro_id', 'titulo', 'autor', 'categoria', 'total_emprestimos', 'disponivel']
+    linhas = (
+        (posicao, id_, titulo, autor, categoria_livro, total_livro, (disponivel or 0) > 0)
+        for posicao, (id_, titulo, autor, categoria_livro, total_livro, disponivel)
+        in enumerate(db.session.execute(consulta), 1)
+    )
+    return colunas, linhas
+
+
+def relatorio_mensal(desde, ate, categoria):
+    """Empréstimos por mês; sem `desde`, os últimos JANELA_RELATORIO_MENSAL dias"""
+    desde = desde or datetime.utcnow() - timedelta(days=JANELA_RELATORIO_MENSAL)
+    if ate is None and not categoria:
+        linhas = [(mes['mes'], mes['total']) for mes in emprestimos_mensais_agregados(desde)]
+    else:
+        mes = db.func.strftime('%Y-%m', Emprestimo.data_emprestimo)
+        consulta = db.select(mes.label('mes'), db.func.count(Emprestimo.id))
+        consulta = filtrar_periodo(consulta, desde, ate)
+        if categoria:
+            consulta = consulta.join(Livro, Livro.id == Emprestimo.livro_id).where(
+                Livro.categoria == categoria)
+        linhas = db.session.execute(consulta.group_by(mes).order_by(mes))
+    return ['mes', 'total'], linhas
+
+
+def relatorio_usuario(usuario_id, desde, ate):
+    """Todos os empréstimos de um usuário no período, do mais antigo ao mais novo"""
+    consulta = db.select(
+        Emprestimo.id, Emprestimo.data_emprestimo, Emprestimo.data_devolucao_prevista,
+        Emprestimo.data_devolucao_real, Emprestimo.status, Emprestimo.livro_id,
+        Livro.titulo, Livro.isbn
+    ).join(Livro, Livro.id == Emprestimo.livro_id).where(Emprestimo.usuario_id == usuario_id)
+    consulta = filtrar_periodo(consulta, desde, ate).order_by(Emprestimo.data_emprestimo, Emprestimo.id)
+    colunas = ['emprestimo_id', 'data_emprestimo', 'data_devolucao_prevista',
+               'data_devolucao_real', 'status', 'livro_id', 'livro_titulo', 'livro_isbn']
+    return colunas, db.session.execute(
+        consulta.execution_options(yield_per=TAMANHO_BLOCO_EXPORTACAO))
+
+
+def linhas_relatorio(tipo, parametros):
+    """Colunas e linhas (tuplas) do relatório descrito por um pedido"""
+    desde = ler_data_parametro(parametros.get('desde'), 'desde')
+    ate = ler_data_parametro(parametros.get('ate'), 'ate')
+    if tipo == 'populares':
+        return relatorio_populares(desde, ate, parametros['categoria'], parametros['limite'])
+    if tipo == 'mensal':
+        return relatorio_mensal(desde, ate, parametros['categoria'])
+    return relatorio_usuario(parametros['usuario_id'], desde, ate)
+
+
+def caminho_snapshot(pedido_id, formato):
+    return os.path.join(current_app.config['DIRETORIO_RELATORIOS'], f'relatorio-{pedido_id}.{formato}')
+
+
+def gravar_snapshot(pedido_id, tipo, parametros, colunas, linhas):
+    """
+    Escreve o CSV e o JSON do relatório conforme as linhas são lidas, em
+    arquivos temporários renomeados no fim; retorna o número de linhas.
+    """
+    os.makedirs(current_app.config['DIRETORIO_RELATORIOS'], exist_ok=True)
+    destinos = {formato: caminho_snapshot(pedido_id, formato) for formato in FORMATOS_RELATORIO}
+    cabecalho = json.dumps({
+        'id': pedido_id,
+        'tipo': tipo,
+        'parametros': parametros,
+        'gerado_em': datetime.utcnow().isoformat(timespec='seconds'),
+        'colunas': colunas,
+    }, ensure_ascii=False)
+    
+    total = 0
+    with open(destinos['csv'] + '.tmp', 'w', newline='', encoding='utf-8') as arquivo_csv, \
+            open(destinos['json'] + '.tmp', 'w', encoding='utf-8') as arquivo_json:
+        escritor = csv.writer(arquivo_csv)
+        escritor.writerow(colunas)
+        arquivo_json.write(cabecalho[:-1] + ', "linhas": [')
+        for linha in linhas:
+            valores = [serializar_valor(valor) for valor in linha]
+            escritor.writerow(valores)
+            arquivo_json.write('\n' if total == 0 else ',\n')
+            json.dump(dict(zip(colunas, valores)), arquivo_json, ensure_ascii=False)
+            total += 1
+        arquivo_json.write('\n]}\n')
+    
+    for destino in destinos.values():
+        os.replace(destino + '.tmp', destino)
+    return total
+
+
+def ler_snapshot(pedido):
+    """Linhas do JSON de um pedido concluído ([] se o arquivo não existe mais)"""
+    try:
+        with open(caminho_snapshot(pedido.id, 'json'), encoding='utf-8') as arquivo:
+            return json.load(arquivo)['linhas']
+    except FileNotFoundError:
+        return []
+
+
+def previa_snapshot(pedido, limite=LINHAS_PREVIA_RELATORIO):
+    """Cabeçalho e primeiras linhas do CSV, sem carregar o arquivo inteiro"""
+    try:
+        with open(caminho_snapshot(pedido.id, 'csv'), newline='', encoding='utf-8') as arquivo:
+            leitor = csv.reader(arquivo)
+            colunas = next(leitor, [])
+            return colunas, list(itertools.islice(leitor, limite))
+    except FileNotFoundError:
+        return [], []
+
+
+def executar_pedido_relatorio(pedido_id, aplicacao=None):
+    """
+    Gera o relatório do pedido numa thread do pool e registra o resultado; um
+    erro é gravado no pedido e propagado, para o pool contá-lo como falha
+    """
+    with (aplicacao or aplicacao_atual()).app_context():
+        def assumir():
+            resultado = db.session.execute(
+                db.update(PedidoRelatorio)
+                .where(PedidoRelatorio.id == pedido_id, PedidoRelatorio.status == 'pendente')
+                .values(status='executando', iniciado_em=datetime.utcnow())
+            )
+            db.session.commit()
+            return resultado.rowcount
+        
+        if not executar_com_retentativa(assumir):
+            return
+        pedido = db.session.get(PedidoRelatorio, pedido_id)
+        tipo, parametros = pedido.tipo, json.loads(pedido.parametros)
+        
+        inicio = time.perf_counter()
+        falha = None
+        try:
+            with lendo_da_replica():
+                colunas, linhas = linhas_relatorio(tipo, parametros)
+            valores = {'status': 'concluido',
+                       'linhas': gravar_snapshot(pedido_id, tipo, parametros, colunas, linhas)}
+        except Exception as e:
+            db.session.rollback()
+            falha = e
+            valores = {'status': 'erro', 'erro': str(e)[:500]}
+        
+        def finalizar():
+            db.session.execute(
+                db.update(PedidoRelatorio)
+                .where(PedidoRelatorio.id == pedido_id)
+                .values(concluido_em=datetime.utcnow(), **valores)
+            )
+            db.session.commit()
+        
+        executar_com_retentativa(finalizar)
+        invalidar_cache(TAG_RELATORIOS)
+        logger.info(f"Relatório {pedido_id} ({tipo}) {valores['status']} em "
+                    f"{time.perf_counter() - inicio:.2f}s")
+        if falha is not None:
+            raise falha
+
+
+def limite_prazo_relatorio():
+    return datetime.utcnow() - timedelta(seconds=current_app.config['PRAZO_EXECUCAO_RELATORIO'])
+
+
+def relatorio_travado(pedido):
+    """Indica se o pedido está em andamento há mais de PRAZO_EXECUCAO_RELATORIO"""
+    inicio = pedido.iniciado_em if pedido.status == 'executando' else pedido.criado_em
+    return (pedido.status in STATUS_RELATORIO_EM_ANDAMENTO and inicio is not None
+            and inicio < limite_prazo_relatorio())
+
+
+def expirar_relatorios_travados(pedido_ids=None):
+    """
+    Marca como erro os pedidos pendentes ou em execução há mais de
+    PRAZO_EXECUCAO_RELATORIO (todos, ou só `pedido_ids`); retorna quantos
+    """
+    limite = limite_prazo_relatorio()
+    consulta = db.update(PedidoRelatorio).where(db.or_(
+        db.and_(PedidoRelatorio.status == 'pendente', PedidoRelatorio.criado_em < limite),
+        db.and_(PedidoRelatorio.status == 'executando', PedidoRelatorio.iniciado_em < limite),
+    ))
+    if pedido_ids is not None:
+        consulta = consulta.where(PedidoRelatorio.id.in_(pedido_ids))
+    resultado = db.session.execute(consulta.values(
+        status='erro', erro='Prazo de execução esgotado', concluido_em=datetime.utcnow()
+    ))
+    db.session.commit()
+    if resultado.rowcount:
+        logger.warning(f"{resultado.rowcount} pedido(s) de relatório passaram do prazo e foram "
+                       f"marcados como erro")
+    return resultado.rowcount
+
+
+def solicitar_relatorio(tipo, parametros):
+    """
+    Registra o pedido e o envia ao pool. Se um pedido igual ainda está
+    pendente ou em execução (dentro do prazo), devolve esse em vez de criar
+    outro; o índice único parcial resolve pedidos simultâneos.
+    """
+    chave = json.dumps(parametros, sort_keys=True)
+    
+    def em_andamento():
+        return PedidoRelatorio.query.filter(
+            PedidoRelatorio.tipo == tipo,
+            PedidoRelatorio.parametros == chave,
+            PedidoRelatorio.status.in_(STATUS_RELATORIO_EM_ANDAMENTO)
+        ).first()
     
-    if not isbn or len(isbn.strip()) < 10:
-        erros.append("ISBN deve ter pelo menos 10 caracteres")
+    existente = em_andamento()
+    if existente is not None:
+        if not relatorio_travado(existente) or not expirar_relatorios_travados([existente.id]):
+            return existente
     
+    pedido = PedidoRelatorio(tipo=tipo, parametros=chave)
+    db.session.add(pedido)
     try:
-        ano_int = int(ano)
-        if ano_int < 1000 or ano_int > datetime.now().year:
-            erros.append("Ano de publicação inválido")
-    except (ValueError, TypeError):
-        erros.append("Ano deve ser um número válido")
-    
-    if not categoria or len(categoria.strip()) < 2:
-        erros.append("Categoria deve ter pelo menos 2 caracteres")
-    
-    return erros
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo registrou o mesmo pedido entre a consulta e o INSERT
+        db.session.rollback()
+        return em_andamento() or solicitar_relatorio(tipo, parametros)
+    fila_relatorios.enviar(pedido.id, executar_pedido_relatorio, pedido.id, aplicacao_atual())
+    logger.info(f"Relatório {pedido.id} ({tipo}) solicitado: {chave}")
+    return pedido
 
-def calcular_estatisticas():
+
+def ultimo_relatorio_padrao(tipo):
+    """Pedido concluído mais recente do relatório padrão `tipo` (ou None)"""
+    return PedidoRelatorio.query.filter_by(
+        tipo=tipo,
+        parametros=json.dumps(RELATORIOS_PADRAO[tipo], sort_keys=True),
+        status='concluido'
+    ).order_by(PedidoRelatorio.id.desc()).first()
+
+
+def relatorio_padrao(tipo):
     """
-    Cálculo de estatísticas para demonstrar EFICIÊNCIA
+    Linhas do snapshot mais recente do relatório padrão, o pedido que o gerou
+    e o pedido de atualização em andamento, feito aqui se o snapshot não
+    existe ou já passou de INTERVALO_ATUALIZAR_RELATORIOS.
     """
-    try:
-        total_livros = Livro.query.count()
-        total_usuarios = Usuario.query.count()
-        emprestimos_ativos = Emprestimo.query.filter_by(status='ativo').count()
-        emprestimos_atrasados = Emprestimo.query.filter(
-            Emprestimo.data_devolucao_prevista < datetime.utcnow(),
-            Emprestimo.status == 'ativo'
-        ).count()
-        
-        return {
-            'total_livros': total_livros,
-            'total_usuarios': total_usuarios,
-            'emprestimos_ativos': emprestimos_ativos,
-            'emprestimos_atrasados': emprestimos_atrasados
+    pedido = ultimo_relatorio_padrao(tipo)
+    validade = timedelta(seconds=current_app.config['INTERVALO_ATUALIZAR_RELATORIOS'])
+    atualizacao = None
+    if pedido is None or pedido.concluido_em < datetime.utcnow() - validade:
+        atualizacao = solicitar_relatorio(tipo, RELATORIOS_PADRAO[tipo])
+    return (ler_snapshot(pedido) if pedido else []), pedido, atualizacao
+
+
+def limpar_relatorios_antigos(agora=None):
+    """
+    Remove os pedidos finalizados há mais de RETENCAO_RELATORIOS_DIAS e seus
+    arquivos, preservando o último snapshot de cada relatório padrão.
+    """
+    agora = agora or datetime.utcnow()
+    limite = agora - timedelta(days=current_app.config['RETENCAO_RELATORIOS_DIAS'])
+    preservados = [pedido.id for pedido in map(ultimo_relatorio_padrao, RELATORIOS_PADRAO) if pedido]
+    antigos = [id_ for (id_,) in db.session.query(PedidoRelatorio.id).filter(
+        PedidoRelatorio.status.in_(('concluido', 'erro')),
+        PedidoRelatorio.concluido_em < limite,
+        PedidoRelatorio.id.notin_(preservados)
+    )]
+    for pedido_id in antigos:
+        for formato in FORMATOS_RELATORIO:
+            try:
+                os.remove(caminho_snapshot(pedido_id, formato))
+            except FileNotFoundError:
+                pass
+    if antigos:
+        PedidoRelatorio.query.filter(PedidoRelatorio.id.in_(antigos)).delete(synchronize_session=False)
+        db.session.commit()
+    return len(antigos)
+
+
+def atualizar_relatorios_padrao():
+    """
+    Tarefa periódica: encerra os pedidos que passaram do prazo, renova os
+    snapshots padrão e apaga os antigos
+    """
+    expirar_relatorios_travados()
+    for tipo in RELATORIOS_PADRAO:
+        solicitar_relatorio(tipo, RELATORIOS_PADRAO[tipo])
+    return limpar_relatorios_antigos()
+
+
+def interromper_relatorios_pendentes():
+    """
+    Pedidos em andamento de uma execução anterior não têm mais thread. Só para
+    o servidor de um único processo (`python app.py`); com vários workers, os
+    pedidos de outro processo são encerrados por expirar_relatorios_travados
+    """
+    resultado = db.session.execute(
+        db.update(PedidoRelatorio)
+        .where(PedidoRelatorio.status.in_(STATUS_RELATORIO_EM_ANDAMENTO))
+        .values(status='erro', erro='Interrompido pelo reinício do servidor',
+                concluido_em=datetime.utcnow())
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+def situacao_relatorio(pedido):
+    """Representação JSON de um pedido, com os links dos arquivos se concluído"""
+    dados = {
+        'id': pedido.id,
+        'tipo': pedido.tipo,
+        'parametros': json.loads(pedido.parametros),
+        'status': pedido.status,
+        'criado_em': serializar_valor(pedido.criado_em),
+        'iniciado_em': serializar_valor(pedido.iniciado_em),
+        'concluido_em': serializar_valor(pedido.concluido_em),
+        'linhas': pedido.linhas,
+        'erro': pedido.erro,
+    }
+    if pedido.status == 'concluido':
+        dados['arquivos'] = {
+            formato: url_for('baixar_relatorio', pedido_id=pedido.id, formato=formato)
+            for formato in FORMATOS_RELATORIO
         }
-    except Exception as e:
-        logger.error(f"Erro ao calcular estatísticas: {e}")
-        return None
-    
-@app.route('/')
+    return dados
+
+@biblioteca.route('/')
+@pagina_em_cache(TAG_LIVROS, TAG_USUARIOS, TAG_EMPRESTIMOS)
 def index():
     """Página inicial demonstrando USABILIDADE"""
     try:
@@ -122,34 +2902,18 @@ def index():
         flash('Erro ao carregar dados da página inicial', 'error')
         return render_template('index.html', estatisticas=None, livros_recentes=[])
     
-@app.route('/livros')
+@biblioteca.route('/livros')
+@leitura_na_replica
+@pagina_em_cache(TAG_LIVROS, TAG_EMPRESTIMOS)
 def listar_livros():
     """Lista todos os livros com funcionalidade de busca"""
     try:
-        pagina = request.args.get('pagina', 1, type=int)
         busca = request.args.get('busca', '')
         categoria = request.args.get('categoria', '')
         
-        query = Livro.query
-        
-        if busca:
-            query = query.filter(
-                db.or_(
-                    Livro.titulo.contains(busca),
-                    Livro.autor.contains(busca),
-                    Livro.isbn.contains(busca)
-                )
-            )
-        
-        if categoria:
-            query = query.filter(Livro.categoria == categoria)
-        
-        livros = query.paginate(
-            page=pagina, per_page=10, error_out=False
-        )
+        livros = paginar_livros(busca, categoria)
         
-        categorias = db.session.query(Livro.categoria).distinct().all()
-        categorias = [cat[0] for cat in categorias]
+        categorias = listar_categorias()
         
         return render_template('livros.html', 
                              livros=livros, 
@@ -161,7 +2925,7 @@ def listar_livros():
         flash('Erro ao carregar lista de livros', 'error')
         return redirect(url_for('index'))
 
-@app.route('/livros/adicionar', methods=['GET', 'POST'])
+@biblioteca.route('/livros/adicionar', methods=['GET', 'POST'])
 def adicionar_livro():
     """Adiciona um novo livro - FUNCIONALIDADE 1"""
     if request.method == 'POST':
@@ -195,7 +2959,11 @@ def adicionar_livro():
             )
             
             db.session.add(novo_livro)
+            incrementar_contador('total_livros')
             db.session.commit()
+            invalidar_cache(TAG_LIVROS)
+            sugestoes.adicionar_varios(entradas_livro(
+                novo_livro.id, novo_livro.titulo, novo_livro.autor, novo_livro.isbn))
             
             logger.info(f"Livro adicionado: {titulo} - {autor}")
             flash('Livro adicionado com sucesso!', 'success')
@@ -209,18 +2977,48 @@ def adicionar_livro():
     
     return render_template('adicionar_livro.html')
 
-@app.route('/usuarios')
+@biblioteca.route('/livros/importar', methods=['GET', 'POST'])
+def importar_livros_arquivo():
+    """Importa livros em lote a partir de um arquivo CSV ou JSON"""
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            flash('Selecione um arquivo CSV ou JSON', 'error')
+            return render_template('importar_livros.html', resumo=None)
+        
+        try:
+            formato = request.form.get('formato') or formato_do_arquivo(arquivo.filename)
+            resumo = importar_livros(abrir_registros(arquivo.stream, formato))
+            flash(f"{resumo['importados']} livro(s) importado(s), "
+                  f"{resumo['rejeitados']} rejeitado(s)",
+                  'success' if resumo['importados'] else 'error')
+            return render_template('importar_livros.html', resumo=resumo)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao importar livros: {e}")
+            flash('Erro ao importar arquivo: formato inválido ou ilegível', 'error')
+            return render_template('importar_livros.html', resumo=None)
+    
+    return render_template('importar_livros.html', resumo=None)
+
+@biblioteca.route('/usuarios')
+@leitura_na_replica
 def listar_usuarios():
     """Lista todos os usuários"""
     try:
-        usuarios = Usuario.query.all()
-        return render_template('usuarios.html', usuarios=usuarios)
+        query = consulta_usuarios()
+        total = contar_em_cache(('usuarios',), query.count)
+        usuarios = paginar_por_cursor(query, [Usuario.id], total, por_pagina=20)
+        emprestimos_ativos_por_usuario = contar_emprestimos_ativos(u.id for u in usuarios.itens)
+        return render_template('usuarios.html',
+                             usuarios=usuarios,
+                             emprestimos_ativos_por_usuario=emprestimos_ativos_por_usuario)
     except Exception as e:
         logger.error(f"Erro ao listar usuários: {e}")
         flash('Erro ao carregar lista de usuários', 'error')
         return redirect(url_for('index'))
 
-@app.route('/usuarios/adicionar', methods=['GET', 'POST'])
+@biblioteca.route('/usuarios/adicionar', methods=['GET', 'POST'])
 def adicionar_usuario():
     """Adiciona um novo usuário"""
     if request.method == 'POST':
@@ -248,7 +3046,11 @@ def adicionar_usuario():
             )
             
             db.session.add(novo_usuario)
+            incrementar_contador('total_usuarios')
             db.session.commit()
+            invalidar_cache(TAG_USUARIOS)
+            sugestoes.adicionar_varios(entradas_usuario(
+                novo_usuario.id, novo_usuario.nome, novo_usuario.email))
             
             logger.info(f"Usuário adicionado: {nome}")
             flash('Usuário adicionado com sucesso!', 'success')
@@ -262,53 +3064,24 @@ def adicionar_usuario():
     
     return render_template('adicionar_usuario.html')
 
-@app.route('/emprestimos')
+@biblioteca.route('/emprestimos')
+@leitura_na_replica
 def listar_emprestimos():
     """Lista todos os empréstimos - FUNCIONALIDADE 2"""
     try:
         status = request.args.get('status', 'todos')
-        query = Emprestimo.query
+        query = consulta_emprestimos(status)
         
-        if status != 'todos':
-            query = query.filter_by(status=status)
-        
-        emprestimos = query.order_by(Emprestimo.data_emprestimo.desc()).all()
-
-        # Enriquecer dados para o template sem usar timedelta no Jinja
-        agora_utc = datetime.utcnow()
-        emprestimos_view = []
-        total_ativos = 0
-        total_devolvidos = 0
-        total_atrasados = 0
-
-        for emp in emprestimos:
-            is_atrasado = (
-                emp.status == 'ativo'
-                and emp.data_devolucao_prevista is not None
-                and emp.data_devolucao_prevista < agora_utc
-            )
-            if emp.status == 'ativo':
-                total_ativos += 1
-                if is_atrasado:
-                    total_atrasados += 1
-            elif emp.status == 'devolvido':
-                total_devolvidos += 1
-
-            emprestimos_view.append({
-                'emprestimo': emp,
-                'is_atrasado': is_atrasado,
-            })
-
-        stats = {
-            'ativos': total_ativos,
-            'devolvidos': total_devolvidos,
-            'atrasados': total_atrasados,
-            'total': len(emprestimos)
-        }
+        stats = estatisticas_emprestimos(status)
+        pagina = paginar_por_cursor(
+            query, [Emprestimo.data_emprestimo, Emprestimo.id], stats['total'],
+            por_pagina=20, descendente=True
+        )
 
         return render_template(
             'emprestimos.html',
-            emprestimos=emprestimos_view,
+            emprestimos=pagina.itens,
+            pagina=pagina,
             status_selecionado=status,
             stats=stats
         )
@@ -317,74 +3090,85 @@ def listar_emprestimos():
         flash('Erro ao carregar lista de empréstimos', 'error')
         return redirect(url_for('index'))
 
-@app.route('/emprestimos/novo', methods=['GET', 'POST'])
+@biblioteca.route('/emprestimos/novo', methods=['GET', 'POST'])
 def novo_emprestimo():
     """Cria um novo empréstimo"""
     if request.method == 'POST':
         try:
             usuario_id = int(request.form['usuario_id'])
             livro_id = int(request.form['livro_id'])
-            dias_emprestimo = int(request.form.get('dias_emprestimo', 14))
+            dias_emprestimo = ler_dias_emprestimo(request.form.get('dias_emprestimo'))
             
-            # Verificar se livro está disponível
-            livro = Livro.query.get(livro_id)
-            if not livro or livro.quantidade_disponivel <= 0:
+            livro = db.session.get(Livro, livro_id)
+            if not livro:
                 flash('Livro não disponível para empréstimo', 'error')
                 return redirect(url_for('novo_emprestimo'))
             
             # Verificar se usuário existe
-            usuario = Usuario.query.get(usuario_id)
+            usuario = db.session.get(Usuario, usuario_id)
             if not usuario:
                 flash('Usuário não encontrado', 'error')
                 return redirect(url_for('novo_emprestimo'))
             
+            # Sem exemplar livre nem separado para o usuário, o caminho é a fila
+            # de reservas (a reserva atômica do exemplar confirma)
+            if livro.quantidade_disponivel <= 0 and not reserva_disponivel(usuario_id, livro_id):
+                flash('Livro não disponível para empréstimo; o usuário pode entrar na fila de reservas', 'error')
+                return redirect(url_for('nova_reserva', usuario_id=usuario_id, livro_id=livro_id))
+            
             # Criar empréstimo
-            data_devolucao = datetime.utcnow() + timedelta(days=dias_emprestimo)
-            novo_emprestimo = Emprestimo(
-                usuario_id=usuario_id,
-                livro_id=livro_id,
-                data_devolucao_prevista=data_devolucao
+            emprestimo = executar_com_retentativa(
+                lambda: registrar_emprestimo(usuario_id, livro_id, dias_emprestimo)
             )
-            
-            # Atualizar quantidade disponível
-            livro.quantidade_disponivel -= 1
-            
-            db.session.add(novo_emprestimo)
-            db.session.commit()
+            if emprestimo is None:
+                flash('Livro não disponível para empréstimo; o usuário pode entrar na fila de reservas', 'error')
+                return redirect(url_for('nova_reserva', usuario_id=usuario_id, livro_id=livro_id))
+            invalidar_cache(TAG_EMPRESTIMOS, TAG_LIVROS, TAG_RESERVAS)
             
             logger.info(f"Empréstimo criado: {livro.titulo} para {usuario.nome}")
             flash('Empréstimo realizado com sucesso!', 'success')
             return redirect(url_for('listar_emprestimos'))
             
+        except BadRequest as e:
+            flash(e.description, 'error')
+            return redirect(url_for('novo_emprestimo'))
         except Exception as e:
             db.session.rollback()
             logger.error(f"Erro ao criar empréstimo: {e}")
             flash('Erro ao criar empréstimo', 'error')
             return redirect(url_for('novo_emprestimo'))
     
-    usuarios = Usuario.query.all()
-    livros_disponiveis = Livro.query.filter(Livro.quantidade_disponivel > 0).all()
-    return render_template('novo_emprestimo.html', usuarios=usuarios, livros=livros_disponiveis)
+    # Só as opções pré-selecionadas (links 'emprestar' de outras páginas) são
+    # carregadas; as demais vêm de /api/v1/emprestimos/opcoes
+    usuario_id = request.args.get('usuario_id', type=int)
+    livro_id = request.args.get('livro_id', type=int)
+    usuario = opcoes_usuarios_por_id([usuario_id]) if usuario_id else []
+    livro = opcoes_livros_por_id([livro_id]) if livro_id else []
+    reserva = usuario and livro_id and not livro and reserva_disponivel(usuario_id, livro_id)
+    if reserva:
+        livro = [{'id': livro_id, 'rotulo': f'{reserva.livro.titulo} - {reserva.livro.autor} (reservado)'}]
+    estatisticas = calcular_estatisticas()
+    return render_template(
+        'novo_emprestimo.html',
+        usuario=usuario[0] if usuario else None,
+        livro=livro[0] if livro else None,
+        sem_usuarios=estatisticas is not None and not estatisticas['total_usuarios'],
+        sem_livros=db.session.query(Livro.id).filter(Livro.quantidade_disponivel > 0).first() is None
+    )
 
-@app.route('/emprestimos/<int:emprestimo_id>/devolver', methods=['POST'])
+@biblioteca.route('/emprestimos/<int:emprestimo_id>/devolver', methods=['POST'])
 
 def devolver_livro(emprestimo_id):
     """Devolve um livro emprestado"""
     try:
         emprestimo = Emprestimo.query.get_or_404(emprestimo_id)
         
-        if emprestimo.status != 'ativo':
+        if emprestimo.status not in STATUS_EM_ABERTO or \
+                not executar_com_retentativa(lambda: registrar_devolucao(emprestimo)):
             flash('Empréstimo já foi devolvido', 'error')
             return redirect(url_for('listar_emprestimos'))
         
-        # Atualizar empréstimo
-        emprestimo.status = 'devolvido'
-        emprestimo.data_devolucao_real = datetime.utcnow()
-        
-        # Atualizar quantidade disponível do livro
-        emprestimo.livro.quantidade_disponivel += 1
-        
-        db.session.commit()
+        invalidar_cache(TAG_EMPRESTIMOS, TAG_LIVROS, TAG_RESERVAS)
         
         logger.info(f"Livro devolvido: {emprestimo.livro.titulo}")
         flash('Livro devolvido com sucesso!', 'success')
@@ -396,51 +3180,278 @@ def devolver_livro(emprestimo_id):
     
     return redirect(url_for('listar_emprestimos'))
 
-@app.route('/relatorios')
+@biblioteca.route('/emprestimos/lote', methods=['GET', 'POST'])
+def emprestimos_lote():
+    """Empréstimo ou devolução de vários livros de um usuário de uma vez"""
+    resultados = None
+    if request.method == 'POST':
+        operacao = request.form.get('operacao', 'emprestar')
+        try:
+            usuario_id = int(request.form.get('usuario_id') or 0)
+            itens = ler_itens_lote(request.form.get('livros', '').split())
+            if operacao == 'devolver':
+                resultados = devolver_em_lote(usuario_id, itens)
+            else:
+                resultados = emprestar_em_lote(
+                    usuario_id, itens, ler_dias_emprestimo(request.form.get('dias_emprestimo')))
+            sucessos = sum(1 for resultado in resultados if resultado['ok'])
+            acao = 'devolvido(s)' if operacao == 'devolver' else 'emprestado(s)'
+            flash(f'{sucessos} de {len(resultados)} livro(s) {acao}',
+                  'success' if sucessos == len(resultados) else 'error')
+        except BadRequest as e:
+            flash(e.description, 'error')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro na operação em lote: {e}")
+            flash('Erro ao processar o lote', 'error')
+    
+    return render_template('emprestimos_lote.html', resultados=resultados,
+                           formulario=request.form, maximo_itens=MAXIMO_ITENS_LOTE)
+
+@biblioteca.route('/reservas')
+def listar_reservas():
+    """Reservas por status; filtradas por livro, seguem a ordem da fila"""
+    try:
+        status = request.args.get('status', 'abertas')
+        if status not in FILTROS_RESERVA:
+            status = 'abertas'
+        usuario_id = request.args.get('usuario_id', type=int)
+        livro_id = request.args.get('livro_id', type=int)
+        query = consulta_reservas(status, usuario_id, livro_id)
+        total = contar_em_cache(('reservas', status, usuario_id, livro_id), query.count)
+        if livro_id is not None:
+            pagina = paginar_por_cursor(query, [Reserva.senha], total, por_pagina=20)
+        else:
+            pagina = paginar_por_cursor(query, [Reserva.id], total, por_pagina=20, descendente=True)
+        return render_template(
+            'reservas.html',
+            reservas=pagina.itens,
+            pagina=pagina,
+            posicoes=posicoes_na_fila(pagina.itens),
+            status_selecionado=status,
+            filtros={'usuario_id': usuario_id, 'livro_id': livro_id}
+        )
+    except Exception as e:
+        logger.error(f"Erro ao listar reservas: {e}")
+        flash('Erro ao carregar lista de reservas', 'error')
+        return redirect(url_for('index'))
+
+@biblioteca.route('/reservas/nova', methods=['GET', 'POST'])
+def nova_reserva():
+    """Coloca um usuário na fila de um livro sem exemplar disponível"""
+    if request.method == 'POST':
+        try:
+            usuario_id = int(request.form['usuario_id'])
+            livro_id = int(request.form['livro_id'])
+            
+            reserva, erro = executar_com_retentativa(lambda: registrar_reserva(usuario_id, livro_id))
+            if erro:
+                flash(erro, 'error')
+                return redirect(url_for('nova_reserva', usuario_id=usuario_id, livro_id=livro_id))
+            invalidar_cache(TAG_RESERVAS, TAG_LIVROS)
+            
+            logger.info(f"Reserva criada: livro {livro_id} para o usuário {usuario_id}, senha {reserva.senha}")
+            if reserva.status == 'disponivel':
+                flash(f"Exemplar separado para a reserva: retire até {reserva.expira_em.strftime('%d/%m/%Y')}", 'success')
+            else:
+                posicao, tamanho = posicoes_na_fila([reserva])[reserva.id]
+                flash(f'Reserva registrada: posição {posicao} de {tamanho} na fila', 'success')
+            return redirect(url_for('listar_reservas', livro_id=livro_id))
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao registrar reserva: {e}")
+            flash('Erro ao registrar reserva', 'error')
+            return redirect(url_for('nova_reserva'))
+    
+    usuario_id = request.args.get('usuario_id', type=int)
+    livro_id = request.args.get('livro_id', type=int)
+    usuario = opcoes_usuarios_por_id([usuario_id]) if usuario_id else []
+    livro = opcoes_livros_por_id([livro_id], somente_disponiveis=False) if livro_id else []
+    return render_template(
+        'nova_reserva.html',
+        usuario=usuario[0] if usuario else None,
+        livro=livro[0] if livro else None,
+        prazo_retirada=current_app.config['PRAZO_RETIRADA_RESERVA_DIAS']
+    )
+
+@biblioteca.route('/reservas/<int:reserva_id>/cancelar', methods=['POST'])
+def cancelar_reserva_rota(reserva_id):
+    """Cancela uma reserva aberta"""
+    try:
+        reserva = db.get_or_404(Reserva, reserva_id)
+        if not executar_com_retentativa(lambda: cancelar_reserva(reserva)):
+            flash('Reserva já foi encerrada', 'error')
+            return redirect(url_for('listar_reservas'))
+        
+        invalidar_cache(TAG_RESERVAS, TAG_LIVROS)
+        
+        logger.info(f"Reserva cancelada: {reserva_id}")
+        flash('Reserva cancelada', 'success')
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao cancelar reserva: {e}")
+        flash('Erro ao cancelar reserva', 'error')
+    
+    return redirect(url_for('listar_reservas'))
+
+@biblioteca.route('/relatorios')
+@pagina_em_cache(TAG_LIVROS, TAG_USUARIOS, TAG_EMPRESTIMOS, TAG_RELATORIOS)
 def relatorios():
-    """Página de relatórios - FUNCIONALIDADE 3"""
+    """Página de relatórios - FUNCIONALIDADE 3 (lê os snapshots padrão)"""
     try:
         estatisticas = calcular_estatisticas()
         
-        livros_populares_rows = db.session.query(
-            Livro.titulo,
-            Livro.autor,
-            Livro.quantidade_disponivel,
-            db.func.count(Emprestimo.id).label('total_emprestimos')
-        ).join(Emprestimo).group_by(Livro.id).order_by(
-            db.func.count(Emprestimo.id).desc()
-        ).limit(10).all()
-
-        livros_populares = [
-            {
-                'titulo': row.titulo,
-                'autor': row.autor,
-                'total_emprestimos': row.total_emprestimos,
-                'disponivel': (row.quantidade_disponivel or 0) > 0,
-            }
-            for row in livros_populares_rows
-        ]
-
-        emprestimos_mensais = db.session.query(
-            db.func.strftime('%Y-%m', Emprestimo.data_emprestimo).label('mes'),
-            db.func.count(Emprestimo.id).label('total')
-        ).filter(
-            Emprestimo.data_emprestimo >= datetime.utcnow() - timedelta(days=180)
-        ).group_by('mes').order_by('mes').all()
+        livros_populares, pedido_populares, atualizacao_populares = relatorio_padrao('populares')
+        emprestimos_mensais, pedido_mensal, atualizacao_mensal = relatorio_padrao('mensal')
+        gerados_em = [p.concluido_em for p in (pedido_populares, pedido_mensal) if p]
+        atualizacoes = [p.id for p in (atualizacao_populares, atualizacao_mensal) if p]
+        # Com atualização em andamento a página não vai para o cache: o pedido
+        # pode terminar (e invalidar a tag) antes de ela ser guardada
+        g.pagina_provisoria = bool(atualizacoes)
         
         return render_template(
             'relatorios.html',
             estatisticas=estatisticas,
             livros_populares=livros_populares,
-            emprestimos_mensais=emprestimos_mensais
+            emprestimos_mensais=emprestimos_mensais,
+            gerado_em=min(gerados_em) if gerados_em else None,
+            atualizacoes=atualizacoes
         )
     except Exception as e:
         logger.error(f"Erro ao gerar relatórios: {e}")
         flash('Erro ao gerar relatórios', 'error')
         return redirect(url_for('index'))
 
+@biblioteca.route('/relatorios/pedidos', methods=['GET', 'POST'])
+def pedidos_relatorio():
+    """Solicita relatórios personalizados e lista os pedidos recentes"""
+    if request.method == 'POST':
+        tipo = request.form.get('tipo', '')
+        try:
+            pedido = solicitar_relatorio(
+                tipo, normalizar_parametros_relatorio(tipo, request.form))
+            flash(f'Relatório #{pedido.id} solicitado', 'success')
+            return redirect(url_for('ver_pedido_relatorio', pedido_id=pedido.id))
+        except BadRequest as e:
+            flash(e.description, 'error')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao solicitar relatório: {e}")
+            flash('Erro ao solicitar relatório', 'error')
+    
+    pedidos = PedidoRelatorio.query.order_by(PedidoRelatorio.id.desc()).limit(50).all()
+    return render_template(
+        'relatorios_pedidos.html',
+        pedidos=pedidos,
+        parametros={pedido.id: json.loads(pedido.parametros) for pedido in pedidos},
+        tipos=TIPOS_RELATORIO,
+        categorias=listar_categorias(),
+        em_andamento=[p.id for p in pedidos if p.status in STATUS_RELATORIO_EM_ANDAMENTO],
+        formulario=request.form
+    )
+
+@biblioteca.route('/relatorios/pedidos/<int:pedido_id>')
+def ver_pedido_relatorio(pedido_id):
+    """Situação de um pedido e prévia do resultado"""
+    pedido = db.get_or_404(PedidoRelatorio, pedido_id)
+    colunas, linhas = previa_snapshot(pedido) if pedido.status == 'concluido' else ([], [])
+    return render_template(
+        'relatorio_pedido.html',
+        pedido=pedido,
+        parametros=json.loads(pedido.parametros),
+        tipos=TIPOS_RELATORIO,
+        colunas=colunas,
+        linhas=linhas,
+        em_andamento=pedido.status in STATUS_RELATORIO_EM_ANDAMENTO
+    )
+
+@biblioteca.route('/relatorios/pedidos/<int:pedido_id>/arquivo')
+def baixar_relatorio(pedido_id):
+    """Snapshot de um pedido concluído em CSV ou JSON"""
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_RELATORIO:
+        raise BadRequest("Formato deve ser 'csv' ou 'json'")
+    pedido = db.get_or_404(PedidoRelatorio, pedido_id)
+    caminho = caminho_snapshot(pedido.id, formato)
+    if pedido.status != 'concluido' or not os.path.exists(caminho):
+        return render_template('404.html'), 404
+    return send_file(
+        caminho,
+        mimetype='text/csv' if formato == 'csv' else 'application/json',
+        as_attachment=True,
+        download_name=f'relatorio-{pedido.tipo}-{pedido.id}.{formato}'
+    )
+
+
+@biblioteca.route('/exportar/<tipo>')
+@leitura_na_replica
+def exportar(tipo):
+    """Exporta livros, usuários ou empréstimos em CSV/JSON, em streaming"""
+    if tipo not in TIPOS_EXPORTACAO:
+        return render_template('404.html'), 404
+    
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'json'):
+        raise BadRequest("Formato deve ser 'csv' ou 'json'")
+    desde = ler_data_parametro(request.args.get('desde'), 'desde')
+    ate = ler_data_parametro(request.args.get('ate'), 'ate')
+    
+    pedacos = gerar_exportacao(tipo, formato, desde, ate)
+    cabecalhos = {
+        'Content-Disposition':
+            f'attachment; filename={tipo}-{datetime.utcnow():%Y%m%d}.{formato}',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        pedacos = compactar_gzip(pedacos)
+        cabecalhos['Content-Encoding'] = 'gzip'
+    
+    logger.info(f"Exportação iniciada: {tipo} ({formato})")
+    tipo_conteudo = 'text/csv' if formato == 'csv' else 'application/json'
+    return Response(stream_with_context(pedacos),
+                    mimetype=tipo_conteudo, headers=cabecalhos)
+
+@biblioteca.route('/metrics')
+def metricas_prometheus():
+    """Métricas por endpoint, cache, autocompletar e tarefas no formato do Prometheus"""
+    dados_cache = cache.metricas()
+    situacao_fila = fila_relatorios.situacao()
+    extras = [
+        ('cache_eventos_total', 'counter', 'Eventos do cache local de páginas e consultas',
+         [({'evento': nome}, dados_cache[nome])
+          for nome in ('acertos', 'falhas', 'despejos', 'expirados', 'invalidados')]),
+        ('cache_itens', 'gauge', 'Itens no cache local', [({}, dados_cache['itens'])]),
+        ('autocompletar_entradas', 'gauge', 'Entradas no índice de autocompletar',
+         [({}, len(sugestoes))]),
+        ('autocompletar_descartadas', 'gauge', 'Entradas que não couberam em AUTOCOMPLETAR_MAX_ENTRADAS',
+         [({}, sugestoes.descartadas)]),
+        ('tarefa_execucoes_total', 'counter', 'Execuções das tarefas de fundo neste processo',
+         [({'tarefa': nome, 'resultado': resultado}, dados[chave])
+          for nome, dados in agendador.situacao().items()
+          for resultado, chave in (('ok', 'execucoes'), ('falha', 'falhas'))]),
+        ('leituras_roteadas_total', 'counter',
+         'Decisões de roteamento das rotas de leitura (replica = leitura feita na réplica)',
+         [({'motivo': motivo}, total) for motivo, total in sorted(leituras_roteadas.items())]),
+        ('replica_atraso_segundos', 'gauge', 'Idade da última sincronização da réplica vista por este processo',
+         [({}, round(time.time() - marcador_replica['valor'], 1))] if marcador_replica['valor'] else []),
+        ('relatorios_pendentes', 'gauge', 'Relatórios na fila ou em geração neste processo',
+         [({}, situacao_fila['pendentes'])]),
+        ('relatorios_gerados_total', 'counter', 'Relatórios processados pelo pool deste processo',
+         [({'resultado': 'ok'}, situacao_fila['concluidos']),
+          ({'resultado': 'falha'}, situacao_fila['falhas'])]),
+    ]
+    return Response(metricas.exportar(extras), mimetype='text/plain; version=0.0.4')
+
+@biblioteca.route('/cache/metricas')
+def metricas_cache():
+    """Acertos, falhas, despejos e invalidações do cache"""
+    return jsonify(cache.metricas())
 
-@app.route('/busca')
+@biblioteca.route('/busca')
+@leitura_na_replica
+@pagina_em_cache(TAG_LIVROS, TAG_USUARIOS, TAG_EMPRESTIMOS)
 def busca_avancada():
     """BUSCA AVANÇADA"""
     try:
@@ -454,44 +3465,29 @@ def busca_avancada():
 
         if termo:
             if tipo == 'livros' or tipo == 'todos':
-                query = Livro.query
-
-                if termo:
-                    query = query.filter(
-                        db.or_(
-                            Livro.titulo.contains(termo),
-                            Livro.autor.contains(termo),
-                            Livro.isbn.contains(termo)
-                        )
-                    )
-
-                if categoria:
-                    query = query.filter(Livro.categoria == categoria)
-
-                if ano_min:
-                    query = query.filter(Livro.ano_publicacao >= int(ano_min))
-
-                if ano_max:
-                    query = query.filter(Livro.ano_publicacao <= int(ano_max))
+                query = consulta_livros(
+                    termo, categoria,
+                    int(ano_min) if ano_min else None,
+                    int(ano_max) if ano_max else None
+                )
                 
                 livros = query.all()
                 resultados.extend([('livro', livro) for livro in livros])
 
             if tipo == 'usuarios' or tipo == 'todos':
-                usuarios = Usuario.query.filter(
-                    db.or_(
-                        Usuario.nome.contains(termo),
-                        Usuario.email.contains(termo)
-                    )
-                ).all()
+                usuarios = consulta_usuarios(termo).all()
                 resultados.extend([('usuario', usuario) for usuario in usuarios])
 
-        categorias = db.session.query(Livro.categoria).distinct().all()
-        categorias = [cat[0] for cat in categorias]
+        categorias = listar_categorias()
+
+        emprestimos_ativos_por_usuario = contar_emprestimos_ativos(
+            item.id for tipo_resultado, item in resultados if tipo_resultado == 'usuario'
+        )
 
         return render_template(
             'busca.html',
             resultados=resultados,
+            emprestimos_ativos_por_usuario=emprestimos_ativos_por_usuario,
             categorias=categorias,
             termo=termo,
             tipo=tipo,
@@ -506,48 +3502,677 @@ def busca_avancada():
         return redirect(url_for('index'))
 
 
+# API JSON (v1) ---
+# Mesmas consultas e paginação das páginas HTML, serializadas em JSON. As
+# listas aceitam `campos` (seleção de campos), `limite` e os cursores
+# `apos`/`antes`; as respostas passam pelo cache de páginas e portanto
+# suportam ETag/Last-Modified (304 para clientes que fazem polling).
+LIMITE_API_PADRAO = 20
+LIMITE_API_MAXIMO = 100
+
+CAMPOS_API = {
+    'livros': ['id', 'titulo', 'autor', 'isbn', 'ano_publicacao', 'categoria',
+               'quantidade_total', 'quantidade_disponivel', 'data_cadastro'],
+    'usuarios': ['id', 'nome', 'email', 'telefone', 'data_cadastro'],
+    'emprestimos': ['id', 'usuario_id', 'livro_id', 'data_emprestimo',
+                    'data_devolucao_prevista', 'data_devolucao_real', 'status',
+                    'usuario', 'livro'],
+}
+
+
+def ler_campos_api(tipo):
+    """Lista de campos pedida em `campos` (todos se ausente); BadRequest se inválida"""
+    pedidos = request.args.get('campos', '')
+    if not pedidos:
+        return CAMPOS_API[tipo]
+    campos = [campo.strip() for campo in pedidos.split(',') if campo.strip()]
+    invalidos = [campo for campo in campos if campo not in CAMPOS_API[tipo]]
+    if invalidos:
+        raise BadRequest(f"Campos inválidos: {', '.join(invalidos)}")
+    return campos
+
+
+def ler_inteiro_api(nome, padrao=None):
+    valor = request.args.get(nome, '')
+    if not valor:
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        raise BadRequest(f"Parâmetro '{nome}' deve ser um número inteiro")
+
+
+def ler_limite_api():
+    limite = ler_inteiro_api('limite', LIMITE_API_PADRAO)
+    if not 1 <= limite <= LIMITE_API_MAXIMO:
+        raise BadRequest(f"Parâmetro 'limite' deve estar entre 1 e {LIMITE_API_MAXIMO}")
+    return limite
+
+
+def para_dict(objeto, campos):
+    """Serializa as colunas pedidas; 'usuario'/'livro' viram objetos aninhados"""
+    dados = {}
+    for campo in campos:
+        if campo == 'usuario':
+            dados[campo] = para_dict(objeto.usuario, ['id', 'nome', 'email'])
+        elif campo == 'livro':
+            dados[campo] = para_dict(objeto.livro, ['id', 'titulo', 'autor', 'isbn'])
+        else:
+            dados[campo] = serializar_valor(getattr(objeto, campo))
+    return dados
+
+
+def resposta_lista_api(tipo, pagina):
+    """Envelope padrão das listas: itens, total e links das páginas vizinhas"""
+    campos = ler_campos_api(tipo)
+    base = request.args.to_dict()
+    for parametro in ('apos', 'antes', 'pagina'):
+        base.pop(parametro, None)
+
+    def link(args):
+        if args is None:
+            return None
+        return url_for(request.endpoint, **base, **args)
+
+    return jsonify({
+        'itens': [para_dict(item, campos) for item in pagina.itens],
+        'paginacao': {
+            'pagina': pagina.numero,
+            'paginas': pagina.paginas,
+            'por_pagina': pagina.por_pagina,
+            'total': pagina.total,
+            'anterior': link(pagina.args_anterior),
+            'proxima': link(pagina.args_proxima),
+        },
+    })
+
+
+@biblioteca.errorhandler(BadRequest)
+def requisicao_invalida(erro):
+    if request.path.startswith('/api/'):
+        return jsonify({'erro': erro.description}), 400
+    return erro
+
+
+@biblioteca.route('/api/v1/livros')
+@leitura_na_replica
+@pagina_em_cache(TAG_LIVROS, TAG_EMPRESTIMOS)
+def api_listar_livros():
+    """Livros com os filtros da busca avançada: q, categoria, ano_min, ano_max"""
+    pagina = paginar_livros(
+        request.args.get('q', '').strip(),
+        request.args.get('categoria', ''),
+        ler_inteiro_api('ano_min'),
+        ler_inteiro_api('ano_max'),
+        por_pagina=ler_limite_api()
+    )
+    return resposta_lista_api('livros', pagina)
+
+
+@biblioteca.route('/api/v1/livros/<int:livro_id>')
+@pagina_em_cache(TAG_LIVROS, TAG_EMPRESTIMOS)
+def api_obter_livro(livro_id):
+    livro = db.get_or_404(Livro, livro_id)
+    return jsonify(para_dict(livro, ler_campos_api('livros')))
+
+
+@biblioteca.route('/api/v1/usuarios')
+@leitura_na_replica
+@pagina_em_cache(TAG_USUARIOS)
+def api_listar_usuarios():
+    """Usuários, com busca opcional por nome/email em `q`"""
+    termo = request.args.get('q', '').strip()
+    query = consulta_usuarios(termo)
+    total = contar_em_cache(('usuarios', termo), query.count)
+    if termo:
+        pagina = paginar_por_deslocamento(query, total, ler_limite_api())
+    else:
+        pagina = paginar_por_cursor(query, [Usuario.id], total, ler_limite_api())
+    return resposta_lista_api('usuarios', pagina)
+
+
+@biblioteca.route('/api/v1/usuarios/<int:usuario_id>')
+@pagina_em_cache(TAG_USUARIOS)
+def api_obter_usuario(usuario_id):
+    usuario = db.get_or_404(Usuario, usuario_id)
+    return jsonify(para_dict(usuario, ler_campos_api('usuarios')))
+
+
+@biblioteca.route('/api/v1/emprestimos')
+@leitura_na_replica
+@pagina_em_cache(TAG_EMPRESTIMOS, TAG_LIVROS, TAG_USUARIOS)
+def api_listar_emprestimos():
+    """Empréstimos mais recentes primeiro; filtros: status, usuario_id, livro_id"""
+    status = request.args.get('status', 'todos')
+    usuario_id = ler_inteiro_api('usuario_id')
+    livro_id = ler_inteiro_api('livro_id')
+    query = consulta_emprestimos(status, usuario_id, livro_id)
+    if usuario_id is None and livro_id is None:
+        total = estatisticas_emprestimos(status)['total']
+    else:
+        total = contar_em_cache(('emprestimos', status, usuario_id, livro_id), query.count)
+    pagina = paginar_por_cursor(
+        query, [Emprestimo.data_emprestimo, Emprestimo.id], total,
+        por_pagina=ler_limite_api(), descendente=True
+    )
+    return resposta_lista_api('emprestimos', pagina)
+
+
+@biblioteca.route('/api/v1/emprestimos/<int:emprestimo_id>')
+@pagina_em_cache(TAG_EMPRESTIMOS, TAG_LIVROS, TAG_USUARIOS)
+def api_obter_emprestimo(emprestimo_id):
+    emprestimo = db.get_or_404(Emprestimo, emprestimo_id)
+    return jsonify(para_dict(emprestimo, ler_campos_api('emprestimos')))
+
+
+def ler_pedido_lote():
+    """Usuário e livros de um JSON {"usuario_id": 1, "livros": [id ou ISBN, ...]}"""
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict) or not isinstance(dados.get('livros'), list):
+        raise BadRequest("Envie um JSON com 'usuario_id' e a lista 'livros'")
+    try:
+        usuario_id = int(dados.get('usuario_id'))
+    except (TypeError, ValueError):
+        raise BadRequest("'usuario_id' deve ser um número inteiro")
+    return dados, usuario_id, ler_itens_lote(dados['livros'])
+
+
+def resposta_lote(resultados):
+    sucessos = sum(1 for resultado in resultados if resultado['ok'])
+    return jsonify({
+        'resultados': resultados,
+        'sucessos': sucessos,
+        'falhas': len(resultados) - sucessos,
+    })
+
+
+@biblioteca.route('/api/v1/emprestimos/lote', methods=['POST'])
+def api_emprestar_lote():
+    """Empresta vários livros a um usuário numa transação; resultado por item"""
+    dados, usuario_id, itens = ler_pedido_lote()
+    dias_emprestimo = ler_dias_emprestimo(dados.get('dias_emprestimo'))
+    return resposta_lote(emprestar_em_lote(usuario_id, itens, dias_emprestimo))
+
+
+@biblioteca.route('/api/v1/devolucoes/lote', methods=['POST'])
+def api_devolver_lote():
+    """Devolve vários livros de um usuário numa transação; resultado por item"""
+    _, usuario_id, itens = ler_pedido_lote()
+    return resposta_lote(devolver_em_lote(usuario_id, itens))
+
+
+@biblioteca.route('/api/v1/estatisticas')
+@pagina_em_cache(TAG_LIVROS, TAG_USUARIOS, TAG_EMPRESTIMOS)
+def api_estatisticas():
+    """Totais do painel inicial"""
+    estatisticas = calcular_estatisticas()
+    if estatisticas is None:
+        return jsonify({'erro': 'Erro ao calcular estatísticas'}), 500
+    return jsonify(estatisticas)
+
+
+@biblioteca.route('/api/v1/autocompletar')
+def api_autocompletar():
+    """Sugestões por prefixo (títulos, autores, ISBNs, nomes) servidas da memória"""
+    termo = request.args.get('q', '').strip()
+    tipo = request.args.get('tipo', 'todos')
+    if tipo not in TIPOS_AUTOCOMPLETAR:
+        raise BadRequest(f"Tipo deve ser um de: {', '.join(TIPOS_AUTOCOMPLETAR)}")
+    limite = ler_inteiro_api('limite', 10)
+    if not 1 <= limite <= 50:
+        raise BadRequest("Parâmetro 'limite' deve estar entre 1 e 50")
+    return jsonify({
+        'sugestoes': sugestoes.buscar(termo, TIPOS_AUTOCOMPLETAR[tipo], limite)
+    })
+
+
+@biblioteca.route('/api/v1/emprestimos/opcoes')
+def api_opcoes_emprestimo():
+    """Usuários, livros disponíveis ou todo o acervo para os formulários de empréstimo e reserva"""
+    termo = request.args.get('q', '').strip()
+    tipo = request.args.get('tipo', '')
+    buscas = {'usuarios': opcoes_usuarios, 'livros': opcoes_livros, 'acervo': opcoes_acervo}
+    if tipo not in buscas:
+        raise BadRequest(f"Tipo deve ser um de: {', '.join(buscas)}")
+    limite = ler_inteiro_api('limite', LIMITE_OPCOES_EMPRESTIMO)
+    if not 1 <= limite <= 50:
+        raise BadRequest("Parâmetro 'limite' deve estar entre 1 e 50")
+    return jsonify({'opcoes': buscas[tipo](termo, limite) if termo else []})
+
+
+@biblioteca.route('/api/v1/relatorios', methods=['POST'])
+def api_solicitar_relatorio():
+    """Enfileira um relatório (JSON ou formulário); 202 com o link de situação"""
+    dados = request.get_json(silent=True) or request.form
+    tipo = str(dados.get('tipo', ''))
+    pedido = solicitar_relatorio(tipo, normalizar_parametros_relatorio(tipo, dados))
+    local = url_for('api_situacao_relatorio', pedido_id=pedido.id)
+    return jsonify(situacao_relatorio(pedido)), 202, {'Location': local}
+
+
+@biblioteca.route('/api/v1/relatorios/<int:pedido_id>')
+def api_situacao_relatorio(pedido_id):
+    """Situação de um pedido de relatório (usada pelo polling das páginas)"""
+    return jsonify(situacao_relatorio(db.get_or_404(PedidoRelatorio, pedido_id)))
+
+
+@biblioteca.route('/api/v1/reservas', methods=['POST'])
+def api_criar_reserva():
+    """Entra na fila de um livro sem exemplar; 201 com a posição na fila"""
+    dados = request.get_json(silent=True) or request.form
+    try:
+        usuario_id = int(dados.get('usuario_id'))
+        livro_id = int(dados.get('livro_id'))
+    except (TypeError, ValueError):
+        raise BadRequest("'usuario_id' e 'livro_id' devem ser números inteiros")
+    reserva, erro = executar_com_retentativa(lambda: registrar_reserva(usuario_id, livro_id))
+    if erro:
+        raise BadRequest(erro)
+    invalidar_cache(TAG_RESERVAS, TAG_LIVROS)
+    local = url_for('api_situacao_reserva', reserva_id=reserva.id)
+    return jsonify(situacao_reserva(reserva)), 201, {'Location': local}
+
+
+@biblioteca.route('/api/v1/reservas/<int:reserva_id>')
+def api_situacao_reserva(reserva_id):
+    """Situação e posição na fila de uma reserva"""
+    return jsonify(situacao_reserva(db.get_or_404(Reserva, reserva_id)))
+
+
+@biblioteca.route('/api/v1/reservas/<int:reserva_id>/cancelar', methods=['POST'])
+def api_cancelar_reserva(reserva_id):
+    """Cancela uma reserva aberta; 400 se ela já estava encerrada"""
+    reserva = db.get_or_404(Reserva, reserva_id)
+    if not executar_com_retentativa(lambda: cancelar_reserva(reserva)):
+        raise BadRequest('Reserva já foi encerrada')
+    invalidar_cache(TAG_RESERVAS, TAG_LIVROS)
+    db.session.refresh(reserva)
+    return jsonify(situacao_reserva(reserva))
+
+
 # Tratamento de erros e inicialização de Banco de dados ---
-@app.errorhandler(404)
+@biblioteca.errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'erro': 'Recurso não encontrado'}), 404
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@biblioteca.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
+    if request.path.startswith('/api/'):
+        return jsonify({'erro': 'Erro interno'}), 500
     return render_template('500.html'), 500
 
+# Migrações de schema ---
+# create_all() só cria tabelas que ainda não existem; mudanças em tabelas já
+# existentes (como índices novos) entram aqui como migrações numeradas, que
+# são aplicadas uma única vez e registradas em 'versao_schema'.
+MIGRACOES = []
+
+
+def migracao(versao, descricao):
+    """Registra a função decorada como a migração `versao`"""
+    def registrar(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        return funcao
+    return registrar
+
+
+@migracao(1, 'Índices compostos para os filtros de empréstimos e livros')
+def migracao_indices_consultas():
+    conexao = db.session.connection()
+    for modelo in (Livro, Usuario, Emprestimo, EmprestimosPorLivro):
+        for indice in modelo.__table__.indexes:
+            indice.create(bind=conexao, checkfirst=True)
+
+
+@migracao(2, 'Preenchimento dos agregados de relatórios')
+def migracao_agregados_relatorios():
+    reconstruir_agregados()
+
+
+@migracao(3, "Empréstimos vencidos passam a ter status 'atrasado'")
+def migracao_status_atrasado():
+    marcar_atrasados()
+    reconstruir_contadores()
+
+
+@migracao(4, 'Índice parcial dos livros com exemplar disponível')
+def migracao_indice_disponiveis():
+    for indice in Livro.__table__.indexes:
+        if indice.name == 'ix_livro_disponivel':
+            indice.create(bind=db.session.connection(), checkfirst=True)
+
+
+@migracao(5, 'Um único pedido de relatório em andamento por tipo e parâmetros')
+def migracao_pedido_relatorio_unico():
+    # Duplicados criados antes do índice: fica o mais recente de cada relatório
+    em_andamento = PedidoRelatorio.status.in_(STATUS_RELATORIO_EM_ANDAMENTO)
+    mais_recentes = db.select(db.func.max(PedidoRelatorio.id)).where(em_andamento) \
+        .group_by(PedidoRelatorio.tipo, PedidoRelatorio.parametros)
+    db.session.execute(
+        db.update(PedidoRelatorio)
+        .where(em_andamento, PedidoRelatorio.id.notin_(mais_recentes))
+        .values(status='erro', erro='Pedido duplicado', concluido_em=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    for indice in PedidoRelatorio.__table__.indexes:
+        if indice.name == 'uq_pedido_relatorio_em_andamento':
+            indice.create(bind=db.session.connection(), checkfirst=True)
+
+
+@migracao(6, 'Uma única reserva em aberto por usuário e livro')
+def migracao_reserva_aberta_unica():
+    # Duplicadas criadas antes do índice: fica a com exemplar separado ou, entre
+    # as que aguardam, a de menor senha; as demais são canceladas
+    aberta = Reserva.status.in_(STATUS_RESERVA_ABERTA)
+    duplicadas = db.session.query(Reserva.usuario_id, Reserva.livro_id).filter(aberta) \
+        .group_by(Reserva.usuario_id, Reserva.livro_id).having(db.func.count(Reserva.id) > 1).all()
+    for usuario_id, livro_id in duplicadas:
+        reservas = Reserva.query.filter(
+            Reserva.usuario_id == usuario_id, Reserva.livro_id == livro_id, aberta
+        ).order_by(Reserva.status.desc(), Reserva.senha).all()
+        for reserva in reservas[1:]:
+            cancelar_reserva(reserva)
+    for indice in Reserva.__table__.indexes:
+        if indice.name == 'uq_reserva_usuario_livro_aberta':
+            indice.create(bind=db.session.connection(), checkfirst=True)
+
+
+def aplicar_migracoes():
+    """Cria tabelas novas e aplica, em ordem, as migrações pendentes"""
+    # Só o primário: a réplica recebe o schema pela cópia ou pela replicação
+    db.create_all(bind_key=None)
+    aplicadas = {versao for (versao,) in db.session.query(VersaoSchema.versao)}
+    
+    novas = []
+    for versao, descricao, funcao in sorted(MIGRACOES, key=lambda m: m[0]):
+        if versao in aplicadas:
+            continue
+        inicio = time.perf_counter()
+        funcao()
+        db.session.add(VersaoSchema(versao=versao, descricao=descricao))
+        db.session.commit()
+        logger.info(f"Migração {versao} aplicada em {time.perf_counter() - inicio:.2f}s: {descricao}")
+        novas.append(versao)
+    return novas
+
+def migracoes_pendentes():
+    """Versões de MIGRACOES ainda não registradas no banco (todas, se não há schema)"""
+    esperadas = {versao for versao, _, _ in MIGRACOES}
+    try:
+        aplicadas = {versao for (versao,) in db.session.query(VersaoSchema.versao)}
+    except OperationalError:
+        db.session.rollback()
+        return sorted(esperadas)
+    return sorted(esperadas - aplicadas)
+
+
+def semear_dados_exemplo():
+    """Inclui livros e usuários de exemplo se o banco não tem livros; devolve se incluiu"""
+    if db.session.query(Livro.id).limit(1).scalar() is not None:
+        return False
+    
+    livros_exemplo = [
+        Livro(titulo="Python para Iniciantes", autor="João Silva", 
+              isbn="9781234567890", ano_publicacao=2023, categoria="Programação",
+              quantidade_total=3, quantidade_disponivel=3),
+        Livro(titulo="Algoritmos e Estruturas de Dados", autor="Maria Santos", 
+              isbn="9781234567891", ano_publicacao=2022, categoria="Programação",
+              quantidade_total=2, quantidade_disponivel=2),
+        Livro(titulo="História do Brasil", autor="Pedro Oliveira", 
+              isbn="9781234567892", ano_publicacao=2021, categoria="História",
+              quantidade_total=1, quantidade_disponivel=1),
+    ]
+    
+    usuarios_exemplo = [
+        Usuario(nome="Ana Costa", email="ana@email.com", telefone="11999999999"),
+        Usuario(nome="Carlos Lima", email="carlos@email.com", telefone="11888888888"),
+    ]
+    
+    db.session.add_all(livros_exemplo + usuarios_exemplo)
+    db.session.commit()
+    return True
+
+
 def criar_tabelas():
-    """Cria as tabelas do banco de dados"""
-    with app.app_context():
-        db.create_all()
+    """
+    Prepara o banco: schema e migrações, índice de busca, dados de exemplo e
+    contadores. Roda uma vez por implantação (`flask inicializar-banco`), não
+    a cada processo
+    """
+    with aplicacao_atual().app_context():
+        aplicar_migracoes()
+        criar_indice_busca()
         
-        if Livro.query.count() == 0:
-            livros_exemplo = [
-                Livro(titulo="Python para Iniciantes", autor="João Silva", 
-                      isbn="9781234567890", ano_publicacao=2023, categoria="Programação",
-                      quantidade_total=3, quantidade_disponivel=3),
-                Livro(titulo="Algoritmos e Estruturas de Dados", autor="Maria Santos", 
-                      isbn="9781234567891", ano_publicacao=2022, categoria="Programação",
-                      quantidade_total=2, quantidade_disponivel=2),
-                Livro(titulo="História do Brasil", autor="Pedro Oliveira", 
-                      isbn="9781234567892", ano_publicacao=2021, categoria="História",
-                      quantidade_total=1, quantidade_disponivel=1),
-            ]
-            
-            usuarios_exemplo = [
-                Usuario(nome="Ana Costa", email="ana@email.com", telefone="11999999999"),
-                Usuario(nome="Carlos Lima", email="carlos@email.com", telefone="11888888888"),
-            ]
-            
-            for livro in livros_exemplo:
-                db.session.add(livro)
-            
-            for usuario in usuarios_exemplo:
-                db.session.add(usuario)
-            
-            db.session.commit()
+        if semear_dados_exemplo():
             logger.info("Dados de exemplo adicionados ao banco")
+        
+        reconstruir_contadores()
+        db.session.commit()
 
-if __name__ == '__main__':
+
+# Inicialização do processo ---
+# Importar app.py só monta a aplicação; o banco é preparado à parte por
+# criar_tabelas. Na primeira requisição, cada processo (ex.: worker do
+# gunicorn) confere se o banco tem todas as migrações e carrega, numa thread,
+# o índice de autocompletar. Enquanto isso as requisições são atendidas
+# normalmente: o autocompletar responde sem sugestões e as opções de livro
+# vêm só da busca FTS.
+# Cadastros feitos durante a carga do autocompletar só aparecem nele após a
+# próxima recarga (reinício ou importação grande). Se o aquecimento falha, a
+# aplicação volta a ser "não preparada" e a próxima requisição tenta de novo.
+_lock_preparo = threading.Lock()
+
+
+def aquecer_processo(aplicacao=None):
+    """Carrega as estruturas em memória do processo (índice de autocompletar)"""
+    aplicacao = aplicacao or aplicacao_atual()
+    inicio = time.perf_counter()
+    with aplicacao.app_context():
+        try:
+            carregar_autocompletar()
+        except Exception as e:
+            logger.error(f"Erro ao aquecer o processo; nova tentativa na próxima requisição: {e}")
+            with _lock_preparo:
+                aplicacao.extensions['biblioteca']['preparada'] = False
+            return False
+    logger.info(f"Processo aquecido em {time.perf_counter() - inicio:.2f}s")
+    return True
+
+
+def preparar_processo(em_segundo_plano=True):
+    """Confere o schema e inicia o aquecimento, uma única vez por aplicação"""
+    aplicacao = aplicacao_atual()
+    estado = aplicacao.extensions['biblioteca']
+    with _lock_preparo:
+        if estado['preparada']:
+            return
+        estado['preparada'] = True
+    
+    with aplicacao.app_context():
+        pendentes = migracoes_pendentes()
+    if pendentes:
+        logger.error(f"Banco sem as migrações {', '.join(map(str, pendentes))}; "
+                     f"rode `flask --app app inicializar-banco`")
+    if em_segundo_plano:
+        threading.Thread(target=aquecer_processo, args=(aplicacao,),
+                         name='aquecimento', daemon=True).start()
+    else:
+        aquecer_processo(aplicacao)
+
+
+@biblioteca.before_request
+def preparar_na_primeira_requisicao():
+    if not current_app.extensions['biblioteca']['preparada']:
+        preparar_processo()
+
+@biblioteca.cli.command('importar-livros')
+@click.argument('caminho', type=click.Path(exists=True, dir_okay=False))
+@click.option('--formato', type=click.Choice(['csv', 'json']), default=None,
+              help='Formato do arquivo (padrão: deduzido pela extensão)')
+@click.option('--lote', default=TAMANHO_LOTE_IMPORTACAO, show_default=True,
+              help='Quantidade de registros por transação')
+def importar_livros_comando(caminho, formato, lote):
+    """Importa livros de um arquivo CSV, JSON ou JSON Lines"""
+    inicio = time.perf_counter()
+    
+    def progresso(resumo):
+        decorrido = time.perf_counter() - inicio
+        print(f"{resumo['processados']} processado(s), {resumo['importados']} importado(s), "
+              f"{resumo['rejeitados']} rejeitado(s) - {resumo['processados'] / decorrido:.0f} registros/s")
+    
+    def erro(linha, mensagem):
+        print(f"registro {linha}: {mensagem}", file=sys.stderr)
+    
+    with open(caminho, 'rb') as arquivo:
+        resumo = importar_livros(
+            abrir_registros(arquivo, formato or formato_do_arquivo(caminho)),
+            tamanho_lote=lote, ao_progredir=progresso, ao_errar=erro
+        )
+    print(f"Concluído em {time.perf_counter() - inicio:.1f}s: "
+          f"{resumo['importados']} importado(s), {resumo['rejeitados']} rejeitado(s)")
+
+@biblioteca.cli.command('exportar')
+@click.argument('tipo', type=click.Choice(TIPOS_EXPORTACAO))
+@click.option('--formato', type=click.Choice(['csv', 'json']), default='csv', show_default=True)
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Data inicial (AAAA-MM-DD)')
+@click.option('--ate', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Data final, inclusiva (AAAA-MM-DD)')
+@click.option('--saida', type=click.Path(dir_okay=False), default=None,
+              help='Arquivo de destino (padrão: saída padrão)')
+@click.option('--gzip', 'compactar', is_flag=True, help='Compacta a saída em gzip')
+def exportar_comando(tipo, formato, desde, ate, saida, compactar):
+    """Exporta livros, usuários ou empréstimos em CSV/JSON"""
+    pedacos = gerar_exportacao(tipo, formato, desde, ate)
+    if compactar:
+        pedacos = compactar_gzip(pedacos)
+    else:
+        pedacos = (pedaco.encode('utf-8') for pedaco in pedacos)
+    
+    destino = open(saida, 'wb') if saida else sys.stdout.buffer
+    try:
+        for pedaco in pedacos:
+            destino.write(pedaco)
+    finally:
+        if saida:
+            destino.close()
+
+@biblioteca.cli.command('inicializar-banco')
+def inicializar_banco_comando():
+    """Cria/atualiza o schema, o índice de busca, os dados de exemplo e os contadores"""
+    inicio = time.perf_counter()
     criar_tabelas()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    print(f"Banco inicializado em {time.perf_counter() - inicio:.2f}s")
+    if current_app.config['DATABASE_REPLICA_URL']:
+        paginas = sincronizar_replica()
+        print(f"Réplica sincronizada ({paginas} página(s) copiada(s))")
+
+@biblioteca.cli.command('sincronizar-replica')
+def sincronizar_replica_comando():
+    """Atualiza a réplica de leitura a partir do primário (para uso em cron)"""
+    if not current_app.config['DATABASE_REPLICA_URL']:
+        raise click.UsageError('DATABASE_REPLICA_URL não configurada')
+    paginas = executar_tarefa('sincronizar-replica', sincronizar_replica)
+    print(f"Réplica sincronizada ({paginas} página(s) copiada(s))")
+
+@biblioteca.cli.command('migrar')
+def migrar_comando():
+    """Atualiza o schema do banco aplicando as migrações pendentes"""
+    novas = aplicar_migracoes()
+    criar_indice_busca()
+    if novas:
+        print(f"Migrações aplicadas: {', '.join(map(str, novas))}")
+    else:
+        print("Banco já está na versão mais recente")
+
+@biblioteca.cli.command('reconstruir-indice-busca')
+def reconstruir_indice_busca_comando():
+    """Recria os índices FTS5 de livros e usuários a partir das tabelas"""
+    if criar_indice_busca(reconstruir=True):
+        print("Índices de busca reconstruídos")
+    else:
+        print("FTS5 indisponível neste banco; a busca continuará usando LIKE")
+
+@biblioteca.cli.command('verificar-estatisticas')
+def verificar_estatisticas_comando():
+    """Reconstrói os contadores do painel e mostra as divergências encontradas"""
+    armazenados = {c.nome: c.valor for c in Contador.query.all()}
+    valores = reconstruir_contadores()
+    db.session.commit()
+    
+    divergencias = 0
+    for nome in CONTADORES:
+        anterior = armazenados.get(nome)
+        situacao = 'ok' if anterior == valores[nome] else 'corrigido'
+        if situacao != 'ok':
+            divergencias += 1
+        print(f"{nome}: armazenado={anterior} recalculado={valores[nome]} ({situacao})")
+    print(f"{divergencias} contador(es) corrigido(s)")
+
+@biblioteca.cli.command('marcar-atrasados')
+def marcar_atrasados_comando():
+    """Marca os empréstimos vencidos como atrasados (para uso em cron)"""
+    marcados = executar_tarefa('marcar-atrasados', marcar_atrasados)
+    ultima = ExecucaoTarefa.query.filter_by(nome='marcar-atrasados') \
+        .order_by(ExecucaoTarefa.iniciada_em.desc()).first()
+    print(f"{marcados} empréstimo(s) marcado(s) como atrasado(s) em {ultima.duracao_ms:.0f} ms")
+
+@biblioteca.cli.command('expirar-reservas')
+def expirar_reservas_comando():
+    """Encerra as reservas não retiradas no prazo (para uso em cron)"""
+    expiradas = executar_tarefa('expirar-reservas', expirar_reservas)
+    print(f"{expiradas} reserva(s) expirada(s)")
+
+@biblioteca.cli.command('atualizar-relatorios')
+def atualizar_relatorios_comando():
+    """Renova os snapshots padrão e apaga os antigos e os pedidos travados (para uso em cron)"""
+    removidos = executar_tarefa('atualizar-relatorios', atualizar_relatorios_padrao)
+    print(f"Snapshots padrão solicitados; {removidos} relatório(s) antigo(s) removido(s)")
+
+@biblioteca.cli.command('reconstruir-relatorios')
+def reconstruir_relatorios_comando():
+    """Recalcula os agregados de relatórios a partir do histórico de empréstimos"""
+    resultado = reconstruir_agregados()
+    db.session.commit()
+    print(f"Agregados reconstruídos: {resultado['livros']} livro(s), {resultado['dias']} dia(s)")
+
+@biblioteca.cli.command('verificar-relatorios')
+def verificar_relatorios_comando():
+    """Compara os relatórios agregados com as consultas ao vivo"""
+    desde = datetime.utcnow() - timedelta(days=JANELA_RELATORIO_MENSAL)
+    comparacoes = {
+        'livros_populares': (livros_populares_ao_vivo(), livros_populares_agregados()),
+        'emprestimos_mensais': (emprestimos_mensais_ao_vivo(desde),
+                                emprestimos_mensais_agregados(desde)),
+    }
+    divergente = False
+    for nome, (ao_vivo, agregado) in comparacoes.items():
+        if ao_vivo == agregado:
+            print(f"{nome}: ok ({len(ao_vivo)} linha(s))")
+        else:
+            divergente = True
+            print(f"{nome}: DIVERGENTE\n  ao vivo:  {ao_vivo}\n  agregado: {agregado}")
+    if divergente:
+        raise SystemExit(1)
+
+app = create_app()
+
+if __name__ == '__main__':
+    # Servidor de desenvolvimento (um único processo): prepara o banco se ele
+    # ainda não está na versão do código. Com o reloader do debug, este bloco
+    # roda também no processo que só vigia os arquivos; o banco, o aquecimento
+    # e o agendador ficam com o processo que atende (WERKZEUG_RUN_MAIN)
+    depuracao = True
+    if not depuracao or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        with app.app_context():
+            if migracoes_pendentes():
+                criar_tabelas()
+            if interromper_relatorios_pendentes():
+                logger.warning("Pedidos de relatório interrompidos marcados como erro")
+            preparar_processo()
+            if app.config['AGENDADOR_ATIVO']:
+                iniciar_agendador()
+    app.run(debug=depuracao, host='0.0.0.0', port=5000)
@@ -0,0 +1,212 @@
+"""
+Índice de prefixos em memória para o autocompletar.
+
+Cada texto indexado (título, autor, ISBN, nome de usuário) vira uma entrada
+com tipo, rótulo e id. As palavras do texto, normalizadas (minúsculas, sem
+acentos), ficam, para cada tipo, num vetor ordenado paralelo ao vetor de
+referências às entradas; uma consulta faz bisect no prefixo e percorre só a
+faixa de chaves que começa com ele, nos tipos pedidos. Não há estrutura por
+caractere (trie), então o custo de memória é de uma referência de string
+(palavras repetidas são internadas) e um inteiro por palavra, mais o rótulo
+de cada entrada.
+
+A memória é limitada por `max_entradas` (o padrão comporta 1M de títulos com
+seus autores e 100k usuários): ao atingir o limite, novas entradas são
+ignoradas (e contadas em `descartadas`) até o índice ser reconstruído.
+"""
+import bisect
+import heapq
+import itertools
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+
+TAMANHO_MAXIMO_CHAVE = 32
+# 1M de títulos (título e ISBN), seus autores e 100k usuários (nome e email)
+MAX_ENTRADAS_PADRAO = 4_000_000
+INSERCOES_DIRETAS = 64
+PALAVRA = re.compile(r'\w+')
+ACENTOS = re.compile('[\u0300-\u036f]')
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos, para comparar prefixos"""
+    texto = texto or ''
+    if texto.isascii():
+        return texto.lower()
+    return ACENTOS.sub('', unicodedata.normalize('NFKD', texto)).lower()
+
+
+def palavras(texto):
+    return PALAVRA.findall(normalizar(texto))
+
+
+class IndicePrefixos:
+    """
+    Vetores ordenados de palavras -> entradas, um par de vetores por tipo,
+    consultados com bisect. Com um vetor por tipo, a janela de varredura de
+    uma busca só percorre chaves dos tipos pedidos.
+    """
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_PADRAO, max_varredura=2000):
+        self.max_entradas = max_entradas
+        self.max_varredura = max_varredura
+        self._chaves = {}
+        self._refs = {}
+        self._entradas = []
+        self._vistos = set()
+        self._lock = threading.Lock()
+        self.descartadas = 0
+        self.carregado = False
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def _nova_entrada(self, tipo, rotulo, id_):
+        """
+        Registra a entrada e devolve (ref, chaves), ou None se o índice está
+        cheio ou se é um rótulo sem id (ex.: autor) que já foi indexado
+        """
+        if len(self._entradas) >= self.max_entradas:
+            self.descartadas += 1
+            return None
+        if id_ is None:
+            identidade = (tipo, normalizar(rotulo))
+            if identidade in self._vistos:
+                return None
+            self._vistos.add(identidade)
+        self._entradas.append((tipo, rotulo, id_))
+        chaves = {sys.intern(palavra[:TAMANHO_MAXIMO_CHAVE]) for palavra in palavras(rotulo)}
+        return len(self._entradas) - 1, chaves
+
+    def _inserir(self, tipo, chave, ref):
+        chaves = self._chaves.setdefault(tipo, [])
+        refs = self._refs.setdefault(tipo, array('l'))
+        posicao = bisect.bisect_right(chaves, chave)
+        chaves.insert(posicao, chave)
+        refs.insert(posicao, ref)
+
+    def adicionar(self, tipo, rotulo, id_=None):
+        """Inclui uma entrada mantendo os vetores ordenados (uso nas rotas de cadastro)"""
+        with self._lock:
+            nova = self._nova_entrada(tipo, rotulo, id_)
+            if nova is None:
+                return
+            ref, chaves = nova
+            for chave in chaves:
+                self._inserir(tipo, chave, ref)
+
+    def adicionar_varios(self, itens):
+        """
+        Inclui várias entradas (tipo, rótulo, id) de uma vez. Poucas chaves
+        novas usam inserção ordenada; acima de INSERCOES_DIRETAS, as chaves
+        novas de cada tipo são acrescentadas e o vetor é reordenado (o Timsort
+        intercala as duas sequências já ordenadas em tempo linear).
+        """
+        with self._lock:
+            novos = {}
+            for tipo, rotulo, id_ in itens:
+                nova = self._nova_entrada(tipo, rotulo, id_)
+                if nova is not None:
+                    ref, chaves = nova
+                    novos.setdefault(tipo, []).extend((chave, ref) for chave in chaves)
+            for tipo, pares in novos.items():
+                if len(pares) <= INSERCOES_DIRETAS:
+                    for chave, ref in pares:
+                        self._inserir(tipo, chave, ref)
+                    continue
+                pares.sort()
+                if self._chaves.get(tipo):
+                    pares = list(zip(self._chaves[tipo], self._refs[tipo])) + pares
+                    pares.sort()
+                self._chaves[tipo] = [chave for chave, _ in pares]
+                self._refs[tipo] = array('l', [ref for _, ref in pares])
+
+    def limpar(self):
+        with self._lock:
+            self._chaves = {}
+            self._refs = {}
+            self._entradas = []
+            self._vistos = set()
+            self.descartadas = 0
+            self.carregado = False
+
+    def absorver(self, outro):
+        """
+        Passa a usar o conteúdo de `outro`, montado fora do lock: uma recarga
+        completa não bloqueia as buscas, que veem o índice antigo até a troca
+        """
+        with self._lock:
+            self._chaves = outro._chaves
+            self._refs = outro._refs
+            self._entradas = outro._entradas
+            self._vistos = outro._vistos
+            self.descartadas = outro.descartadas
+            self.carregado = True
+
+    def buscar(self, termo, tipos=None, limite=10, aceitar=None):
+        """
+        Entradas dos `tipos` pedidos (todos, se None) cujas palavras começam
+        com as palavras de `termo` (todas precisam casar; a última pode ser
+        parcial). Retorna dicts com tipo, rotulo e id, no máximo `limite`.
+        `aceitar`, se informado, recebe o id de cada candidata e descarta as
+        que retornarem False.
+        """
+        consulta = palavras(termo)
+        if not consulta:
+            return []
+        resultados = []
+        with self._lock:
+            tipos = [tipo for tipo in (tipos or self._chaves) if tipo in self._chaves]
+            if not tipos:
+                return []
+            # A palavra com a menor faixa de chaves (somada nos tipos pedidos)
+            # guia a varredura; as demais são conferidas no rótulo de cada
+            # candidato, numa janela menor
+            faixas = []
+            for palavra in set(consulta):
+                chave = palavra[:TAMANHO_MAXIMO_CHAVE]
+                por_tipo = []
+                for tipo in tipos:
+                    chaves = self._chaves[tipo]
+                    inicio = bisect.bisect_left(chaves, chave)
+                    fim = bisect.bisect_left(chaves, chave + '\uffff', inicio)
+                    por_tipo.append((tipo, inicio, fim))
+                faixas.append((sum(fim - inicio for _, inicio, fim in por_tipo), palavra, por_tipo))
+            faixas.sort(key=lambda faixa: faixa[:2])
+            _, _, por_tipo = faixas[0]
+            demais = [palavra for _, palavra, _ in faixas[1:]]
+            varredura = self.max_varredura // 4 if demais else self.max_varredura
+
+            # Intercala as faixas dos tipos na ordem das chaves; dict.fromkeys
+            # remove refs repetidas mantendo essa ordem
+            fatias = []
+            for tipo, inicio, fim in por_tipo:
+                fim = min(fim, inicio + varredura)
+                fatias.append(zip(self._chaves[tipo][inicio:fim], self._refs[tipo][inicio:fim]))
+            intercaladas = itertools.islice(heapq.merge(*fatias), varredura)
+            candidatos = dict.fromkeys(ref for _, ref in intercaladas)
+            for ref in candidatos:
+                tipo, rotulo, id_ = self._entradas[ref]
+                if demais:
+                    texto = ' ' + normalizar(rotulo)
+                    if not all(' ' + palavra in texto for palavra in demais):
+                        continue
+                if aceitar is not None and not aceitar(id_):
+                    continue
+                resultados.append({'tipo': tipo, 'rotulo': rotulo, 'id': id_})
+                if len(resultados) >= limite:
+                    break
+        return resultados
+
+    def metricas(self):
+        return {
+            'entradas': len(self._entradas),
+            'chaves': sum(len(chaves) for chaves in self._chaves.values()),
+            'max_entradas': self.max_entradas,
+            'descartadas': self.descartadas,
+            'carregado': self.carregado,
+        }
+
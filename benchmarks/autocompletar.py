@@ -0,0 +1,131 @@
+"""
+Benchmark do índice de prefixos usado por /api/v1/autocompletar.
+
+Monta um IndicePrefixos com o limite de entradas padrão da aplicação,
+carregado como em app.py (usuários e depois títulos, autores e ISBNs
+sintéticos), e mede o tempo de carga, a memória ocupada pelas estruturas do
+índice (sys.getsizeof) e a latência p50/p99/máx de consultas por prefixos de
+1 a 6 letras, com uma e duas palavras, em todos os tipos e só em usuários. A
+meta é p99 abaixo de 5 ms com 1M de títulos e 100k usuários, sem entradas
+descartadas.
+
+Uso:
+    python benchmarks/autocompletar.py                # 100k e 1M títulos
+    python benchmarks/autocompletar.py 50000 200000   # tamanhos personalizados (usuários = títulos / 10)
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autocompletar import IndicePrefixos  # noqa: E402
+
+PALAVRAS = [
+    'história', 'brasil', 'python', 'algoritmos', 'dados', 'programação',
+    'memórias', 'póstumas', 'sertão', 'veredas', 'cidade', 'coração',
+    'introdução', 'química', 'física', 'matemática', 'ciência', 'política',
+    'economia', 'filosofia', 'educação', 'música', 'poesia', 'contos',
+    'romance', 'guerra', 'paz', 'amor', 'tempo', 'viagem', 'mar', 'sol',
+]
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Costa', 'Souza', 'Lima', 'Pereira', 'Almeida']
+CONSULTAS = 2000
+META_P99_MS = 5.0
+
+
+NOMES = ['Ana', 'Carlos', 'Maria', 'João', 'Pedro', 'Beatriz', 'Lucas', 'Juliana']
+
+
+def gerar_entradas(total, aleatorio):
+    """
+    Nome e email de total/10 usuários e depois título, autor e ISBN por livro,
+    com um sufixo numérico para variar as palavras
+    """
+    for i in range(1, total // 10 + 1):
+        nome = f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}'
+        yield ('usuario', nome, i)
+        yield ('email', f'leitor{i}@exemplo.com', i)
+    for i in range(1, total + 1):
+        titulo = ' '.join(aleatorio.sample(PALAVRAS, aleatorio.randint(2, 5))).capitalize()
+        yield ('titulo', f'{titulo} {i % 9973}', i)
+        yield ('autor', f'Autor{i % 50000} {aleatorio.choice(SOBRENOMES)}', None)
+        yield ('isbn', f'978{i:010d}', i)
+
+
+def gerar_consultas(aleatorio):
+    consultas = []
+    for _ in range(CONSULTAS):
+        palavra = aleatorio.choice(PALAVRAS + SOBRENOMES + NOMES + ['autor12', '97800001', 'leitor12'])
+        termo = palavra[:aleatorio.randint(1, 6)]
+        if aleatorio.random() < 0.3:
+            termo = f'{aleatorio.choice(PALAVRAS)} {termo}'
+        consultas.append(termo)
+    return consultas
+
+
+def memoria_mib(indice):
+    """Vetores, entradas e strings do índice (chaves internadas contadas uma vez)"""
+    total = sum(sys.getsizeof(vetor) for vetor in indice._chaves.values())
+    total += sum(sys.getsizeof(vetor) for vetor in indice._refs.values())
+    total += sys.getsizeof(indice._entradas) + sys.getsizeof(indice._vistos)
+    total += sum(sys.getsizeof(chave) for chave in set().union(*indice._chaves.values()))
+    for entrada in indice._entradas:
+        total += sys.getsizeof(entrada) + sys.getsizeof(entrada[1])
+    return total / 2**20
+
+
+def percentil(valores, fracao):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * fracao))]
+
+
+def medir(total):
+    aleatorio = random.Random(42)
+    inicio = time.perf_counter()
+    indice = IndicePrefixos()
+    indice.adicionar_varios(gerar_entradas(total, aleatorio))
+    carga = time.perf_counter() - inicio
+    memoria = memoria_mib(indice)
+
+    tempos = []
+    for termo in gerar_consultas(aleatorio):
+        for tipos in (None, ('usuario', 'email')):
+            inicio = time.perf_counter()
+            indice.buscar(termo, tipos, limite=10)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    for i in range(100):
+        indice.adicionar('titulo', f'Título incremental {i}', total + i + 1)
+    insercao = (time.perf_counter() - inicio) * 1000 / 100
+
+    return {
+        'carga_s': carga,
+        'memoria_mib': memoria,
+        'chaves': indice.metricas()['chaves'],
+        'descartadas': indice.descartadas,
+        'p50': percentil(tempos, 0.50),
+        'p99': percentil(tempos, 0.99),
+        'max': max(tempos),
+        'insercao_ms': insercao,
+    }
+
+
+def main(tamanhos):
+    print(f"{'títulos':>10} {'chaves':>10} {'descartadas':>11} {'carga (s)':>10} {'memória (MiB)':>14} "
+          f"{'p50 (ms)':>9} {'p99 (ms)':>9} {'máx (ms)':>9} {'inserção (ms)':>14}")
+    falhou = False
+    for total in tamanhos:
+        r = medir(total)
+        print(f"{total:>10} {r['chaves']:>10} {r['descartadas']:>11} {r['carga_s']:>10.1f} {r['memoria_mib']:>14.1f} "
+              f"{r['p50']:>9.3f} {r['p99']:>9.3f} {r['max']:>9.3f} {r['insercao_ms']:>14.3f}")
+        falhou = falhou or r['p99'] > META_P99_MS or r['descartadas'] > 0
+    print(f"FALHA: p99 acima de {META_P99_MS} ms ou entradas descartadas" if falhou
+          else f"OK: p99 abaixo de {META_P99_MS} ms, sem entradas descartadas")
+    return 1 if falhou else 0
+
+
+if __name__ == '__main__':
+    argumentos = [int(valor) for valor in sys.argv[1:]]
+    sys.exit(main(argumentos or [100_000, 1_000_000]))
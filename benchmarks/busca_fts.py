@@ -0,0 +1,103 @@
+"""
+Benchmark da busca textual: LIKE '%termo%' (caminho antigo) x índice FTS5.
+
+Gera catálogos sintéticos em bancos SQLite temporários usando o mesmo DDL de
+app.py e mede o tempo médio por busca (primeira página de 10 resultados mais
+o COUNT usado pela paginação).
+
+Uso:
+    python benchmarks/busca_fts.py                 # 10k, 100k e 1M livros
+    python benchmarks/busca_fts.py 10000 50000     # tamanhos personalizados
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ddl_indice_busca, expressao_fts  # noqa: E402
+
+PALAVRAS = [
+    'história', 'brasil', 'python', 'algoritmos', 'dados', 'programação',
+    'memórias', 'póstumas', 'sertão', 'veredas', 'cidade', 'coração',
+    'introdução', 'química', 'física', 'matemática', 'ciência', 'política',
+    'economia', 'filosofia', 'educação', 'música', 'poesia', 'contos',
+    'romance', 'guerra', 'paz', 'amor', 'tempo', 'viagem', 'mar', 'sol',
+]
+AUTORES = [
+    'João Silva', 'Maria Santos', 'Pedro Oliveira', 'Ana Costa',
+    'Machado de Assis', 'Clarice Lispector', 'Jorge Amado', 'Cecília Meireles',
+]
+TERMOS = ['historia', 'memórias', 'progr', 'sertao veredas', 'Machado', 'quimica', '97812345']
+REPETICOES = 20
+
+SQL_LIKE = (
+    "SELECT id, titulo FROM livro WHERE titulo LIKE :p OR autor LIKE :p OR isbn LIKE :p "
+    "LIMIT 10"
+)
+SQL_LIKE_COUNT = (
+    "SELECT count(*) FROM livro WHERE titulo LIKE :p OR autor LIKE :p OR isbn LIKE :p"
+)
+SQL_FTS = (
+    "SELECT livro.id, livro.titulo FROM livro JOIN livro_fts ON livro_fts.rowid = livro.id "
+    "WHERE livro_fts MATCH :q ORDER BY livro_fts.rank LIMIT 10"
+)
+SQL_FTS_COUNT = "SELECT count(*) FROM livro_fts WHERE livro_fts MATCH :q"
+
+
+def gerar_banco(caminho, total):
+    """Cria a tabela livro com `total` linhas e o índice FTS5"""
+    conexao = sqlite3.connect(caminho)
+    conexao.execute(
+        "CREATE TABLE livro (id INTEGER PRIMARY KEY, titulo VARCHAR(200) NOT NULL, "
+        "autor VARCHAR(100) NOT NULL, isbn VARCHAR(20) NOT NULL UNIQUE)"
+    )
+    for comando in ddl_indice_busca('livro_fts'):
+        conexao.execute(comando)
+
+    aleatorio = random.Random(42)
+    lote = []
+    for i in range(1, total + 1):
+        titulo = ' '.join(aleatorio.sample(PALAVRAS, aleatorio.randint(2, 5))).capitalize()
+        lote.append((i, titulo, aleatorio.choice(AUTORES), f'978{i:010d}'))
+        if len(lote) == 10000:
+            conexao.executemany("INSERT INTO livro VALUES (?, ?, ?, ?)", lote)
+            lote = []
+    if lote:
+        conexao.executemany("INSERT INTO livro VALUES (?, ?, ?, ?)", lote)
+    conexao.commit()
+    return conexao
+
+
+def medir(conexao, sql_pagina, sql_count, parametros):
+    """Tempo médio (ms) de página + contagem para um termo"""
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        conexao.execute(sql_pagina, parametros).fetchall()
+        conexao.execute(sql_count, parametros).fetchone()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.mean(tempos)
+
+
+def main(tamanhos):
+    print(f"{'linhas':>10} {'termo':>16} {'LIKE (ms)':>12} {'FTS5 (ms)':>12} {'ganho':>8}")
+    for total in tamanhos:
+        with tempfile.TemporaryDirectory() as pasta:
+            inicio = time.perf_counter()
+            conexao = gerar_banco(os.path.join(pasta, 'bench.db'), total)
+            print(f"# {total} livros gerados em {time.perf_counter() - inicio:.1f}s")
+            for termo in TERMOS:
+                like = medir(conexao, SQL_LIKE, SQL_LIKE_COUNT, {'p': f'%{termo}%'})
+                fts = medir(conexao, SQL_FTS, SQL_FTS_COUNT, {'q': expressao_fts(termo)})
+                print(f"{total:>10} {termo:>16} {like:>12.2f} {fts:>12.2f} {like / fts:>7.1f}x")
+            conexao.close()
+
+
+if __name__ == '__main__':
+    argumentos = [int(valor) for valor in sys.argv[1:]]
+    main(argumentos or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,124 @@
+"""
+Benchmark de carga mista (leituras + escritas concorrentes) por perfil de banco.
+
+Para cada perfil de PERFIS_BANCO o script inicia um processo novo (o perfil
+é lido na importação de app.py) sobre um banco SQLite temporário, dispara
+threads leitoras nas páginas de listagem e threads escritoras fazendo
+empréstimo/devolução, e informa leituras/s, escritas/s e erros.
+
+Uso:
+    python benchmarks/carga_mista.py [duração_s] [leitores] [escritores]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERFIS = ['padrao', 'producao']
+PAGINAS = ['/', '/livros', '/usuarios', '/emprestimos', '/relatorios']
+
+
+def executar_perfil(duracao, leitores, escritores):
+    """Roda a carga no processo atual (perfil definido por PERFIL_BANCO)"""
+    sys.path.insert(0, RAIZ)
+    import logging
+
+    from app import Emprestimo, Livro, Usuario, app, criar_tabelas, db
+
+    logging.disable(logging.CRITICAL)
+    criar_tabelas()
+    with app.app_context():
+        db.session.add_all(
+            Livro(titulo=f'Livro {i}', autor='Autor', isbn=f'97900000{i:05d}', ano_publicacao=2020,
+                  categoria='Carga', quantidade_total=5, quantidade_disponivel=5)
+            for i in range(200)
+        )
+        db.session.add_all(Usuario(nome=f'Leitor {i}', email=f'carga{i}@x.com') for i in range(escritores))
+        db.session.commit()
+        livros = [livro.id for livro in Livro.query.filter_by(categoria='Carga')]
+        usuarios = [usuario.id for usuario in Usuario.query.filter(Usuario.email.like('carga%'))]
+
+    resultados = {'leituras': 0, 'escritas': 0, 'erros': 0}
+    trava = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def somar(chave):
+        with trava:
+            resultados[chave] += 1
+
+    def leitor():
+        cliente = app.test_client()
+        i = 0
+        while time.monotonic() < fim:
+            resposta = cliente.get(PAGINAS[i % len(PAGINAS)])
+            somar('leituras' if resposta.status_code == 200 else 'erros')
+            i += 1
+
+    def escritor(usuario_id):
+        cliente = app.test_client()
+        i = usuario_id
+        while time.monotonic() < fim:
+            livro_id = livros[i % len(livros)]
+            with cliente.session_transaction() as sessao:
+                sessao.pop('_flashes', None)
+            cliente.post('/emprestimos/novo', data={'usuario_id': usuario_id, 'livro_id': livro_id})
+            with app.app_context():
+                emprestimo = Emprestimo.query.filter_by(
+                    usuario_id=usuario_id, status='ativo').order_by(Emprestimo.id.desc()).first()
+            if emprestimo is None:
+                somar('erros')
+                continue
+            cliente.post(f'/emprestimos/{emprestimo.id}/devolver')
+            with cliente.session_transaction() as sessao:
+                flashes = sessao.get('_flashes', [])
+            somar('erros' if any(categoria == 'error' for categoria, _ in flashes) else 'escritas')
+            i += 1
+
+    threads = [threading.Thread(target=leitor) for _ in range(leitores)]
+    threads += [threading.Thread(target=escritor, args=(usuario_id,)) for usuario_id in usuarios]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'leituras_por_s': resultados['leituras'] / duracao,
+        'escritas_por_s': resultados['escritas'] / duracao,
+        'erros': resultados['erros'],
+    }
+
+
+def main(duracao, leitores, escritores):
+    print(f"{'perfil':>10} {'leituras/s':>11} {'escritas/s':>11} {'erros':>6}")
+    for perfil in PERFIS:
+        with tempfile.TemporaryDirectory() as pasta:
+            ambiente = dict(
+                os.environ,
+                PERFIL_BANCO=perfil,
+                DATABASE_URL=f"sqlite:///{os.path.join(pasta, 'carga.db')}",
+            )
+            saida = subprocess.run(
+                [sys.executable, __file__, '--perfil', str(duracao), str(leitores), str(escritores)],
+                env=ambiente, capture_output=True, text=True, check=True
+            ).stdout
+            resultado = json.loads(saida.strip().splitlines()[-1])
+            print(f"{perfil:>10} {resultado['leituras_por_s']:>11.1f} "
+                  f"{resultado['escritas_por_s']:>11.1f} {resultado['erros']:>6}")
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    filho = argumentos[:1] == ['--perfil']
+    if filho:
+        argumentos = argumentos[1:]
+    duracao = float(argumentos[0]) if argumentos else 5.0
+    leitores = int(argumentos[1]) if len(argumentos) > 1 else 8
+    escritores = int(argumentos[2]) if len(argumentos) > 2 else 4
+    if filho:
+        print(json.dumps(executar_perfil(duracao, leitores, escritores)))
+    else:
+        main(duracao, leitores, escritores)
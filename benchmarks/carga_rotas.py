@@ -0,0 +1,388 @@
+"""
+Bateria de carga de todas as rotas de app.py, com resultado em JSON.
+
+Modos:
+    cliente  test client do Flask no próprio processo; cada rota é chamada
+             `--repeticoes` vezes em sequência (mede o custo da rota sem rede)
+    http     `--threads` threads fazendo requisições a um servidor já em
+             execução (`--url`) durante `--duracao` segundos, em ordem aleatória
+
+Os ids, termos e cursores usados nas URLs são sorteados do banco de
+DATABASE_URL (no modo http, o mesmo banco do servidor). Gere os dados antes
+com benchmarks/gerar_dados.py. Para cada rota são informados requisições,
+erros (status >= 400 ou, no modo cliente, mensagem de erro após o
+redirecionamento), vazão e latência p50/p95/p99/máx em ms. Com
+`--comparar`, mostra a variação de p95 e vazão em relação a um JSON anterior
+(por exemplo, de outro commit).
+
+Uso:
+    DATABASE_URL=sqlite:////tmp/carga.db python benchmarks/carga_rotas.py --saida base.json
+    DATABASE_URL=sqlite:////tmp/carga.db python benchmarks/carga_rotas.py --comparar base.json
+    DATABASE_URL=sqlite:////tmp/carga.db python benchmarks/carga_rotas.py --modo http \\
+        --url http://localhost:5000 --threads 16 --duracao 30
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import logging  # noqa: E402
+
+from app import (Emprestimo, Livro, PedidoRelatorio, Reserva, STATUS_EM_ABERTO, Usuario, app,  # noqa: E402
+                 aplicar_migracoes, cache, calcular_estatisticas, codificar_cursor, db, listar_categorias,
+                 preparar_processo)
+
+TAMANHO_AMOSTRA = 500
+
+
+def sortear_ids(modelo, filtro=None):
+    """Ids espalhados pela tabela, sem ORDER BY random() sobre a tabela inteira"""
+    consulta = db.session.query(db.func.min(modelo.id), db.func.max(modelo.id))
+    menor, maior = consulta.one()
+    if menor is None:
+        return []
+    aleatorio = random.Random(7)
+    candidatos = sorted({aleatorio.randint(menor, maior) for _ in range(TAMANHO_AMOSTRA * 4)})
+    query = db.session.query(modelo.id).filter(modelo.id.in_(candidatos))
+    if filtro is not None:
+        query = query.filter(filtro)
+    return [id_ for (id_,) in query.limit(TAMANHO_AMOSTRA)]
+
+
+def carregar_amostra():
+    with app.app_context():
+        # Bancos gerados por uma versão anterior recebem as tabelas novas
+        aplicar_migracoes()
+        # Autocompletar e mapa de disponíveis carregados antes das medições
+        preparar_processo(em_segundo_plano=False)
+        livros = sortear_ids(Livro)
+        titulos = [titulo for (titulo,) in db.session.query(Livro.titulo)
+                   .filter(Livro.id.in_(livros[:50]))]
+        emprestimo_recente = db.session.query(Emprestimo.data_emprestimo, Emprestimo.id) \
+            .order_by(Emprestimo.data_emprestimo.desc(), Emprestimo.id.desc()) \
+            .offset(40).first()
+        usuarios = sortear_ids(Usuario)
+        nomes = [nome for (nome,) in db.session.query(Usuario.nome)
+                 .filter(Usuario.id.in_(usuarios[:50]))]
+        return {
+            'livros': livros,
+            'usuarios': usuarios,
+            'emprestimos': sortear_ids(Emprestimo),
+            'em_aberto': [id_ for (id_,) in db.session.query(Emprestimo.id)
+                          .filter(Emprestimo.status.in_(STATUS_EM_ABERTO))
+                          .order_by(Emprestimo.id.desc()).limit(TAMANHO_AMOSTRA * 4)],
+            'categorias': listar_categorias(),
+            'termos': sorted({palavra for titulo in titulos for palavra in titulo.split()[:2]}),
+            'nomes': sorted({palavra for nome in nomes for palavra in nome.split()}),
+            'cursor_emprestimo': codificar_cursor(list(emprestimo_recente)) if emprestimo_recente else '',
+            'pedido_relatorio': db.session.query(db.func.max(PedidoRelatorio.id)).scalar(),
+            'reserva': db.session.query(Reserva.id, Reserva.livro_id).order_by(Reserva.id.desc()).first(),
+            'totais': calcular_estatisticas(),
+        }
+
+
+def csv_importacao(sequencia):
+    linhas = ['titulo,autor,isbn,ano_publicacao,categoria,quantidade']
+    for i in range(10):
+        linhas.append(f'Livro Importado {sequencia}-{i},Autor Carga,'
+                      f'977{sequencia:07d}{i:03d},2020,Carga,1')
+    return '\n'.join(linhas) + '\n'
+
+
+def rotas(amostra):
+    """
+    (nome, método, função que recebe (aleatório, sequência) e devolve
+    (url, dados do formulário), só no modo cliente)
+    """
+    ontem = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def livro(a):
+        return a.choice(amostra['livros'])
+
+    def usuario(a):
+        return a.choice(amostra['usuarios'])
+
+    def termo(a):
+        return a.choice(amostra['termos'] or ['livro'])
+
+    def categoria(a):
+        return a.choice(amostra['categorias'] or [''])
+
+    def emprestimo_em_aberto(a):
+        return amostra['em_aberto'].pop() if amostra['em_aberto'] else a.choice(amostra['emprestimos'])
+
+    lista = [
+        ('index', 'GET', lambda a, n: ('/', None), False),
+        ('listar_livros', 'GET', lambda a, n: ('/livros', None), False),
+        ('listar_livros_cursor', 'GET', lambda a, n: (
+            f"/livros?apos={codificar_cursor([livro(a)])}&pagina=2", None), False),
+        ('listar_livros_categoria', 'GET', lambda a, n: (
+            '/livros?' + urllib.parse.urlencode({'categoria': categoria(a)}), None), False),
+        ('listar_livros_busca', 'GET', lambda a, n: (
+            '/livros?' + urllib.parse.urlencode({'busca': termo(a)}), None), False),
+        ('adicionar_livro_form', 'GET', lambda a, n: ('/livros/adicionar', None), False),
+        ('adicionar_livro', 'POST', lambda a, n: ('/livros/adicionar', {
+            'titulo': f'Livro de Carga {n}', 'autor': 'Autor Carga', 'isbn': f'976{n:010d}',
+            'ano': '2020', 'categoria': 'Carga', 'quantidade': '2'}), False),
+        ('importar_livros_form', 'GET', lambda a, n: ('/livros/importar', None), False),
+        ('importar_livros', 'POST', lambda a, n: ('/livros/importar', {
+            'arquivo': (io.BytesIO(csv_importacao(n).encode()), 'carga.csv')}), True),
+        ('listar_usuarios', 'GET', lambda a, n: ('/usuarios', None), False),
+        ('listar_usuarios_cursor', 'GET', lambda a, n: (
+            f"/usuarios?apos={codificar_cursor([usuario(a)])}&pagina=2", None), False),
+        ('adicionar_usuario_form', 'GET', lambda a, n: ('/usuarios/adicionar', None), False),
+        ('adicionar_usuario', 'POST', lambda a, n: ('/usuarios/adicionar', {
+            'nome': f'Usuário Carga {n}', 'email': f'carga{n}-{time.time_ns()}@rotas.exemplo',
+            'telefone': ''}), False),
+        ('listar_emprestimos', 'GET', lambda a, n: ('/emprestimos', None), False),
+        ('listar_emprestimos_cursor', 'GET', lambda a, n: (
+            f"/emprestimos?apos={amostra['cursor_emprestimo']}&pagina=2", None), False),
+        ('listar_emprestimos_atrasados', 'GET', lambda a, n: ('/emprestimos?status=atrasado', None), False),
+        ('novo_emprestimo_form', 'GET', lambda a, n: ('/emprestimos/novo', None), False),
+        ('novo_emprestimo_form_preenchido', 'GET', lambda a, n: (
+            f'/emprestimos/novo?usuario_id={usuario(a)}&livro_id={livro(a)}', None), False),
+        ('novo_emprestimo', 'POST', lambda a, n: ('/emprestimos/novo', {
+            'usuario_id': usuario(a), 'livro_id': livro(a)}), False),
+        ('emprestimos_lote_form', 'GET', lambda a, n: ('/emprestimos/lote', None), False),
+        ('listar_reservas', 'GET', lambda a, n: ('/reservas', None), False),
+        ('nova_reserva_form', 'GET', lambda a, n: ('/reservas/nova', None), False),
+        ('devolver_livro', 'POST', lambda a, n: (
+            f'/emprestimos/{emprestimo_em_aberto(a)}/devolver', {}), False),
+        ('relatorios', 'GET', lambda a, n: ('/relatorios', None), False),
+        ('pedidos_relatorio_form', 'GET', lambda a, n: ('/relatorios/pedidos', None), False),
+        ('pedidos_relatorio', 'POST', lambda a, n: ('/relatorios/pedidos', {
+            'tipo': 'usuario', 'usuario_id': usuario(a)}), False),
+        ('exportar_emprestimos', 'GET', lambda a, n: (
+            f'/exportar/emprestimos?formato=csv&desde={ontem}', None), False),
+        ('busca_avancada', 'GET', lambda a, n: (
+            '/busca?' + urllib.parse.urlencode({'q': termo(a), 'tipo': 'todos'}), None), False),
+        ('metrics', 'GET', lambda a, n: ('/metrics', None), False),
+        ('metricas_cache', 'GET', lambda a, n: ('/cache/metricas', None), False),
+        ('api_listar_livros', 'GET', lambda a, n: ('/api/v1/livros?limite=20', None), False),
+        ('api_listar_livros_filtro', 'GET', lambda a, n: (
+            '/api/v1/livros?' + urllib.parse.urlencode(
+                {'q': termo(a), 'ano_min': 2000, 'campos': 'id,titulo'}), None), False),
+        ('api_obter_livro', 'GET', lambda a, n: (f'/api/v1/livros/{livro(a)}', None), False),
+        ('api_listar_usuarios', 'GET', lambda a, n: ('/api/v1/usuarios', None), False),
+        ('api_obter_usuario', 'GET', lambda a, n: (f'/api/v1/usuarios/{usuario(a)}', None), False),
+        ('api_listar_emprestimos', 'GET', lambda a, n: ('/api/v1/emprestimos?status=atrasado', None), False),
+        ('api_obter_emprestimo', 'GET', lambda a, n: (
+            f"/api/v1/emprestimos/{a.choice(amostra['emprestimos'])}", None), False),
+        ('api_emprestar_lote', 'POST_JSON', lambda a, n: ('/api/v1/emprestimos/lote', {
+            'usuario_id': usuario(a), 'livros': [livro(a) for _ in range(5)]}), False),
+        ('api_estatisticas', 'GET', lambda a, n: ('/api/v1/estatisticas', None), False),
+        ('api_autocompletar', 'GET', lambda a, n: (
+            '/api/v1/autocompletar?' + urllib.parse.urlencode({'q': termo(a)[:3]}), None), False),
+        ('api_opcoes_usuarios', 'GET', lambda a, n: (
+            '/api/v1/emprestimos/opcoes?' + urllib.parse.urlencode(
+                {'tipo': 'usuarios', 'q': a.choice(amostra['nomes'] or ['ana'])[:3]}), None), False),
+        ('api_opcoes_livros', 'GET', lambda a, n: (
+            '/api/v1/emprestimos/opcoes?' + urllib.parse.urlencode(
+                {'tipo': 'livros', 'q': termo(a)[:3]}), None), False),
+    ]
+    pedido = amostra['pedido_relatorio']
+    if pedido:
+        lista += [
+            ('ver_pedido_relatorio', 'GET', lambda a, n: (f'/relatorios/pedidos/{pedido}', None), False),
+            ('api_situacao_relatorio', 'GET', lambda a, n: (f'/api/v1/relatorios/{pedido}', None), False),
+        ]
+    reserva = amostra['reserva']
+    if reserva:
+        lista += [
+            ('listar_reservas_livro', 'GET', lambda a, n: (f'/reservas?livro_id={reserva[1]}', None), False),
+            ('api_situacao_reserva', 'GET', lambda a, n: (f'/api/v1/reservas/{reserva[0]}', None), False),
+        ]
+    return lista
+
+
+def percentil(ordenados, fracao):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * fracao))]
+
+
+def resumir(latencias, erros, duracao):
+    """Estatísticas de uma rota; `duracao` é o tempo usado para a vazão"""
+    ordenados = sorted(latencias)
+    if not ordenados:
+        return {'requisicoes': 0, 'erros': erros}
+    return {
+        'requisicoes': len(ordenados),
+        'erros': erros,
+        'vazao_rps': round(len(ordenados) / duracao, 2) if duracao else None,
+        'media_ms': round(sum(ordenados) / len(ordenados), 3),
+        'p50_ms': round(percentil(ordenados, 0.50), 3),
+        'p95_ms': round(percentil(ordenados, 0.95), 3),
+        'p99_ms': round(percentil(ordenados, 0.99), 3),
+        'max_ms': round(ordenados[-1], 3),
+    }
+
+
+def executar_cliente(amostra, repeticoes, cache_frio):
+    cliente = app.test_client()
+    aleatorio = random.Random(1)
+    resultados = {}
+    sequencia = int(time.time()) % 10_000_000
+    for nome, metodo, montar, _ in rotas(amostra):
+        latencias, erros = [], 0
+        for _ in range(repeticoes):
+            sequencia += 1
+            url, dados = montar(aleatorio, sequencia)
+            if cache_frio:
+                cache.limpar()
+            with cliente.session_transaction() as sessao:
+                sessao.pop('_flashes', None)
+            inicio = time.perf_counter()
+            if metodo == 'GET':
+                resposta = cliente.get(url)
+            elif metodo == 'POST_JSON':
+                resposta = cliente.post(url, json=dados)
+            else:
+                resposta = cliente.post(url, data=dados, content_type=(
+                    'multipart/form-data' if 'arquivo' in dados else None))
+            resposta.get_data()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            # Falhas de formulário redirecionam com 302 e uma mensagem 'error'
+            with cliente.session_transaction() as sessao:
+                falhou = any(categoria == 'error' for categoria, _ in sessao.get('_flashes', []))
+            erros += resposta.status_code >= 400 or falhou
+        resultados[nome] = resumir(latencias, erros, sum(latencias) / 1000)
+    return resultados
+
+
+class SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def executar_http(amostra, url_base, threads, duracao):
+    abridor = urllib.request.build_opener(SemRedirecionamento)
+    # Upload multipart fica só no modo cliente
+    lista = [rota for rota in rotas(amostra) if not rota[3]]
+    trava = threading.Lock()
+    latencias = defaultdict(list)
+    erros = defaultdict(int)
+    contador = iter(range(int(time.time()) % 10_000_000, 10**12))
+    fim = time.monotonic() + duracao
+
+    def trabalhador(semente):
+        aleatorio = random.Random(semente)
+        locais = defaultdict(list)
+        falhas = defaultdict(int)
+        while time.monotonic() < fim:
+            nome, metodo, montar, _ = aleatorio.choice(lista)
+            with trava:
+                url, dados = montar(aleatorio, next(contador))
+            cabecalhos = {}
+            if metodo == 'POST_JSON':
+                corpo = json.dumps(dados).encode()
+                cabecalhos['Content-Type'] = 'application/json'
+            else:
+                corpo = urllib.parse.urlencode(dados).encode() if metodo == 'POST' else None
+            requisicao = urllib.request.Request(url_base.rstrip('/') + url, data=corpo, headers=cabecalhos)
+            inicio = time.perf_counter()
+            try:
+                with abridor.open(requisicao, timeout=30) as resposta:
+                    resposta.read()
+                    status = resposta.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError:
+                status = 599
+            locais[nome].append((time.perf_counter() - inicio) * 1000)
+            falhas[nome] += status >= 400
+        with trava:
+            for nome, valores in locais.items():
+                latencias[nome].extend(valores)
+            for nome, quantidade in falhas.items():
+                erros[nome] += quantidade
+
+    grupo = [threading.Thread(target=trabalhador, args=(i,)) for i in range(threads)]
+    for thread in grupo:
+        thread.start()
+    for thread in grupo:
+        thread.join()
+    return {nome: resumir(latencias[nome], erros[nome], duracao) for nome, *_ in lista}
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, anterior):
+    print(f"{'rota':<32} {'p95 antes':>10} {'p95 agora':>10} {'Δ p95':>8} "
+          f"{'rps antes':>10} {'rps agora':>10}")
+    for nome, dados in atual['rotas'].items():
+        antes = anterior['rotas'].get(nome)
+        if not antes or not antes.get('requisicoes') or not dados.get('requisicoes'):
+            continue
+        variacao = (dados['p95_ms'] - antes['p95_ms']) / antes['p95_ms'] * 100 if antes['p95_ms'] else 0
+        print(f"{nome:<32} {antes['p95_ms']:>10.2f} {dados['p95_ms']:>10.2f} {variacao:>+7.0f}% "
+              f"{antes['vazao_rps']:>10.1f} {dados['vazao_rps']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--modo', choices=['cliente', 'http'], default='cliente')
+    parser.add_argument('--repeticoes', type=int, default=30, help='Chamadas por rota (modo cliente)')
+    parser.add_argument('--cache', choices=['quente', 'frio'], default='quente',
+                        help='frio limpa o cache antes de cada requisição (modo cliente)')
+    parser.add_argument('--url', default='http://localhost:5000', help='Servidor (modo http)')
+    parser.add_argument('--threads', type=int, default=8, help='Threads (modo http)')
+    parser.add_argument('--duracao', type=float, default=20.0, help='Segundos (modo http)')
+    parser.add_argument('--saida', help='Arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    amostra = carregar_amostra()
+    inicio = time.perf_counter()
+    if args.modo == 'cliente':
+        por_rota = executar_cliente(amostra, args.repeticoes, args.cache == 'frio')
+    else:
+        por_rota = executar_http(amostra, args.url, args.threads, args.duracao)
+    decorrido = time.perf_counter() - inicio
+
+    requisicoes = sum(dados['requisicoes'] for dados in por_rota.values())
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.utcnow().isoformat(timespec='seconds'),
+        'modo': args.modo,
+        'parametros': {chave: valor for chave, valor in vars(args).items()
+                       if chave not in ('saida', 'comparar')},
+        'banco': amostra['totais'],
+        'total': {'requisicoes': requisicoes,
+                  'erros': sum(dados['erros'] for dados in por_rota.values()),
+                  'duracao_s': round(decorrido, 2),
+                  'vazao_rps': round(requisicoes / decorrido, 2)},
+        'rotas': por_rota,
+    }
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto + '\n')
+    elif not args.comparar:
+        print(texto)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            comparar(resultado, json.load(arquivo))
+
+
+if __name__ == '__main__':
+    main()
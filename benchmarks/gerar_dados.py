@@ -0,0 +1,221 @@
+"""
+Gerador de dados sintéticos para medições de desempenho.
+
+Cria livros, usuários e um histórico de empréstimos no banco de DATABASE_URL
+com INSERTs em lote. DATABASE_URL precisa ser informado e o banco não pode ter
+empréstimos: os empréstimos gerados usam só os livros e usuários gerados, e
+só o estoque desses livros é ajustado. A popularidade dos livros segue
+uma distribuição de Zipf (poucos títulos concentram a maior parte dos
+empréstimos) e as datas cobrem os últimos `--dias` dias. O estado final é
+coerente com as regras da aplicação: empréstimos vencidos e não devolvidos
+ficam como 'atrasado', o estoque disponível desconta os empréstimos em aberto
+e os contadores e agregados são reconstruídos.
+
+A geração é determinística para a mesma semente.
+
+Uso:
+    DATABASE_URL=sqlite:////tmp/carga.db python benchmarks/gerar_dados.py \\
+        --livros 1000000 --usuarios 100000 --emprestimos 5000000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (Emprestimo, Livro, Usuario, app, criar_tabelas, db,  # noqa: E402
+                 reconstruir_agregados, reconstruir_contadores)
+
+TAMANHO_LOTE = 10000
+
+PALAVRAS = [
+    'história', 'brasil', 'python', 'algoritmos', 'dados', 'programação',
+    'memórias', 'póstumas', 'sertão', 'veredas', 'cidade', 'coração',
+    'introdução', 'química', 'física', 'matemática', 'ciência', 'política',
+    'economia', 'filosofia', 'educação', 'música', 'poesia', 'contos',
+    'romance', 'guerra', 'paz', 'amor', 'tempo', 'viagem', 'mar', 'sol',
+]
+NOMES = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique',
+         'Isabela', 'João', 'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Costa', 'Lima', 'Pereira',
+              'Almeida', 'Ferreira', 'Rodrigues', 'Gomes', 'Martins', 'Araújo', 'Ribeiro']
+CATEGORIAS = ['Programação', 'História', 'Literatura', 'Ciências', 'Filosofia',
+              'Economia', 'Poesia', 'Educação', 'Música', 'Infantil', 'Biografia', 'Direito']
+
+
+def inserir_em_lotes(modelo, linhas, rotulo):
+    """Insere dicionários com executemany, um commit por lote"""
+    inicio = time.perf_counter()
+    lote = []
+    total = 0
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE:
+            db.session.execute(db.insert(modelo), lote)
+            db.session.commit()
+            total += len(lote)
+            lote = []
+    if lote:
+        db.session.execute(db.insert(modelo), lote)
+        db.session.commit()
+        total += len(lote)
+    decorrido = time.perf_counter() - inicio
+    print(f"{total} {rotulo} em {decorrido:.1f}s ({total / max(decorrido, 1e-9):.0f}/s)")
+
+
+def gerar_livros(quantidade, aleatorio, agora):
+    for i in range(quantidade):
+        titulo = ' '.join(aleatorio.sample(PALAVRAS, aleatorio.randint(2, 5))).capitalize()
+        yield {
+            'titulo': f'{titulo} {i}',
+            'autor': f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}',
+            'isbn': f'979{i:010d}',
+            'ano_publicacao': aleatorio.randint(1950, agora.year),
+            'categoria': aleatorio.choice(CATEGORIAS),
+            'quantidade_total': aleatorio.randint(1, 5),
+            'quantidade_disponivel': 0,  # ajustado depois dos empréstimos
+            'data_cadastro': agora - timedelta(days=aleatorio.randint(0, 3650)),
+        }
+
+
+def gerar_usuarios(quantidade, aleatorio, agora):
+    for i in range(quantidade):
+        nome = f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}'
+        yield {
+            'nome': nome,
+            'email': f'usuario{i}@carga.exemplo',
+            'telefone': f'11{aleatorio.randint(900000000, 999999999)}',
+            'data_cadastro': agora - timedelta(days=aleatorio.randint(0, 3650)),
+        }
+
+
+def gerar_emprestimos(quantidade, livro_ids, usuario_ids, aleatorio, agora, dias, zipf,
+                      em_aberto):
+    """
+    Empréstimos com livro sorteado por Zipf(`zipf`) e data uniforme no período.
+    Os que seguem em aberto são contados por livro em `em_aberto`, respeitando
+    o número de exemplares.
+    """
+    pesos = list(accumulate(1 / (posicao ** zipf) for posicao in range(1, len(livro_ids) + 1)))
+    # A ordem de popularidade é uma permutação fixa dos ids
+    por_popularidade = livro_ids[:]
+    aleatorio.shuffle(por_popularidade)
+    limite_exemplares = {}
+
+    sorteados = 0
+    while sorteados < quantidade:
+        bloco = min(TAMANHO_LOTE, quantidade - sorteados)
+        livros = aleatorio.choices(por_popularidade, cum_weights=pesos, k=bloco)
+        for livro_id in livros:
+            data_emprestimo = agora - timedelta(seconds=aleatorio.randint(0, dias * 86400))
+            prazo = aleatorio.choice((7, 14, 14, 21))
+            prevista = data_emprestimo + timedelta(days=prazo)
+            # Quase todos os empréstimos antigos foram devolvidos; os recentes, alguns
+            devolvido = aleatorio.random() < (0.97 if prevista < agora else 0.3)
+            if not devolvido:
+                limite = limite_exemplares.setdefault(livro_id, aleatorio.randint(1, 5))
+                if em_aberto[livro_id] >= limite:
+                    devolvido = True
+            if devolvido:
+                real = min(agora, data_emprestimo + timedelta(
+                    seconds=aleatorio.randint(3600, (prazo + 5) * 86400)))
+                status = 'devolvido'
+            else:
+                em_aberto[livro_id] += 1
+                real = None
+                status = 'atrasado' if prevista < agora else 'ativo'
+            yield {
+                'usuario_id': aleatorio.choice(usuario_ids),
+                'livro_id': livro_id,
+                'data_emprestimo': data_emprestimo,
+                'data_devolucao_prevista': prevista,
+                'data_devolucao_real': real,
+                'status': status,
+            }
+        sorteados += bloco
+
+
+def ajustar_estoque(em_aberto, gerados):
+    """
+    Garante total >= em aberto e desconta os empréstimos do disponível, nos
+    livros de `gerados` (condição SQL)
+    """
+    inicio = time.perf_counter()
+    db.session.execute(db.update(Livro).where(gerados).values(quantidade_disponivel=Livro.quantidade_total))
+    parametros = [{'id_livro': livro_id, 'abertos': abertos}
+                  for livro_id, abertos in em_aberto.items()]
+    for posicao in range(0, len(parametros), TAMANHO_LOTE):
+        db.session.execute(
+            db.text(
+                "UPDATE livro SET "
+                "quantidade_total = CASE WHEN quantidade_total < :abertos "
+                "THEN :abertos ELSE quantidade_total END, "
+                "quantidade_disponivel = CASE WHEN quantidade_total < :abertos "
+                "THEN 0 ELSE quantidade_total - :abertos END "
+                "WHERE id = :id_livro"
+            ),
+            parametros[posicao:posicao + TAMANHO_LOTE]
+        )
+    db.session.commit()
+    print(f"Estoque ajustado para {len(parametros)} livro(s) em {time.perf_counter() - inicio:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--livros', type=int, default=100_000)
+    parser.add_argument('--usuarios', type=int, default=10_000)
+    parser.add_argument('--emprestimos', type=int, default=500_000)
+    parser.add_argument('--dias', type=int, default=730, help='Período do histórico')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Expoente da popularidade')
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('Informe o banco de destino em DATABASE_URL (ex.: sqlite:////tmp/carga.db)')
+    logging.disable(logging.INFO)
+    criar_tabelas()
+    aleatorio = random.Random(args.semente)
+    agora = datetime.utcnow()
+    inicio = time.perf_counter()
+
+    with app.app_context():
+        if (Livro.query.filter(Livro.isbn.like('979%')).first() is not None
+                or db.session.query(Emprestimo.id).limit(1).scalar() is not None):
+            raise SystemExit('O banco já tem empréstimos ou dados gerados; use um DATABASE_URL novo')
+
+        # Só as linhas criadas aqui: ids acima dos atuais, com ISBN/email gerados
+        ultimo_livro = db.session.query(db.func.max(Livro.id)).scalar() or 0
+        ultimo_usuario = db.session.query(db.func.max(Usuario.id)).scalar() or 0
+        livros_gerados = db.and_(Livro.id > ultimo_livro, Livro.isbn.like('979%'))
+        usuarios_gerados = db.and_(Usuario.id > ultimo_usuario, Usuario.email.like('%@carga.exemplo'))
+
+        inserir_em_lotes(Livro, gerar_livros(args.livros, aleatorio, agora), 'livros')
+        inserir_em_lotes(Usuario, gerar_usuarios(args.usuarios, aleatorio, agora), 'usuários')
+        livro_ids = [id_ for (id_,) in db.session.query(Livro.id).filter(livros_gerados).order_by(Livro.id)]
+        usuario_ids = [id_ for (id_,) in
+                       db.session.query(Usuario.id).filter(usuarios_gerados).order_by(Usuario.id)]
+
+        em_aberto = Counter()
+        inserir_em_lotes(Emprestimo, gerar_emprestimos(
+            args.emprestimos, livro_ids, usuario_ids, aleatorio, agora,
+            args.dias, args.zipf, em_aberto
+        ), 'empréstimos')
+        ajustar_estoque(em_aberto, livros_gerados)
+
+        etapa = time.perf_counter()
+        reconstruir_agregados()
+        valores = reconstruir_contadores()
+        db.session.commit()
+        print(f"Agregados e contadores reconstruídos em {time.perf_counter() - etapa:.1f}s: {valores}")
+
+    print(f"Concluído em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
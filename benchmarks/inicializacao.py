@@ -0,0 +1,131 @@
+"""
+Tempo de partida de um processo da aplicação, com resultado em JSON.
+
+Cada repetição roda num processo Python novo (como um worker recém-criado
+do gunicorn) sobre o banco de DATABASE_URL e mede:
+
+    importacao_ms           `import app` (Flask, SQLAlchemy, modelos e rotas)
+    primeira_requisicao_ms  GET / no processo recém-importado
+    segunda_requisicao_ms   GET /livros logo em seguida
+    autocompletar_ms        primeira chamada a /api/v1/autocompletar
+    aquecimento_ms          da primeira requisição até o autocompletar carregado
+
+Com `--inicializar`, mede também `criar_tabelas()` (o que
+`flask inicializar-banco` faz uma vez por implantação) num processo à parte.
+São informadas a mediana e o máximo de cada medida.
+
+Uso:
+    DATABASE_URL=sqlite:////tmp/carga.db python benchmarks/inicializacao.py --repeticoes 5
+    DATABASE_URL=sqlite:////tmp/carga.db python benchmarks/inicializacao.py --inicializar --saida inicio.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIMITE_AQUECIMENTO_S = 300
+
+
+def medir_processo(termo):
+    """Roda no processo filho: importação, primeiras requisições e aquecimento"""
+    inicio = time.perf_counter()
+    sys.path.insert(0, RAIZ)
+    import app as modulo
+    medidas = {'importacao_ms': (time.perf_counter() - inicio) * 1000}
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    cliente = modulo.app.test_client()
+    primeira = time.perf_counter()
+    for nome, url in (('primeira_requisicao_ms', '/'),
+                      ('segunda_requisicao_ms', '/livros'),
+                      ('autocompletar_ms', f'/api/v1/autocompletar?q={termo}')):
+        antes = time.perf_counter()
+        resposta = cliente.get(url)
+        medidas[nome] = (time.perf_counter() - antes) * 1000
+        if resposta.status_code >= 400:
+            raise SystemExit(f"{url} respondeu {resposta.status_code}")
+
+    while not modulo.sugestoes.carregado:
+        if time.perf_counter() - primeira > LIMITE_AQUECIMENTO_S:
+            raise SystemExit("Autocompletar não carregou a tempo")
+        time.sleep(0.005)
+    medidas['aquecimento_ms'] = (time.perf_counter() - primeira) * 1000
+    return medidas
+
+
+def medir_inicializacao():
+    """Roda no processo filho: importação e criar_tabelas()"""
+    sys.path.insert(0, RAIZ)
+    import logging
+    logging.disable(logging.CRITICAL)
+    from app import criar_tabelas
+
+    inicio = time.perf_counter()
+    criar_tabelas()
+    return {'inicializar_banco_ms': (time.perf_counter() - inicio) * 1000}
+
+
+def executar_filho(*argumentos):
+    saida = subprocess.run([sys.executable, __file__, '--filho', *argumentos],
+                           capture_output=True, text=True, check=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def resumir(execucoes):
+    nomes = execucoes[0].keys()
+    return {nome: {'mediana_ms': round(statistics.median(e[nome] for e in execucoes), 2),
+                   'max_ms': round(max(e[nome] for e in execucoes), 2)}
+            for nome in nomes}
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeticoes', type=int, default=5, help='Processos medidos')
+    parser.add_argument('--termo', default='a', help='Prefixo consultado no autocompletar')
+    parser.add_argument('--inicializar', action='store_true',
+                        help='Mede também criar_tabelas() (altera o banco: contadores e relatórios)')
+    parser.add_argument('--saida', help='Arquivo JSON de saída (padrão: stdout)')
+    args = parser.parse_args()
+
+    medidas = {}
+    if args.inicializar:
+        medidas.update(resumir([executar_filho('inicializar')]))
+    medidas.update(resumir([executar_filho('processo', args.termo) for _ in range(args.repeticoes)]))
+
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.utcnow().isoformat(timespec='seconds'),
+        'banco': os.environ.get('DATABASE_URL', 'sqlite:///biblioteca.db'),
+        'repeticoes': args.repeticoes,
+        'medidas': medidas,
+    }
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto + '\n')
+    else:
+        print(texto)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--filho']:
+        if sys.argv[2] == 'inicializar':
+            print(json.dumps(medir_inicializacao()))
+        else:
+            print(json.dumps(medir_processo(sys.argv[3])))
+    else:
+        main()
@@ -0,0 +1,101 @@
+"""
+Mostra o EXPLAIN QUERY PLAN de cada consulta executada pelas rotas de leitura.
+
+Cada rota é chamada pelo test client do Flask sobre o banco configurado em
+app.py; os comandos SQL emitidos são capturados e explicados com os mesmos
+parâmetros. Passos que varrem uma tabela inteira sem índice aparecem
+marcados com '!!' (exceto varreduras já ordenadas interrompidas por LIMIT).
+
+Uso:
+    python benchmarks/plano_consultas.py
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app, codificar_cursor, criar_tabelas, db  # noqa: E402
+
+# Tabelas pequenas por construção, onde uma varredura completa é esperada
+TABELAS_PEQUENAS = ('contador', 'versao_schema', 'emprestimos_por_dia', 'sqlite_master')
+
+
+def rotas():
+    """URLs exercitadas, incluindo páginas seguintes dos cursores"""
+    cursor_id = codificar_cursor([1])
+    cursor_emprestimo = codificar_cursor([datetime.utcnow(), 1_000_000_000])
+    return [
+        '/',
+        '/livros',
+        f'/livros?apos={cursor_id}&pagina=2',
+        '/livros?categoria=Programação',
+        f'/livros?categoria=Programação&apos={cursor_id}&pagina=2',
+        '/livros?busca=python',
+        '/usuarios',
+        f'/usuarios?apos={cursor_id}&pagina=2',
+        '/emprestimos',
+        f'/emprestimos?apos={cursor_emprestimo}&pagina=2',
+        '/emprestimos?status=ativo',
+        f'/emprestimos?status=ativo&apos={cursor_emprestimo}&pagina=2',
+        '/emprestimos/novo',
+        '/relatorios',
+        '/busca?q=python&categoria=Programação&ano_min=2000&ano_max=2030',
+        '/busca?q=ana&tipo=usuarios',
+    ]
+
+
+def varredura_suspeita(detalhe, statement, plano):
+    """
+    Indica um SCAN de tabela sem índice, ignorando tabelas pequenas, subconsultas
+    e varreduras na ordem da chave primária limitadas por LIMIT
+    """
+    if not detalhe.startswith('SCAN') or 'USING' in detalhe or 'VIRTUAL TABLE' in detalhe:
+        return False
+    tabela = detalhe.split()[1]
+    if tabela in TABELAS_PEQUENAS or tabela.startswith('anon_'):
+        return False
+    ordenada = not any('TEMP B-TREE' in passo for passo in plano)
+    return not (ordenada and 'LIMIT' in statement.split())
+
+
+def main():
+    criar_tabelas()
+    capturados = []
+
+    with app.app_context():
+        engine = db.engine
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            capturados.append((statement, parameters))
+
+    cliente = app.test_client()
+    suspeitas = 0
+    for url in rotas():
+        capturados.clear()
+        event.listen(engine, 'before_cursor_execute', capturar)
+        try:
+            resposta = cliente.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', capturar)
+
+        print(f"\n=== GET {url} ({resposta.status_code}, {len(capturados)} consulta(s))")
+        with engine.connect() as conexao:
+            for statement, parameters in capturados:
+                print('\n  ' + ' '.join(statement.split()))
+                plano = [linha[3] for linha in conexao.exec_driver_sql(
+                    f'EXPLAIN QUERY PLAN {statement}', parameters
+                )]
+                for detalhe in plano:
+                    marca = '!!' if varredura_suspeita(detalhe, statement, plano) else '  '
+                    suspeitas += marca == '!!'
+                    print(f"    {marca} {detalhe}")
+
+    print(f"\n{suspeitas} passo(s) com varredura completa de tabela")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Camada de cache do sistema de biblioteca.
+
+O cache local (LRU com TTL) fica no próprio processo. Opcionalmente ele é
+combinado a um backend compartilhado entre processos: um cliente Redis
+quando o pacote `redis` está instalado e CACHE_REDIS_URL está configurado,
+ou qualquer objeto com a mesma interface mínima (get/set/delete/sadd/
+smembers), como o ClienteCacheMemoria usado localmente.
+
+Cada entrada pode ter tags; invalidar uma tag remove todas as entradas
+associadas a ela nas duas camadas. Com vários processos, o LRU local dos
+outros processos não é avisado da invalidação e expira pelo TTL.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+AUSENTE = object()
+
+
+class CacheLRU:
+    """Cache em memória com limite de itens (LRU), expiração e tags"""
+
+    def __init__(self, max_itens=1024, ttl_padrao=60):
+        self.max_itens = max_itens
+        self.ttl_padrao = ttl_padrao
+        self._itens = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.metricas = {'acertos': 0, 'falhas': 0, 'despejos': 0, 'expirados': 0, 'invalidados': 0}
+
+    def obter(self, chave):
+        """Retorna o valor guardado ou AUSENTE"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.metricas['falhas'] += 1
+                return AUSENTE
+            valor, expira_em, _ = item
+            if expira_em < time.monotonic():
+                self._remover(chave)
+                self.metricas['expirados'] += 1
+                self.metricas['falhas'] += 1
+                return AUSENTE
+            self._itens.move_to_end(chave)
+            self.metricas['acertos'] += 1
+            return valor
+
+    def guardar(self, chave, valor, ttl=None, tags=()):
+        expira_em = time.monotonic() + (self.ttl_padrao if ttl is None else ttl)
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, expira_em, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(chave)
+            while len(self._itens) > self.max_itens:
+                mais_antiga = next(iter(self._itens))
+                self._remover(mais_antiga)
+                self.metricas['despejos'] += 1
+
+    def invalidar_tags(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for chave in list(self._tags.get(tag, ())):
+                    self._remover(chave)
+                    self.metricas['invalidados'] += 1
+                self._tags.pop(tag, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def _remover(self, chave):
+        _, _, tags = self._itens.pop(chave)
+        for tag in tags:
+            chaves = self._tags.get(tag)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._tags[tag]
+
+
+class ClienteCacheMemoria:
+    """
+    Substituto local de um servidor Redis com o subconjunto de comandos usado
+    pelo CacheCompartilhado. Útil em desenvolvimento e testes.
+    """
+
+    def __init__(self):
+        self._dados = {}
+        self._conjuntos = {}
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._dados[chave]
+                return None
+            return valor
+
+    def set(self, chave, valor, ex=None):
+        with self._lock:
+            self._dados[chave] = (valor, time.monotonic() + ex if ex else None)
+
+    def delete(self, *chaves):
+        with self._lock:
+            for chave in chaves:
+                self._dados.pop(chave, None)
+                self._conjuntos.pop(chave, None)
+
+    def sadd(self, chave, *membros):
+        with self._lock:
+            self._conjuntos.setdefault(chave, set()).update(membros)
+
+    def smembers(self, chave):
+        with self._lock:
+            return set(self._conjuntos.get(chave, ()))
+
+
+class CacheCompartilhado:
+    """Cache sobre um cliente estilo Redis, com valores serializados em pickle"""
+
+    def __init__(self, cliente, prefixo='biblioteca:', ttl_padrao=60):
+        self.cliente = cliente
+        self.prefixo = prefixo
+        self.ttl_padrao = ttl_padrao
+
+    def obter(self, chave):
+        """Retorna (valor, tags) ou AUSENTE"""
+        bruto = self.cliente.get(self.prefixo + repr(chave))
+        return AUSENTE if bruto is None else pickle.loads(bruto)
+
+    def guardar(self, chave, valor, ttl=None, tags=()):
+        nome = self.prefixo + repr(chave)
+        self.cliente.set(nome, pickle.dumps((valor, tuple(tags))),
+                         ex=self.ttl_padrao if ttl is None else ttl)
+        for tag in tags:
+            self.cliente.sadd(f'{self.prefixo}tag:{tag}', nome)
+
+    def invalidar_tags(self, *tags):
+        for tag in tags:
+            nome_tag = f'{self.prefixo}tag:{tag}'
+            chaves = self.cliente.smembers(nome_tag)
+            if chaves:
+                self.cliente.delete(*chaves)
+            self.cliente.delete(nome_tag)
+
+
+class Cache:
+    """
+    Fachada usada pela aplicação: consulta primeiro o LRU local e depois o
+    backend compartilhado (se houver), preenchendo o local em caso de acerto.
+    """
+
+    def __init__(self, local, compartilhado=None):
+        self.local = local
+        self.compartilhado = compartilhado
+        self.metricas_compartilhado = {'acertos': 0, 'falhas': 0, 'erros': 0}
+
+    def obter(self, chave):
+        valor = self.local.obter(chave)
+        if valor is not AUSENTE or self.compartilhado is None:
+            return valor
+        try:
+            encontrado = self.compartilhado.obter(chave)
+        except Exception:
+            self.metricas_compartilhado['erros'] += 1
+            return AUSENTE
+        if encontrado is AUSENTE:
+            self.metricas_compartilhado['falhas'] += 1
+            return AUSENTE
+        self.metricas_compartilhado['acertos'] += 1
+        valor, tags = encontrado
+        self.local.guardar(chave, valor, tags=tags)
+        return valor
+
+    def guardar(self, chave, valor, ttl=None, tags=()):
+        self.local.guardar(chave, valor, ttl, tags)
+        if self.compartilhado is not None:
+            try:
+                self.compartilhado.guardar(chave, valor, ttl, tags)
+            except Exception:
+                self.metricas_compartilhado['erros'] += 1
+
+    def obter_ou_calcular(self, chave, calcular, ttl=None, tags=()):
+        """Retorna o valor em cache ou chama `calcular()` e guarda o resultado"""
+        valor = self.obter(chave)
+        if valor is AUSENTE:
+            valor = calcular()
+            self.guardar(chave, valor, ttl, tags)
+        return valor
+
+    def invalidar(self, *tags):
+        self.local.invalidar_tags(*tags)
+        if self.compartilhado is not None:
+            try:
+                self.compartilhado.invalidar_tags(*tags)
+            except Exception:
+                self.metricas_compartilhado['erros'] += 1
+
+    def limpar(self):
+        self.local.limpar()
+
+    def metricas(self):
+        dados = dict(self.local.metricas, itens=len(self.local), max_itens=self.local.max_itens)
+        if self.compartilhado is not None:
+            dados['compartilhado'] = dict(self.metricas_compartilhado)
+        return dados
+
+
+def criar_cache(config):
+    """Monta o cache a partir da configuração da aplicação"""
+    ttl = config.get('CACHE_TTL', 60)
+    local = CacheLRU(max_itens=config.get('CACHE_MAX_ITENS', 1024), ttl_padrao=ttl)
+
+    compartilhado = None
+    cliente = config.get('CACHE_CLIENTE_COMPARTILHADO')
+    if cliente is None and config.get('CACHE_REDIS_URL'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_REDIS_URL configurado, mas o pacote 'redis' não está instalado")
+        cliente = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+    if cliente is not None:
+        compartilhado = CacheCompartilhado(cliente, ttl_padrao=ttl)
+
+    return Cache(local, compartilhado)
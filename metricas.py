@@ -0,0 +1,152 @@
+"""
+Métricas de desempenho por endpoint, no formato de texto do Prometheus.
+
+A aplicação alimenta um `MetricasRequisicoes` ao fim de cada requisição com
+a latência, o número de consultas SQL, o tempo gasto em SQL e em templates e
+as consultas mais lentas. Os valores são acumulados em memória, por processo
+(com vários workers, cada um expõe os seus e o Prometheus soma por instância).
+"""
+import bisect
+import threading
+from collections import defaultdict
+
+# Limites (em segundos) dos buckets do histograma de latência
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONSULTAS_LENTAS_POR_ENDPOINT = 5
+TAMANHO_MAXIMO_SQL = 200
+
+
+def escapar_rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def rotulos(**valores):
+    return '{' + ','.join(f'{nome}="{escapar_rotulo(valor)}"' for nome, valor in valores.items()) + '}'
+
+
+class EstatisticasEndpoint:
+    """Acumulados de um endpoint"""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_LATENCIA)
+        self.requisicoes = 0
+        self.duracao_total = 0.0
+        self.consultas = 0
+        self.sql_total = 0.0
+        self.template_total = 0.0
+        self.por_status = defaultdict(int)
+        self.consultas_lentas = {}  # sql -> maior duração, só as N mais lentas
+
+
+class MetricasRequisicoes:
+    """Registro thread-safe das métricas por endpoint"""
+
+    def __init__(self, prefixo='biblioteca'):
+        self.prefixo = prefixo
+        self._endpoints = defaultdict(EstatisticasEndpoint)
+        self._lock = threading.Lock()
+
+    def registrar(self, endpoint, metodo, status, duracao, consultas=0,
+                  sql_total=0.0, template_total=0.0, consultas_lentas=()):
+        """Soma uma requisição; `consultas_lentas` é um iterável de (duração, sql)"""
+        with self._lock:
+            dados = self._endpoints[endpoint]
+            posicao = bisect.bisect_left(BUCKETS_LATENCIA, duracao)
+            if posicao < len(dados.buckets):
+                dados.buckets[posicao] += 1
+            dados.requisicoes += 1
+            dados.duracao_total += duracao
+            dados.consultas += consultas
+            dados.sql_total += sql_total
+            dados.template_total += template_total
+            dados.por_status[(metodo, status)] += 1
+            for duracao_sql, sql in consultas_lentas:
+                sql = ' '.join(sql.split())[:TAMANHO_MAXIMO_SQL]
+                lentas = dados.consultas_lentas
+                if duracao_sql > lentas.get(sql, 0):
+                    lentas[sql] = duracao_sql
+                    if len(lentas) > CONSULTAS_LENTAS_POR_ENDPOINT:
+                        del lentas[min(lentas, key=lentas.get)]
+
+    def limpar(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def resumo(self):
+        """Médias por endpoint, para inspeção rápida e benchmarks"""
+        with self._lock:
+            return {
+                endpoint: {
+                    'requisicoes': dados.requisicoes,
+                    'latencia_media_ms': dados.duracao_total / dados.requisicoes * 1000,
+                    'consultas_por_requisicao': dados.consultas / dados.requisicoes,
+                    'sql_medio_ms': dados.sql_total / dados.requisicoes * 1000,
+                    'template_medio_ms': dados.template_total / dados.requisicoes * 1000,
+                }
+                for endpoint, dados in self._endpoints.items() if dados.requisicoes
+            }
+
+    def exportar(self, extras=()):
+        """
+        Texto no formato de exposição do Prometheus. `extras` recebe tuplas
+        (nome, tipo, ajuda, [(rótulos, valor), ...]) com métricas de outras
+        partes da aplicação (cache, índices, tarefas).
+        """
+        p = self.prefixo
+        linhas = []
+
+        def familia(nome, tipo, ajuda):
+            linhas.append(f'# HELP {p}_{nome} {ajuda}')
+            linhas.append(f'# TYPE {p}_{nome} {tipo}')
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            familia('requisicao_duracao_segundos', 'histogram', 'Latência das requisições por endpoint')
+            for endpoint, dados in endpoints:
+                acumulado = 0
+                for limite, quantidade in zip(BUCKETS_LATENCIA, dados.buckets):
+                    acumulado += quantidade
+                    linhas.append(f'{p}_requisicao_duracao_segundos_bucket'
+                                  f'{rotulos(endpoint=endpoint, le=limite)} {acumulado}')
+                linhas.append(f'{p}_requisicao_duracao_segundos_bucket'
+                              f'{rotulos(endpoint=endpoint, le="+Inf")} {dados.requisicoes}')
+                linhas.append(f'{p}_requisicao_duracao_segundos_sum{rotulos(endpoint=endpoint)} '
+                              f'{dados.duracao_total:.6f}')
+                linhas.append(f'{p}_requisicao_duracao_segundos_count{rotulos(endpoint=endpoint)} '
+                              f'{dados.requisicoes}')
+
+            familia('requisicoes_total', 'counter', 'Requisições por endpoint, método e status')
+            for endpoint, dados in endpoints:
+                for (metodo, status), quantidade in sorted(dados.por_status.items()):
+                    linhas.append(f'{p}_requisicoes_total'
+                                  f'{rotulos(endpoint=endpoint, metodo=metodo, status=status)} {quantidade}')
+
+            familia('consultas_sql_total', 'counter', 'Consultas SQL executadas por endpoint')
+            for endpoint, dados in endpoints:
+                linhas.append(f'{p}_consultas_sql_total{rotulos(endpoint=endpoint)} {dados.consultas}')
+
+            familia('sql_duracao_segundos_total', 'counter', 'Tempo total gasto em SQL por endpoint')
+            for endpoint, dados in endpoints:
+                linhas.append(f'{p}_sql_duracao_segundos_total{rotulos(endpoint=endpoint)} '
+                              f'{dados.sql_total:.6f}')
+
+            familia('template_duracao_segundos_total', 'counter',
+                    'Tempo total de renderização de templates por endpoint')
+            for endpoint, dados in endpoints:
+                linhas.append(f'{p}_template_duracao_segundos_total{rotulos(endpoint=endpoint)} '
+                              f'{dados.template_total:.6f}')
+
+            familia('consulta_lenta_segundos', 'gauge',
+                    f'As {CONSULTAS_LENTAS_POR_ENDPOINT} consultas SQL mais lentas de cada endpoint')
+            for endpoint, dados in endpoints:
+                for sql, duracao in sorted(dados.consultas_lentas.items(), key=lambda item: -item[1]):
+                    linhas.append(f'{p}_consulta_lenta_segundos'
+                                  f'{rotulos(endpoint=endpoint, sql=sql)} {duracao:.6f}')
+
+        for nome, tipo, ajuda, amostras in extras:
+            familia(nome, tipo, ajuda)
+            for rotulos_amostra, valor in amostras:
+                linhas.append(f'{p}_{nome}{rotulos(**rotulos_amostra) if rotulos_amostra else ""} {valor}')
+
+        return '\n'.join(linhas) + '\n'
@@ -0,0 +1,141 @@
+"""
+Agendador de tarefas periódicas em segundo plano, dentro do próprio processo.
+
+Cada tarefa roda numa thread daemon que chama a função, espera o intervalo e
+repete até `parar()`. Exceções são registradas no log e não interrompem o
+ciclo. O agendador não sabe nada de banco de dados: quem registra a tarefa
+passa uma função que já abre o contexto da aplicação e grava o histórico.
+
+Para implantações com vários processos ou sem threads de fundo, as mesmas
+funções podem ser chamadas por um comando de linha (cron).
+
+`FilaTrabalhos` cobre o caso complementar: trabalhos pontuais (relatórios
+sob demanda) executados uma vez por um pool de threads de tamanho fixo.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Tarefa:
+    """Uma função executada a cada `intervalo` segundos"""
+
+    def __init__(self, nome, intervalo, funcao, atraso_inicial=0):
+        self.nome = nome
+        self.intervalo = intervalo
+        self.funcao = funcao
+        self.atraso_inicial = atraso_inicial
+        self.execucoes = 0
+        self.falhas = 0
+
+
+class AgendadorTarefas:
+    """Mantém uma thread por tarefa registrada"""
+
+    def __init__(self):
+        self.tarefas = {}
+        self._threads = []
+        self._parar = threading.Event()
+
+    @property
+    def ativo(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def registrar(self, nome, intervalo, funcao, atraso_inicial=0):
+        self.tarefas[nome] = Tarefa(nome, intervalo, funcao, atraso_inicial)
+
+    def iniciar(self):
+        if self.ativo:
+            return
+        self._parar.clear()
+        self._threads = [
+            threading.Thread(target=self._ciclo, args=(tarefa,),
+                             name=f'tarefa-{tarefa.nome}', daemon=True)
+            for tarefa in self.tarefas.values()
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Agendador iniciado com {len(self._threads)} tarefa(s)")
+
+    def parar(self, espera=5):
+        self._parar.set()
+        for thread in self._threads:
+            thread.join(espera)
+        self._threads = []
+
+    def _ciclo(self, tarefa):
+        if self._parar.wait(tarefa.atraso_inicial):
+            return
+        while True:
+            try:
+                tarefa.funcao()
+                tarefa.execucoes += 1
+            except Exception as e:
+                tarefa.falhas += 1
+                logger.error(f"Erro na tarefa {tarefa.nome}: {e}")
+            if self._parar.wait(tarefa.intervalo):
+                return
+
+    def situacao(self):
+        return {
+            nome: {'intervalo': tarefa.intervalo, 'execucoes': tarefa.execucoes,
+                   'falhas': tarefa.falhas}
+            for nome, tarefa in self.tarefas.items()
+        }
+
+
+class FilaTrabalhos:
+    """
+    Pool de threads para trabalhos pontuais. Um trabalho enviado com a mesma
+    chave de outro que ainda está na fila ou em execução é ignorado. As
+    threads são criadas no primeiro envio.
+    """
+
+    def __init__(self, max_workers=2, nome='trabalho'):
+        self.max_workers = max_workers
+        self.nome = nome
+        self.concluidos = 0
+        self.falhas = 0
+        self._executor = None
+        self._pendentes = set()
+        self._lock = threading.Lock()
+
+    def enviar(self, chave, funcao, *args):
+        """Agenda `funcao(*args)`; retorna False se a chave já está pendente"""
+        with self._lock:
+            if chave in self._pendentes:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.nome)
+            self._pendentes.add(chave)
+        self._executor.submit(self._executar, chave, funcao, args)
+        return True
+
+    def _executar(self, chave, funcao, args):
+        sucesso = False
+        try:
+            funcao(*args)
+            sucesso = True
+        except Exception as e:
+            logger.error(f"Erro no trabalho {self.nome} {chave}: {e}")
+        finally:
+            with self._lock:
+                self._pendentes.discard(chave)
+                if sucesso:
+                    self.concluidos += 1
+                else:
+                    self.falhas += 1
+
+    def parar(self, esperar=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=esperar)
+
+    def situacao(self):
+        with self._lock:
+            pendentes = len(self._pendentes)
+        return {'workers': self.max_workers, 'pendentes': pendentes,
+                'concluidos': self.concluidos, 'falhas': self.falhas}
@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, criar_tabelas, db
+
+
+@pytest.fixture
+def aplicacao(tmp_path):
+    """Aplicação isolada sobre um SQLite temporário, já preparado (com os dados de exemplo)"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'biblioteca.db'}",
+        'DIRETORIO_RELATORIOS': str(tmp_path / 'relatorios'),
+        'AGENDADOR_ATIVO': False,
+    })
+    with app.app_context():
+        criar_tabelas()
+    yield app
+    app.extensions['biblioteca']['fila_relatorios'].parar()
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def cliente(aplicacao):
+    return aplicacao.test_client()
+
+
+@contextmanager
+def contar_consultas(maximo, aplicacao):
+    """
+    Registra os comandos SQL executados nos bancos de `aplicacao` dentro do
+    bloco e falha com AssertionError se passarem de `maximo`
+    """
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement)
+
+    with aplicacao.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        yield comandos
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', registrar)
+
+    if len(comandos) > maximo:
+        detalhes = '\n'.join(comandos)
+        raise AssertionError(f"{len(comandos)} consultas executadas (máximo {maximo}):\n{detalhes}")
+
+
+@pytest.fixture
+def limite_consultas():
+    """Limita as consultas de um bloco: `with limite_consultas(3, aplicacao): ...`"""
+    return contar_consultas
@@ -0,0 +1,41 @@
+import pytest
+
+from app import Livro, create_app, criar_tabelas, db, preparar_processo, sugestoes
+
+
+def test_aplicacoes_criadas_usam_bancos_e_caches_proprios(aplicacao, tmp_path):
+    outra = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'outro.db'}"})
+    with outra.app_context():
+        criar_tabelas()
+    with aplicacao.app_context():
+        db.session.add(Livro(titulo='Só no primeiro banco', autor='A', isbn='9780000000001',
+                             ano_publicacao=2000, categoria='Teste',
+                             quantidade_total=1, quantidade_disponivel=1))
+        db.session.commit()
+
+    assert b'primeiro banco' in aplicacao.test_client().get('/livros').data
+    assert b'primeiro banco' not in outra.test_client().get('/livros').data
+    assert aplicacao.extensions['biblioteca']['cache'] is not outra.extensions['biblioteca']['cache']
+    with outra.app_context():
+        db.engine.dispose()
+
+
+def test_aquecimento_com_falha_e_refeito_na_proxima_preparacao(aplicacao, monkeypatch):
+    def falhar():
+        raise RuntimeError('banco indisponível')
+
+    with aplicacao.app_context():
+        monkeypatch.setattr('app.carregar_autocompletar', falhar)
+        preparar_processo(em_segundo_plano=False)
+        assert not aplicacao.extensions['biblioteca']['preparada']
+
+        monkeypatch.undo()
+        preparar_processo(em_segundo_plano=False)
+        assert aplicacao.extensions['biblioteca']['preparada']
+        assert sugestoes.carregado
+
+
+def test_perfil_de_banco_desconhecido_falha_ao_criar_a_aplicacao(tmp_path):
+    with pytest.raises(ValueError, match='PERFIL_BANCO desconhecido.*producao'):
+        create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'b.db'}",
+                    'PERFIL_BANCO': 'producão'})
@@ -0,0 +1,26 @@
+from autocompletar import IndicePrefixos
+
+
+def test_busca_por_tipo_nao_e_limitada_por_outros_tipos():
+    indice = IndicePrefixos(max_varredura=100)
+    indice.adicionar_varios([('titulo', f'Ana livro {i}', i) for i in range(1, 5001)])
+    indice.adicionar_varios([('usuario', 'Ana Costa', 1), ('email', 'ana@email.com', 1)])
+
+    sugestoes = indice.buscar('ana', ('usuario', 'email'), limite=5)
+
+    assert [(s['tipo'], s['id']) for s in sugestoes] == [('usuario', 1), ('email', 1)]
+
+
+def test_busca_sem_tipos_intercala_na_ordem_das_chaves():
+    indice = IndicePrefixos()
+    indice.adicionar_varios([('titulo', 'Banana', 1), ('autor', 'Bernardo', None), ('usuario', 'Bia', 7)])
+
+    assert [s['rotulo'] for s in indice.buscar('b')] == ['Banana', 'Bernardo', 'Bia']
+
+
+def test_limite_de_entradas_conta_descartadas():
+    indice = IndicePrefixos(max_entradas=2)
+    indice.adicionar_varios([('titulo', 'Um', 1), ('titulo', 'Dois', 2), ('titulo', 'Tres', 3)])
+
+    assert len(indice) == 2
+    assert indice.descartadas == 1
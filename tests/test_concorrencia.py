@@ -0,0 +1,92 @@
+import threading
+
+from app import Emprestimo, Livro, Usuario, db
+
+THREADS = 8
+TENTATIVAS_POR_THREAD = 5
+EXEMPLARES = 3
+
+
+def preparar_titulo_disputado(aplicacao):
+    """Cria o livro disputado e um usuário por thread"""
+    with aplicacao.app_context():
+        livro = Livro(titulo='Título Disputado', autor='Autor Popular', isbn='9780000000001',
+                      ano_publicacao=2024, categoria='Estresse',
+                      quantidade_total=EXEMPLARES, quantidade_disponivel=EXEMPLARES)
+        usuarios = [Usuario(nome=f'Leitor {i}', email=f'leitor{i}@estresse.com')
+                    for i in range(THREADS)]
+        db.session.add(livro)
+        db.session.add_all(usuarios)
+        db.session.commit()
+        return livro.id, [usuario.id for usuario in usuarios]
+
+
+def disputar(aplicacao, trabalho, usuarios):
+    """Roda `trabalho(cliente, usuario_id)` em uma thread por usuário, todas largando juntas"""
+    largada = threading.Barrier(len(usuarios))
+    erros = []
+
+    def executar(usuario_id):
+        cliente = aplicacao.test_client()
+        largada.wait()
+        try:
+            trabalho(cliente, usuario_id)
+        except Exception as e:
+            erros.append(e)
+
+    grupo = [threading.Thread(target=executar, args=(usuario_id,)) for usuario_id in usuarios]
+    for thread in grupo:
+        thread.start()
+    for thread in grupo:
+        thread.join()
+    assert erros == []
+
+
+def test_emprestimos_simultaneos_nao_passam_do_estoque(aplicacao):
+    livro_id, usuarios = preparar_titulo_disputado(aplicacao)
+
+    def emprestar(cliente, usuario_id):
+        for _ in range(TENTATIVAS_POR_THREAD):
+            cliente.post('/emprestimos/novo', data={'usuario_id': usuario_id, 'livro_id': livro_id})
+
+    disputar(aplicacao, emprestar, usuarios)
+
+    with aplicacao.app_context():
+        livro = db.session.get(Livro, livro_id)
+        assert livro.quantidade_disponivel == 0
+        assert Emprestimo.query.filter_by(livro_id=livro_id).count() == EXEMPLARES
+
+
+def test_emprestimos_e_devolucoes_simultaneos_mantem_estoque_consistente(aplicacao):
+    livro_id, usuarios = preparar_titulo_disputado(aplicacao)
+    parar = threading.Event()
+    leituras = []
+
+    def vigiar():
+        while not parar.is_set():
+            with aplicacao.app_context():
+                leituras.append(db.session.get(Livro, livro_id).quantidade_disponivel)
+
+    def emprestar_e_devolver(cliente, usuario_id):
+        for _ in range(TENTATIVAS_POR_THREAD):
+            cliente.post('/emprestimos/novo', data={'usuario_id': usuario_id, 'livro_id': livro_id})
+            with aplicacao.app_context():
+                ativos = [e.id for e in Emprestimo.query.filter_by(
+                    usuario_id=usuario_id, livro_id=livro_id, status='ativo')]
+            for emprestimo_id in ativos:
+                cliente.post(f'/emprestimos/{emprestimo_id}/devolver')
+
+    vigia = threading.Thread(target=vigiar)
+    vigia.start()
+    try:
+        disputar(aplicacao, emprestar_e_devolver, usuarios)
+    finally:
+        parar.set()
+        vigia.join()
+
+    with aplicacao.app_context():
+        disponivel = db.session.get(Livro, livro_id).quantidade_disponivel
+        ativos = Emprestimo.query.filter_by(livro_id=livro_id, status='ativo').count()
+    assert all(0 <= leitura <= EXEMPLARES for leitura in leituras)
+    assert disponivel >= 0
+    assert disponivel + ativos == EXEMPLARES
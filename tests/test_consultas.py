@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import Emprestimo, Livro, Usuario, db, preparar_processo
+
+# Consultas por página, qualquer que seja o volume de dados (sem N+1)
+CONSULTAS_MAXIMAS = {'/emprestimos': 3, '/usuarios': 4}
+
+
+def semear(aplicacao, quantidade):
+    """`quantidade` livros e usuários, cada usuário com um empréstimo ativo"""
+    with aplicacao.app_context():
+        livros = [Livro(titulo=f'Livro {i}', autor=f'Autor {i}', isbn=f'97811{i:08d}',
+                        ano_publicacao=2000, categoria='Teste',
+                        quantidade_total=2, quantidade_disponivel=1)
+                  for i in range(quantidade)]
+        usuarios = [Usuario(nome=f'Leitor {i}', email=f'leitor{i}@teste.com')
+                    for i in range(quantidade)]
+        db.session.add_all(livros + usuarios)
+        db.session.flush()
+        agora = datetime.utcnow()
+        db.session.add_all(
+            Emprestimo(usuario_id=usuario.id, livro_id=livro.id, data_emprestimo=agora,
+                       data_devolucao_prevista=agora + timedelta(days=14), status='ativo')
+            for livro, usuario in zip(livros, usuarios)
+        )
+        db.session.commit()
+        # A preparação do processo (schema e autocompletar) fica fora da contagem
+        preparar_processo(em_segundo_plano=False)
+
+
+@pytest.mark.parametrize('quantidade', [5, 60])
+@pytest.mark.parametrize('rota', sorted(CONSULTAS_MAXIMAS))
+def test_listagem_executa_numero_limitado_de_consultas(aplicacao, cliente, limite_consultas, rota,
+                                                      quantidade):
+    semear(aplicacao, quantidade)
+
+    with limite_consultas(CONSULTAS_MAXIMAS[rota], aplicacao):
+        resposta = cliente.get(rota)
+
+    assert resposta.status_code == 200
+    assert 'Leitor ' in resposta.get_data(as_text=True)
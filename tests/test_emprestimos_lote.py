@@ -0,0 +1,75 @@
+import pytest
+
+from app import Contador, Emprestimo, Livro, db
+
+
+@pytest.mark.parametrize('dias', ['0', '91', '100000000', 'abc'])
+def test_prazo_fora_do_limite_e_recusado_no_formulario_e_na_api(aplicacao, cliente, dias):
+    formulario = cliente.post('/emprestimos/lote', data={
+        'operacao': 'emprestar', 'usuario_id': 1, 'livros': '1 2', 'dias_emprestimo': dias})
+    api = cliente.post('/api/v1/emprestimos/lote', json={
+        'usuario_id': 1, 'livros': [1, 2], 'dias_emprestimo': dias})
+
+    assert formulario.status_code == 200
+    assert 'deve estar entre 1 e 90' in formulario.get_data(as_text=True)
+    assert api.status_code == 400
+    with aplicacao.app_context():
+        assert Emprestimo.query.count() == 0
+
+
+def test_prazo_dentro_do_limite_empresta_o_lote(aplicacao, cliente):
+    resposta = cliente.post('/emprestimos/lote', data={
+        'operacao': 'emprestar', 'usuario_id': 1, 'livros': '1 2', 'dias_emprestimo': '90'})
+
+    assert resposta.status_code == 200
+    with aplicacao.app_context():
+        assert Emprestimo.query.count() == 2
+
+
+def estado(aplicacao):
+    """Exemplares disponíveis dos livros de exemplo e o contador de empréstimos ativos"""
+    with aplicacao.app_context():
+        disponiveis = {livro.id: livro.quantidade_disponivel for livro in Livro.query}
+        return disponiveis, db.session.get(Contador, 'emprestimos_ativos').valor
+
+
+def test_lote_misto_de_emprestimos_responde_por_item(aplicacao, cliente):
+    # Livros de exemplo: 1 (3 exemplares), 2 (2; ISBN 9781234567891) e 3 (1)
+    cliente.post('/emprestimos/novo', data={'usuario_id': 2, 'livro_id': 3})
+
+    resposta = cliente.post('/api/v1/emprestimos/lote', json={
+        'usuario_id': 1, 'livros': [1, '9781234567891', 1, 3, 999, '9789999999999']})
+
+    dados = resposta.get_json()
+    assert [(item['ok'], item.get('erro')) for item in dados['resultados']] == [
+        (True, None),
+        (True, None),
+        (False, 'Livro repetido no lote'),
+        (False, 'Livro não disponível para empréstimo'),
+        (False, 'Livro não encontrado'),
+        (False, 'Livro não encontrado'),
+    ]
+    assert (dados['sucessos'], dados['falhas']) == (2, 4)
+    assert estado(aplicacao) == ({1: 2, 2: 1, 3: 0}, 3)
+    with aplicacao.app_context():
+        assert Emprestimo.query.filter_by(usuario_id=1).count() == 2
+
+
+def test_lote_misto_de_devolucoes_responde_por_item(aplicacao, cliente):
+    cliente.post('/api/v1/emprestimos/lote', json={'usuario_id': 1, 'livros': [1, 2]})
+    cliente.post('/emprestimos/novo', data={'usuario_id': 2, 'livro_id': 3})
+
+    resposta = cliente.post('/api/v1/devolucoes/lote', json={
+        'usuario_id': 1, 'livros': ['9781234567890', 3, 999, 1]})
+
+    dados = resposta.get_json()
+    assert [(item['ok'], item.get('erro')) for item in dados['resultados']] == [
+        (True, None),
+        (False, 'Nenhum empréstimo em aberto deste livro para o usuário'),
+        (False, 'Livro não encontrado'),
+        (False, 'Nenhum empréstimo em aberto deste livro para o usuário'),
+    ]
+    assert estado(aplicacao) == ({1: 3, 2: 1, 3: 0}, 2)
+    with aplicacao.app_context():
+        emprestimos = Emprestimo.query.filter_by(usuario_id=1).order_by(Emprestimo.livro_id)
+        assert [emprestimo.status for emprestimo in emprestimos] == ['devolvido', 'ativo']
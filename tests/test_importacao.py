@@ -0,0 +1,57 @@
+import io
+import json
+
+from app import Livro, RegistroInvalido, importar_livros, ler_registros_json
+
+
+def registro(i):
+    return {'titulo': f'Livro Importado {i}', 'autor': 'Autor Importado',
+            'isbn': f'978{i:010d}', 'ano': 2001, 'categoria': 'Teste'}
+
+
+def test_linha_invalida_no_json_lines_e_rejeitada_e_a_importacao_segue(aplicacao):
+    linhas = [json.dumps(registro(i)) for i in range(1, 21)]
+    linhas[5] = '{"titulo": "Quebrado", '
+    arquivo = io.StringIO('\n'.join(linhas) + '\n')
+    erros = []
+
+    with aplicacao.app_context():
+        resumo = importar_livros(ler_registros_json(arquivo), tamanho_lote=5,
+                                 ao_errar=lambda linha, mensagem: erros.append(linha))
+        importados = Livro.query.filter(Livro.autor == 'Autor Importado').count()
+
+    assert resumo['importados'] == importados == 19
+    assert resumo['rejeitados'] == 1
+    assert erros == [6]
+
+
+def test_linha_invalida_nao_faz_o_leitor_bufferizar_o_resto_do_arquivo():
+    restante = ''.join(json.dumps(registro(i)) + '\n' for i in range(1000))
+    arquivo = io.StringIO('{"titulo": \n' + restante)
+
+    posicao, objeto = next(ler_registros_json(arquivo))
+
+    assert posicao == 1 and isinstance(objeto, RegistroInvalido)
+    assert arquivo.tell() < len(restante) // 10
+
+
+def test_registro_invalido_no_array_interrompe_com_erro_posicionado(aplicacao):
+    corpo = ', '.join(json.dumps(registro(i)) for i in range(1, 4))
+    arquivo = io.StringIO(f'[{corpo}, {{"titulo": oops}}, {json.dumps(registro(9))}]')
+
+    with aplicacao.app_context():
+        resumo = importar_livros(ler_registros_json(arquivo))
+
+    assert resumo['importados'] == 3
+    assert [linha for linha, _ in resumo['erros']] == [4]
+
+
+def test_registro_do_array_sem_fim_e_limitado(monkeypatch):
+    monkeypatch.setattr('app.MAXIMO_CARACTERES_REGISTRO_JSON', 1000)
+    arquivo = io.StringIO('[{"titulo": "' + 'x' * 100_000)
+
+    registros = list(ler_registros_json(arquivo, tamanho_bloco=100))
+
+    assert [posicao for posicao, _ in registros] == [1]
+    assert isinstance(registros[0][1], RegistroInvalido)
+    assert arquivo.tell() < 2000
@@ -0,0 +1,24 @@
+from app import Livro, carregar_autocompletar, db
+
+
+def test_opcoes_encontram_livro_disponivel_alem_da_janela_do_indice(aplicacao, cliente):
+    with aplicacao.app_context():
+        livros = [Livro(titulo=f'Ana volume {i}', autor='Autor', isbn=f'97800{i:08d}',
+                        ano_publicacao=2000, categoria='Teste', quantidade_total=1,
+                        quantidade_disponivel=1 if i == 4999 else 0)
+                  for i in range(5000)]
+        db.session.add_all(livros)
+        db.session.commit()
+        disponivel = livros[4999].id
+        carregar_autocompletar()
+
+    opcoes = cliente.get('/api/v1/emprestimos/opcoes?tipo=livros&q=ana').json['opcoes']
+
+    assert [opcao['id'] for opcao in opcoes] == [disponivel]
+
+
+def test_opcoes_ignoram_ids_numericos_longos(cliente):
+    for tipo in ('usuarios', 'livros', 'acervo'):
+        resposta = cliente.get(f'/api/v1/emprestimos/opcoes?tipo={tipo}&q=99999999999999999999')
+        assert resposta.status_code == 200
+        assert resposta.json['opcoes'] == []
@@ -0,0 +1,93 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+from app import (JANELA_RELATORIO_MENSAL, RELATORIOS_PADRAO, Emprestimo, PedidoRelatorio,
+                 criar_tabelas, db, emprestimos_mensais_agregados, emprestimos_mensais_ao_vivo,
+                 livros_populares_agregados, livros_populares_ao_vivo, solicitar_relatorio)
+
+
+def test_agregados_iguais_as_consultas_ao_vivo_apos_emprestimos_e_devolucoes(aplicacao, cliente):
+    # Dados de exemplo: livros 1 (3 exemplares), 2 (2) e 3 (1); usuários 1 e 2
+    cliente.post('/emprestimos/novo', data={'usuario_id': 1, 'livro_id': 1})
+    cliente.post('/emprestimos/novo', data={'usuario_id': 2, 'livro_id': 1})
+    cliente.post('/api/v1/emprestimos/lote', json={'usuario_id': 1, 'livros': [2, 3]})
+    with aplicacao.app_context():
+        do_usuario_1 = [e.id for e in Emprestimo.query.filter_by(usuario_id=1)]
+    for emprestimo_id in do_usuario_1:
+        cliente.post(f'/emprestimos/{emprestimo_id}/devolver')
+    cliente.post('/api/v1/emprestimos/lote', json={'usuario_id': 2, 'livros': [2, '9781234567892']})
+    cliente.post('/api/v1/devolucoes/lote', json={'usuario_id': 2, 'livros': [1]})
+
+    with aplicacao.app_context():
+        assert Emprestimo.query.count() == 6
+        assert livros_populares_agregados() == livros_populares_ao_vivo()
+        assert [livro['total_emprestimos'] for livro in livros_populares_agregados()] == [2, 2, 2]
+        for desde in (datetime.utcnow() - timedelta(days=JANELA_RELATORIO_MENSAL),
+                      datetime.utcnow() - timedelta(minutes=5)):
+            assert emprestimos_mensais_agregados(desde) == emprestimos_mensais_ao_vivo(desde)
+        assert sum(mes['total'] for mes in emprestimos_mensais_ao_vivo(desde)) == 6
+
+
+def test_pedidos_simultaneos_do_mesmo_relatorio_viram_um_so(aplicacao, monkeypatch):
+    monkeypatch.setattr('app.executar_pedido_relatorio', lambda *args: None)
+    largada = threading.Barrier(8)
+    pedidos = []
+
+    def solicitar():
+        with aplicacao.app_context():
+            largada.wait()
+            pedidos.append(solicitar_relatorio('populares', RELATORIOS_PADRAO['populares']).id)
+
+    grupo = [threading.Thread(target=solicitar) for _ in range(8)]
+    for thread in grupo:
+        thread.start()
+    for thread in grupo:
+        thread.join()
+
+    assert len(pedidos) == 8 and len(set(pedidos)) == 1
+    with aplicacao.app_context():
+        assert PedidoRelatorio.query.filter_by(tipo='populares', status='pendente').count() == 1
+
+
+def test_pedido_travado_alem_do_prazo_e_substituido(aplicacao, monkeypatch):
+    monkeypatch.setattr('app.executar_pedido_relatorio', lambda *args: None)
+    with aplicacao.app_context():
+        antigo = datetime.utcnow() - timedelta(seconds=aplicacao.config['PRAZO_EXECUCAO_RELATORIO'] + 60)
+        travado = PedidoRelatorio(tipo='mensal', status='executando', criado_em=antigo, iniciado_em=antigo,
+                                  parametros=json.dumps(RELATORIOS_PADRAO['mensal'], sort_keys=True))
+        db.session.add(travado)
+        db.session.commit()
+
+        novo = solicitar_relatorio('mensal', RELATORIOS_PADRAO['mensal'])
+
+        assert novo.id != travado.id and novo.status == 'pendente'
+        db.session.refresh(travado)
+        assert travado.status == 'erro'
+        assert solicitar_relatorio('mensal', RELATORIOS_PADRAO['mensal']).id == novo.id
+
+
+def test_relatorio_com_erro_conta_como_falha_do_pool(aplicacao, monkeypatch):
+    def falhar(tipo, parametros):
+        raise RuntimeError('consulta falhou')
+
+    monkeypatch.setattr('app.linhas_relatorio', falhar)
+    fila = aplicacao.extensions['biblioteca']['fila_relatorios']
+    with aplicacao.app_context():
+        pedido_id = solicitar_relatorio('mensal', RELATORIOS_PADRAO['mensal']).id
+    fila.parar()
+
+    assert fila.situacao()['falhas'] == 1 and fila.situacao()['concluidos'] == 0
+    with aplicacao.app_context():
+        pedido = db.session.get(PedidoRelatorio, pedido_id)
+        assert pedido.status == 'erro' and pedido.erro == 'consulta falhou'
+
+
+def test_inicializar_banco_nao_encerra_pedidos_de_outros_workers(aplicacao, monkeypatch):
+    monkeypatch.setattr('app.executar_pedido_relatorio', lambda *args: None)
+    with aplicacao.app_context():
+        pedido_id = solicitar_relatorio('mensal', RELATORIOS_PADRAO['mensal']).id
+
+        criar_tabelas()
+
+        assert db.session.get(PedidoRelatorio, pedido_id).status == 'pendente'
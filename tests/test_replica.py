@@ -0,0 +1,68 @@
+import sqlite3
+import time
+
+import pytest
+
+from app import CONTADOR_REPLICA, create_app, criar_tabelas, db, sincronizar_replica
+
+
+@pytest.fixture
+def aplicacao_com_replica(tmp_path):
+    """Primário e réplica em dois arquivos SQLite; a réplica começa sincronizada"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primario.db'}",
+        'DATABASE_REPLICA_URL': f"sqlite:///{tmp_path / 'replica.db'}",
+        'DIRETORIO_RELATORIOS': str(tmp_path / 'relatorios'),
+        'AGENDADOR_ATIVO': False,
+    })
+    with app.app_context():
+        criar_tabelas()
+        sincronizar_replica()
+    yield app
+    app.extensions['biblioteca']['fila_relatorios'].parar()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def cadastrar(cliente, nome):
+    cliente.post('/usuarios/adicionar', data={'nome': nome, 'email': f'{nome.lower()}@replica.com'})
+
+
+def listados(cliente):
+    return cliente.get('/usuarios').get_data(as_text=True)
+
+
+def test_quem_escreveu_le_o_primario_e_os_demais_a_replica(aplicacao_com_replica):
+    autor, outro = aplicacao_com_replica.test_client(), aplicacao_com_replica.test_client()
+
+    cadastrar(autor, 'Recente')
+
+    assert 'Recente' in listados(autor)
+    assert 'Recente' not in listados(outro)
+    with aplicacao_com_replica.app_context():
+        sincronizar_replica()
+    assert 'Recente' in listados(outro)
+    assert aplicacao_com_replica.extensions['biblioteca']['leituras_roteadas'] == {
+        'escrita_recente': 1, 'replica': 2}
+
+
+def test_replica_atrasada_alem_do_limite_volta_ao_primario(aplicacao_com_replica, tmp_path):
+    autor, outro = aplicacao_com_replica.test_client(), aplicacao_com_replica.test_client()
+    cadastrar(autor, 'Recente')
+    atrasada = int(time.time()) - aplicacao_com_replica.config['ATRASO_MAXIMO_REPLICA'] - 5
+    with sqlite3.connect(tmp_path / 'replica.db') as conexao:
+        conexao.execute('UPDATE contador SET valor = ? WHERE nome = ?', (atrasada, CONTADOR_REPLICA))
+    aplicacao_com_replica.extensions['biblioteca']['marcador_replica']['lido_em'] = float('-inf')
+
+    assert 'Recente' in listados(outro)
+    assert aplicacao_com_replica.extensions['biblioteca']['leituras_roteadas'] == {'atrasada': 1}
+
+
+def test_cada_aplicacao_tem_seu_proprio_estado_de_replica(aplicacao_com_replica, aplicacao):
+    listados(aplicacao_com_replica.test_client())
+
+    assert aplicacao_com_replica.extensions['biblioteca']['leituras_roteadas'] == {'replica': 1}
+    assert aplicacao.extensions['biblioteca']['leituras_roteadas'] == {}
+    assert aplicacao.extensions['biblioteca']['marcador_replica']['valor'] is None
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import Emprestimo, Livro, Reserva, Usuario, db, posicoes_na_fila, registrar_reserva
+
+
+def preparar_livro_emprestado(aplicacao, cliente, leitores):
+    """Livro de um exemplar, emprestado ao primeiro de `leitores` + 1 usuários novos"""
+    with aplicacao.app_context():
+        livro = Livro(titulo='Único Exemplar', autor='Autor', isbn='9780000000001',
+                      ano_publicacao=2024, categoria='Teste',
+                      quantidade_total=1, quantidade_disponivel=1)
+        usuarios = [Usuario(nome=f'Leitor {i}', email=f'leitor{i}@reserva.com')
+                    for i in range(leitores + 1)]
+        db.session.add(livro)
+        db.session.add_all(usuarios)
+        db.session.commit()
+        livro_id, usuario_ids = livro.id, [usuario.id for usuario in usuarios]
+    cliente.post('/emprestimos/novo', data={'usuario_id': usuario_ids[0], 'livro_id': livro_id})
+    with aplicacao.app_context():
+        emprestimo_id = Emprestimo.query.filter_by(livro_id=livro_id).one().id
+    return livro_id, emprestimo_id, usuario_ids[1:]
+
+
+def em_paralelo(*funcoes):
+    largada = threading.Barrier(len(funcoes))
+
+    def executar(funcao):
+        largada.wait()
+        funcao()
+
+    grupo = [threading.Thread(target=executar, args=(funcao,)) for funcao in funcoes]
+    for thread in grupo:
+        thread.start()
+    for thread in grupo:
+        thread.join()
+
+
+def test_reserva_de_livro_com_exemplar_e_recusada(cliente):
+    resposta = cliente.post('/api/v1/reservas', json={'usuario_id': 1, 'livro_id': 1})
+
+    assert resposta.status_code == 400
+    assert 'faça o empréstimo' in resposta.json['erro']
+
+
+def test_reservas_simultaneas_do_mesmo_usuario_viram_uma_so(aplicacao, cliente):
+    livro_id, _, (usuario_id, *_) = preparar_livro_emprestado(aplicacao, cliente, 1)
+    respostas = []
+
+    def reservar():
+        respostas.append(aplicacao.test_client().post(
+            '/api/v1/reservas', json={'usuario_id': usuario_id, 'livro_id': livro_id}).status_code)
+
+    em_paralelo(*[reservar] * 6)
+
+    assert sorted(respostas) == [201] + [400] * 5
+    with aplicacao.app_context():
+        assert Reserva.query.filter_by(usuario_id=usuario_id, livro_id=livro_id).count() == 1
+        db.session.add(Reserva(usuario_id=usuario_id, livro_id=livro_id, senha=99))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+
+
+def test_exemplar_devolvido_durante_as_reservas_nao_fica_na_estante(aplicacao, cliente):
+    livro_id, emprestimo_id, leitores = preparar_livro_emprestado(aplicacao, cliente, 6)
+
+    def reservar(usuario_id):
+        return lambda: aplicacao.test_client().post(
+            '/api/v1/reservas', json={'usuario_id': usuario_id, 'livro_id': livro_id})
+
+    def devolver():
+        aplicacao.test_client().post(f'/emprestimos/{emprestimo_id}/devolver')
+
+    em_paralelo(devolver, *[reservar(usuario_id) for usuario_id in leitores])
+
+    with aplicacao.app_context():
+        disponiveis = db.session.get(Livro, livro_id).quantidade_disponivel
+        aguardando = Reserva.query.filter_by(livro_id=livro_id, status='aguardando').count()
+        separadas = Reserva.query.filter_by(livro_id=livro_id, status='disponivel').count()
+    assert disponiveis == 0 or aguardando == 0
+    assert disponiveis + separadas == 1
+
+
+def test_exemplar_livre_ao_registrar_reserva_e_separado_para_a_fila(aplicacao, monkeypatch):
+    # Simula um banco em que a conferência do estoque não viu a devolução
+    monkeypatch.setattr('app.validar_reserva', lambda usuario_id, livro_id: None)
+    with aplicacao.app_context():
+        reserva, erro = registrar_reserva(1, 3)
+
+        assert erro is None
+        assert reserva.status == 'disponivel' and reserva.expira_em is not None
+        assert db.session.get(Livro, 3).quantidade_disponivel == 0
+
+
+def test_posicoes_da_pagina_descontam_desistencias_numa_so_consulta(aplicacao, cliente, limite_consultas):
+    livro_id, emprestimo_id, leitores = preparar_livro_emprestado(aplicacao, cliente, 8)
+    reservas = [
+        cliente.post('/api/v1/reservas', json={'usuario_id': usuario_id, 'livro_id': livro_id}).json['id']
+        for usuario_id in leitores
+    ]
+    for reserva_id in (reservas[2], reservas[5]):
+        cliente.post(f'/api/v1/reservas/{reserva_id}/cancelar')
+    cliente.post(f'/emprestimos/{emprestimo_id}/devolver')
+
+    with aplicacao.app_context():
+        pagina = Reserva.query.filter_by(livro_id=livro_id).order_by(Reserva.senha).all()
+        with limite_consultas(1, aplicacao):
+            posicoes = posicoes_na_fila(pagina)
+
+    # Senha 1 recebeu o exemplar; 3 e 6 desistiram
+    assert [posicoes[reserva_id] for reserva_id in reservas if reserva_id in posicoes] == [
+        (1, 5), (2, 5), (3, 5), (4, 5), (5, 5)]
+    assert set(posicoes) == set(reservas) - {reservas[0], reservas[2], reservas[5]}